@@ -1,9 +1,89 @@
 import pandas as pd
 import os
+from embeddings import ALMACEN_VECTORES, DIM_INDICE, FACTOR_CANDIDATOS
+from paginacion_sql import SQL_TIMEOUT_S
 
 # CONFIGURA AQUÍ TU ARCHIVO
 ARCHIVO_EXCEL = "file_4.xlsx"
 TABLA_DESTINO = "documentos_dj"
+DIMENSION = 768
+
+def sql_vectores(tabla, almacen=ALMACEN_VECTORES, dim_indice=DIM_INDICE, factor=FACTOR_CANDIDATOS):
+    """
+    Columna, índice HNSW y `match_documentos` según el almacenamiento:
+    - almacen "vector" (float32) o "halfvec" (float16, la mitad de tabla e índice).
+      Las consultas envían el vector con las cifras que guarda la columna (embeddings.serializar_vector).
+    - dim_indice < 768: el índice es sobre el prefijo Matryoshka (subvector) y los candidatos
+      (match_count x factor_candidatos) se re-ordenan con el vector completo.
+    """
+    reducido = dim_indice < DIMENSION
+    ops = f"{almacen}_cosine_ops"
+    columna = f"embedding {almacen}({DIMENSION}),"
+    if reducido:
+        expr = lambda v: f"(subvector({v}, 1, {dim_indice})::{almacen}({dim_indice}))"
+        indice = f"create index {tabla}_embedding_idx on {tabla} using hnsw ({expr('embedding')} {ops});"
+    else:
+        expr = lambda v: v
+        indice = f"create index {tabla}_embedding_idx on {tabla} using hnsw (embedding {ops});"
+
+    if not reducido:
+        q = "query_embedding" if almacen == "vector" else f"query_embedding::{almacen}({DIMENSION})"
+        funcion = f"""
+    create or replace function match_documentos (
+      query_embedding vector({DIMENSION}),
+      match_threshold float,
+      match_count int
+    )
+    returns table (id bigint, content text, metadata jsonb, similarity float)
+    language plpgsql
+    as $$
+    begin
+      return query
+      select d.id, d.content, d.metadata, (1 - (d.embedding <=> {q}))::float as similarity
+      from {tabla} d
+      where 1 - (d.embedding <=> {q}) > match_threshold
+      order by d.embedding <=> {q}
+      limit match_count;
+    end;
+    $$;"""
+    else:
+        funcion = f"""
+    -- Dos etapas: vecinos aproximados con el índice ({almacen}, {dim_indice} dims) y re-orden con los {DIMENSION}
+    create or replace function match_documentos (
+      query_embedding vector({DIMENSION}),
+      match_threshold float,
+      match_count int,
+      factor_candidatos int default {factor}
+    )
+    returns table (id bigint, content text, metadata jsonb, similarity float)
+    language plpgsql
+    as $$
+    declare
+      q {almacen}({DIMENSION}) := query_embedding::{almacen}({DIMENSION});
+    begin
+      -- HNSW no devuelve más de ef_search filas (40 por defecto)
+      perform set_config('hnsw.ef_search', least(1000, greatest(40, match_count * factor_candidatos))::text, true);
+      return query
+      with candidatos as (
+        select d.id, d.content, d.metadata, d.embedding
+        from {tabla} d
+        order by {expr('d.embedding')} <=> {expr('q')}
+        limit match_count * factor_candidatos
+      )
+      select c.id, c.content, c.metadata, (1 - (c.embedding <=> q))::float as similarity
+      from candidatos c
+      where 1 - (c.embedding <=> q) > match_threshold
+      order by c.embedding <=> q
+      limit match_count;
+    end;
+    $$;"""
+
+    migracion = f"""
+    -- Migrar una tabla existente sin borrarla (re-crea el índice):
+    -- drop index if exists {tabla}_embedding_idx;
+    -- alter table {tabla} alter column embedding type {almacen}({DIMENSION}) using embedding::{almacen}({DIMENSION});
+    -- {indice}"""
+    return {"columna": columna, "indice": indice, "funcion": funcion, "migracion": migracion}
 
 def analizar_excel():
     if not os.path.exists(ARCHIVO_EXCEL):
@@ -26,6 +106,8 @@ def analizar_excel():
         print(f"   - '{orig}'  ->  se guardará como: '{limpia}'")
 
     # Generar SQL
+    vec = sql_vectores(TABLA_DESTINO)
+    print(f"\n🧮 Vectores: {ALMACEN_VECTORES}({DIMENSION}), índice sobre {min(DIM_INDICE, DIMENSION)} dims")
     sql = f"""
     -- CÓDIGO SQL GENERADO AUTOMÁTICAMENTE
     -- Cópialo y pégalo en Supabase SQL Editor si deseas resetear la tabla
@@ -37,11 +119,46 @@ def analizar_excel():
         id bigserial primary key,      -- ID Autoincremental de Supabase
         content text,                  -- Texto para la IA
         metadata jsonb,                -- AQUÍ van todas tus columnas del Excel
-        embedding vector(768)          -- Vector para búsquedas
+        {vec["columna"]:<30} -- Vector para búsquedas
+        content_hash text              -- Huella de la fila (sincronización incremental)
     );
     
-    create index on {TABLA_DESTINO} using hnsw (embedding vector_cosine_ops);
+    {vec["indice"]}
+    create index on {TABLA_DESTINO} (content_hash);
+    {vec["migracion"]}
+
+    -- Búsqueda vectorial (la usa consultas.py). Se borra antes por si cambió la firma.
+    drop function if exists match_documentos(vector, float, int);
+    drop function if exists match_documentos(vector, float, int, int);
+    {vec["funcion"]}
+    
+    -- Si la tabla ya existe y no quieres borrarla, basta con:
+    -- alter table {TABLA_DESTINO} add column if not exists content_hash text;
+    -- create index if not exists {TABLA_DESTINO}_content_hash_idx on {TABLA_DESTINO} (content_hash);
     grant all on table {TABLA_DESTINO} to anon, authenticated, service_role;
+    
+    -- Resumen precalculado (conteos por estado x año x cliente) que llena ingesta.py
+    create table if not exists resumen_dj (
+        id int primary key,
+        datos jsonb,
+        actualizado timestamptz default now()
+    );
+    grant all on table resumen_dj to anon, authenticated, service_role;
+
+    -- Tope de tiempo solo para el SQL que escribe el modelo (consultas.py ya lo pagina con LIMIT).
+    -- PostgREST (v12+) aplica el "set" de la función como `set local` al abrir la transacción de
+    -- cada llamada a /rpc/query_exec: no alcanza a la ingesta ni a los borrados o cargas de índice.
+    -- Los dos "alter role" deshacen el tope que versiones anteriores ponían a los roles (8s es el de Supabase).
+    alter role service_role reset statement_timeout;
+    alter role authenticated set statement_timeout = '8s';
+    do $$ begin
+      if to_regprocedure('query_exec(text)') is not null then
+        alter function query_exec(text) set statement_timeout = '{int(SQL_TIMEOUT_S * 1000)}ms';
+      else
+        raise notice 'Crea query_exec(text) y vuelve a correr este bloque para ponerle el tope de tiempo';
+      end if;
+    end $$;
+    notify pgrst, 'reload config';
     """
 
     # Guardar en TXT
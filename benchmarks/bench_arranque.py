@@ -0,0 +1,92 @@
+"""
+Benchmark de arranque (sin red externa): cuánto tarda `import consultas` / `import consultas_async`
+en un proceso nuevo y cuánto hasta tener el esquema listo (primera consulta), con una Supabase
+simulada por un servidor HTTP local que responde cada petición tras --latencia-db segundos
+(o que no responde nunca con --caida, para ver el arranque con la DB inalcanzable).
+También mide el costo de "re-ejecutar" el import en el mismo proceso (lo que paga cada rerun de
+Streamlit; con st.cache_resource el precalentamiento no se repite).
+
+Uso: python -m benchmarks.bench_arranque --latencia-db 0.3 --repeticiones 5
+     python -m benchmarks.bench_arranque --caida --timeout 20
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SCRIPT = """
+import json, sys, time
+t0 = time.perf_counter()
+import {modulo}
+import consultas
+t1 = time.perf_counter()
+inicio = time.perf_counter()
+for _ in range(1000):
+    import consultas
+    from consultas import chatear_stream
+t2 = time.perf_counter()
+print(json.dumps({{"import_s": t1 - t0, "rerun_us": (t2 - inicio) * 1000}}), flush=True)
+columnas = consultas.columnas_codigo()
+print(json.dumps({{"esquema_s": time.perf_counter() - t0, "columnas": columnas}}), flush=True)
+"""
+
+def servidor_lento(latencia, caida):
+    """PostgREST de mentira: una fila con metadata tras `latencia` s (o nunca, si `caida`)."""
+    class Manejador(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(3600 if caida else latencia)
+            cuerpo = json.dumps([{"metadata": {"codigo de oferta": "OF-1", "cliente": "X", "id_excel": 1}}]).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+        def log_message(self, *args): pass
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), Manejador)
+    srv.daemon_threads = True
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
+
+def medir(modulo, url, timeout):
+    env = dict(os.environ, SUPABASE_URL=url, SUPABASE_SERVICE_ROLE_KEY="bench.bench.bench", GEMINI_API_KEY="bench")
+    """Tiempos del proceso; los que no llegaron antes de `timeout` quedan en None."""
+    res = {"import_s": None, "rerun_us": None, "esquema_s": None, "columnas": []}
+    try:
+        salida = subprocess.run([sys.executable, "-c", SCRIPT.format(modulo=modulo)], env=env, capture_output=True,
+                                timeout=timeout)
+        stdout, stderr, colgado = salida.stdout, salida.stderr, False
+    except subprocess.TimeoutExpired as e:
+        stdout, stderr, colgado = e.stdout or b"", e.stderr or b"", True
+    for linea in stdout.decode("utf-8", "replace").splitlines():
+        if linea.startswith("{"): res.update(json.loads(linea))
+    if res["esquema_s"] is None and not colgado: raise RuntimeError(stderr.decode("utf-8", "replace")[-2000:])
+    return res
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latencia-db", type=float, default=0.3, help="Segundos por petición a la Supabase simulada")
+    parser.add_argument("--caida", action="store_true", help="La DB no responde nunca")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=30.0, help="Tope por proceso (segundos)")
+    args = parser.parse_args()
+
+    srv = servidor_lento(args.latencia_db, args.caida)
+    url = f"http://127.0.0.1:{srv.server_address[1]}"
+    print(f"📊 Supabase simulada en {url} ({'caída' if args.caida else f'{args.latencia_db}s por petición'})")
+    print(f"{'módulo':<16}{'import s':>10}{'esquema s':>11}{'rerun µs':>10}  columnas código")
+    for modulo in ("consultas", "consultas_async"):
+        res = [medir(modulo, url, args.timeout) for _ in range(args.repeticiones)]
+        def mediana(k, fmt):
+            if any(r[k] is None for r in res): return f"> {args.timeout:.0f}"   # Colgado esperando a la DB
+            return format(statistics.median(r[k] for r in res), fmt)
+        print(f"{modulo:<16}{mediana('import_s', '.3f'):>10}{mediana('esquema_s', '.3f'):>11}"
+              f"{mediana('rerun_us', '.2f'):>10}  {res[-1]['columnas']}")
+    srv.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Prueba de carga con LLM simulado: N conversaciones simultáneas en un solo proceso,
+`asyncio.to_thread(chatear)` (versión original del bot) vs `await achatear`.
+No usa red: la llamada a Gemini se reemplaza por un sleep de `--latencia` segundos.
+
+Uso: python -m benchmarks.bench_async --usuarios 300 --latencia 0.5
+"""
+import argparse
+import asyncio
+import os
+import time
+
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:9")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "bench.bench.bench")
+
+import consultas
+import consultas_async
+import planificador
+
+PREGUNTA = "¿qué opinas de la luna?"   # Sin palabras clave ni confianza local: router IA + respuesta general = 2 llamadas
+
+class RespuestaFalsa:
+    text = "GENERAL"
+
+class ModelosFalsos:
+    def __init__(self, latencia): self.latencia = latencia
+    def generate_content(self, **kwargs):
+        time.sleep(self.latencia)
+        return RespuestaFalsa()
+
+class ClienteFalso:
+    def __init__(self, latencia): self.models = ModelosFalsos(latencia)
+
+async def carga(nombre, tarea, usuarios):
+    inicio = time.perf_counter()
+    latencias = await asyncio.gather(*(tarea() for _ in range(usuarios)))
+    total = time.perf_counter() - inicio
+    latencias.sort()
+    print(f"{nombre:<22} {usuarios} usuarios en {total:6.2f}s | "
+          f"p50={latencias[len(latencias) // 2]:.2f}s  max={latencias[-1]:.2f}s")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--usuarios", type=int, default=300)
+    parser.add_argument("--latencia", type=float, default=0.5)
+    args = parser.parse_args()
+
+    consultas.client = ClienteFalso(args.latencia)
+    # Sin cuota: se mide la concurrencia del proceso, no el límite de peticiones por minuto
+    planificador._planificador = planificador.Planificador(rpm_defecto=1e9)
+
+    async def generar_falso(model, prompt, config=None):
+        await asyncio.sleep(args.latencia)
+        return "GENERAL"
+    consultas_async.generar = generar_falso
+
+    async def con_hilos():
+        t0 = time.perf_counter()
+        await asyncio.to_thread(consultas.chatear, PREGUNTA, [], "Bench")
+        return time.perf_counter() - t0
+
+    async def con_async():
+        t0 = time.perf_counter()
+        await consultas_async.achatear(PREGUNTA, [], "Bench")
+        return time.perf_counter() - t0
+
+    async def todo():
+        await carga("to_thread(chatear)", con_hilos, args.usuarios)
+        await carga("await achatear", con_async, args.usuarios)
+
+    asyncio.run(todo())
+
+if __name__ == "__main__":
+    main()
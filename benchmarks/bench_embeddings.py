@@ -0,0 +1,41 @@
+"""
+Benchmark offline del pipeline de embeddings (sin red): compara el modo
+"una fila por llamada + sleep(0.1)" contra lotes concurrentes con token bucket.
+
+Uso: python -m benchmarks.bench_embeddings --filas 2000 --latencia 0.05
+"""
+import argparse
+import time
+from embeddings import EmbedderFalso, TokenBucket, embeber_concurrente, normalize_matrix
+
+def modo_por_fila(textos, embedder):
+    inicio = time.perf_counter()
+    for t in textos:
+        time.sleep(0.1)
+        normalize_matrix(embedder([t]))
+    return time.perf_counter() - inicio
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filas", type=int, default=2000)
+    parser.add_argument("--latencia", type=float, default=0.05, help="Latencia simulada por llamada (s)")
+    parser.add_argument("--tam-lote", type=int, default=100)
+    parser.add_argument("--en-vuelo", type=int, default=4)
+    parser.add_argument("--rps", type=float, default=10)
+    parser.add_argument("--muestra-por-fila", type=int, default=50, help="Filas a medir en el modo original")
+    args = parser.parse_args()
+
+    textos = [f"id_excel: {i}. codigo de oferta: OF-24-{i:05d}. estado de oferta: PENDIENTE" for i in range(args.filas)]
+
+    # Modo original: se mide una muestra y se extrapola (si no, tarda demasiado)
+    muestra = textos[:args.muestra_por_fila]
+    seg = modo_por_fila(muestra, EmbedderFalso(latencia=args.latencia))
+    print(f"📉 Por fila:   {len(muestra) / seg:8.1f} filas/s  (estimado {args.filas * seg / len(muestra):.1f}s para {args.filas})")
+
+    embedder = EmbedderFalso(latencia=args.latencia)
+    _, stats = embeber_concurrente(textos, embedder, tam_lote=args.tam_lote,
+                                   max_en_vuelo=args.en_vuelo, limitador=TokenBucket(args.rps))
+    print(f"📈 Por lotes:  {stats.filas_por_seg:8.1f} filas/s  ({stats})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Benchmark offline del empaquetado de evidencia: tokens de prompt del formato original
+(json.dumps de metadata + content por documento; json.dumps del resultado SQL completo)
+contra evidencia.empaquetar_docs / empaquetar_filas, sobre filas de una planilla.
+El costo usa --precio-mtok (USD por millón de tokens de entrada) y la latencia un modelo
+lineal de prefill (--ms-ktoken por cada 1000 tokens): en producción se mide con el span "llm".
+
+Uso: python -m benchmarks.bench_evidencia --filas 2000
+     python -m benchmarks.bench_evidencia --planilla file_4.xlsx --precio-mtok 0.30 --ms-ktoken 40
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import numpy as np
+from evidencia import empaquetar_docs, empaquetar_filas, estimar_tokens
+from indice_local import IndiceVectorial
+from lector_planillas import iterar_filas
+from benchmarks.bench_offline import generar_planilla, CORPUS
+from benchmarks.falsos import vector_simulado
+
+MODELO = "models/gemini-3-flash-preview"
+
+def evidencia_original(docs):
+    evidencia = ""
+    for d in docs:
+        evidencia += f"--- DOC ({d.get('source_type')}) ---\nMeta: {json.dumps(d.get('metadata', {}), ensure_ascii=False)}\nTexto: {d.get('content')}\n"
+    return evidencia
+
+def casos_rag(filas, preguntas, k):
+    """Top-k vectorial de cada pregunta, como los que arma recuperar_hibrido."""
+    indice = IndiceVectorial()
+    indice.agregar([{"id": i, "content": c, "metadata": m, "embedding": vector_simulado(c)} for i, (c, m) in enumerate(filas)])
+    for q in preguntas:
+        docs = indice.buscar(vector_simulado(q), match_threshold=-1.0, match_count=k)
+        for d in docs: d["source_type"] = "VECTOR"
+        yield docs
+
+def casos_sql(filas, tamanos, rng):
+    """Resultados de query_exec: columnas elegidas (como el SQL del modelo) o la metadata completa."""
+    for n in tamanos:
+        muestra = [m for _, m in rng.sample(filas, min(n, len(filas)))]
+        yield f"{n} filas x 3 cols", [{"codigo": m.get("codigo de oferta"), "cliente": m.get("cliente"),
+                                       "estado": m.get("estado de oferta")} for m in muestra]
+        yield f"{n} filas x metadata", muestra
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filas", type=int, default=2000)
+    parser.add_argument("--planilla", help="Planilla real (por defecto, una sintética)")
+    parser.add_argument("--k", type=int, nargs="+", default=[5, 10], help="Documentos por pregunta RAG")
+    parser.add_argument("--sql", type=int, nargs="+", default=[1, 10, 50, 300], help="Tamaños de resultado SQL")
+    parser.add_argument("--precio-mtok", type=float, default=0.30)
+    parser.add_argument("--ms-ktoken", type=float, default=40.0)
+    parser.add_argument("--semilla", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.semilla)
+    ruta = args.planilla or generar_planilla(os.path.join(tempfile.mkdtemp(), "planilla.xlsx"), args.filas, args.semilla)
+    filas = [(c, m) for _, c, m in iterar_filas(ruta)]
+    with open(CORPUS, encoding="utf-8") as f:
+        preguntas = [json.loads(l)["q"] for l in f if l.strip()]
+
+    def linea(nombre, antes, despues):
+        ahorro = 1 - despues / antes if antes else 0.0
+        costo = (antes - despues) * 1000 / 1e6 * args.precio_mtok
+        ms = (antes - despues) * args.ms_ktoken / 1000
+        print(f"{nombre:<24}{antes:>9.0f}{despues:>9.0f}{ahorro:>9.0%}{ms:>10.1f}{costo:>12.4f}")
+
+    print(f"📊 {len(filas)} filas, {len(preguntas)} preguntas | modelo {MODELO}")
+    print(f"{'caso':<24}{'tok antes':>9}{'después':>9}{'ahorro':>9}{'-ms/q':>10}{'USD/1k q':>12}")
+    for k in args.k:
+        antes, despues = [], []
+        for docs in casos_rag(filas, preguntas, k):
+            antes.append(estimar_tokens(evidencia_original(docs)))
+            despues.append(empaquetar_docs(docs, MODELO)[1]["tokens"])
+        linea(f"RAG top-{k} (media)", np.mean(antes), np.mean(despues))
+    for nombre, res in casos_sql(filas, args.sql, rng):
+        linea(f"SQL {nombre}", estimar_tokens(json.dumps(res, ensure_ascii=False)), empaquetar_filas(res, MODELO)[1]["tokens"])
+
+if __name__ == "__main__":
+    main()
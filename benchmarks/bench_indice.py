@@ -0,0 +1,112 @@
+"""
+Benchmark del índice vectorial local (float32 e int8) contra búsqueda exacta por fuerza bruta.
+Mide recall@k y latencia por consulta sobre un corpus sintético con clusters (o un snapshot real),
+la RAM de cada índice (arreglos fuera de mmap) y el RSS del proceso (anónimo y de archivos mapeados,
+Linux) de un índice aproximado antes y después de guardarlo.
+
+Uso: python -m benchmarks.bench_indice --docs 30000 --consultas 200
+     python -m benchmarks.bench_indice --snapshot .cache/indice_documentos
+"""
+import argparse
+import tempfile
+import time
+import os
+import numpy as np
+from indice_local import IndiceVectorial
+
+def corpus_sintetico(n, d, clusters=200, semilla=0):
+    rng = np.random.default_rng(semilla)
+    centros = rng.standard_normal((clusters, d)).astype(np.float32)
+    asignacion = rng.integers(0, clusters, n)
+    return centros[asignacion] + 0.6 * rng.standard_normal((n, d)).astype(np.float32)
+
+def fuerza_bruta(matriz, q, k):
+    m = matriz / np.linalg.norm(matriz, axis=1, keepdims=True)
+    sims = m.astype(np.float64) @ (q / np.linalg.norm(q))
+    return set(np.argsort(-sims)[:k].tolist())
+
+def rss_mb():
+    """(RssAnon, RssFile) del proceso en MB, de /proc/self/status (None fuera de Linux)."""
+    try:
+        with open("/proc/self/status") as f:
+            campos = dict(l.split(":", 1) for l in f if l.startswith("Rss"))
+        return int(campos["RssAnon"].split()[0]) / 1024, int(campos["RssFile"].split()[0]) / 1024
+    except (OSError, KeyError): return None
+
+def ram_mb(indice):
+    """Lo que el índice tiene en RAM: los arreglos que no están mapeados desde el snapshot."""
+    d = indice.datos
+    return sum(a.nbytes for a in (d.ids, d.matriz, d.escalas, d.completa)
+               if a is not None and not isinstance(a, np.memmap)) / 1e6
+
+def medir_rss(base, consultas, k):
+    """RSS de un índice int8 + prefijo de 256 dims con re-orden: recién construido, guardado y cargado."""
+    filas = [{"id": i, "content": "", "metadata": {}, "embedding": v} for i, v in enumerate(base)]
+    inicio = rss_mb()
+    if inicio is None: return
+    idx = IndiceVectorial(cuantizar=True, dim=min(256, base.shape[1] - 1))
+    idx.agregar(filas)
+    del filas
+    fases = [("construido", rss_mb(), ram_mb(idx))]
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta = os.path.join(tmp, "indice")
+        idx.guardar(ruta)
+        for q in consultas: idx.buscar(q, match_threshold=-1.0, match_count=k)
+        fases.append(("guardado", rss_mb(), ram_mb(idx)))
+        del idx
+        mapeado = IndiceVectorial.cargar(ruta, mmap=True)
+        for q in consultas: mapeado.buscar(q, match_threshold=-1.0, match_count=k)
+        fases.append(("cargado (mmap)", rss_mb(), ram_mb(mapeado)))
+        del mapeado
+    print(f"🧠 RSS del índice int8+256 dims sobre la línea base (MB): anónimo / archivos mapeados | RAM del índice")
+    for nombre, (anon, archivo), ram in fases:
+        print(f"   {nombre:<16} {anon - inicio[0]:>8.1f} / {archivo - inicio[1]:>6.1f} | {ram:.1f}MB")
+
+def medir(nombre, indice, base, consultas, k):
+    aciertos, tiempos = 0, []
+    for q in consultas:
+        t0 = time.perf_counter()
+        res = indice.buscar(q, match_threshold=-1.0, match_count=k)
+        tiempos.append(time.perf_counter() - t0)
+        aciertos += len({r["id"] for r in res} & fuerza_bruta(base, q, k))
+    tiempos = np.array(tiempos) * 1000
+    print(f"{nombre:<16} recall@{k}={aciertos / (k * len(consultas)):.3f}  "
+          f"p50={np.percentile(tiempos, 50):.2f}ms  p95={np.percentile(tiempos, 95):.2f}ms  "
+          f"ram={ram_mb(indice):.1f}MB")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=30000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--consultas", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--snapshot", help="Snapshot real generado por consultas.obtener_indice_local()")
+    args = parser.parse_args()
+
+    if args.snapshot:
+        real = IndiceVectorial.cargar(args.snapshot, mmap=False)
+        if real.completa is not None: base = np.asarray(real.completa, dtype=np.float32)
+        else: base = real.matriz.astype(np.float32) * (real.escalas[:, None] / 127 if real.cuantizar else 1)
+    else:
+        base = corpus_sintetico(args.docs, args.dim)
+    filas = [{"id": i, "content": "", "metadata": {}, "embedding": v} for i, v in enumerate(base)]
+    rng = np.random.default_rng(1)
+    consultas = base[rng.integers(0, len(base), args.consultas)] + 0.3 * rng.standard_normal((args.consultas, base.shape[1])).astype(np.float32)
+
+    print(f"📊 {len(base)} docs x {base.shape[1]} dims, {args.consultas} consultas")
+    for cuantizar in (False, True):
+        idx = IndiceVectorial(cuantizar=cuantizar)
+        idx.agregar(filas)
+        medir("int8" if cuantizar else "float32", idx, base, consultas, args.k)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta = os.path.join(tmp, "indice")
+        idx.guardar(ruta)
+        t0 = time.perf_counter()
+        mapeado = IndiceVectorial.cargar(ruta, mmap=True)
+        print(f"💾 Carga de snapshot mmap: {(time.perf_counter() - t0) * 1000:.1f}ms")
+        medir("int8 (mmap)", mapeado, base, consultas, args.k)
+    medir_rss(base, consultas, args.k)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Benchmark offline de memoria de la ingesta (sin red): pico de memoria (tracemalloc) y filas/s
+de la lectura original (pd.read_excel + iterrows + lista completa) contra la lectura en streaming
+(openpyxl read_only por bloques -> pipeline con colas acotadas), para planillas de distinto tamaño.
+En streaming el pico debería quedar casi igual aunque el archivo crezca.
+
+Uso: python -m benchmarks.bench_lectura --filas 5000 20000 --hojas 2
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:9")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "bench.bench.bench")
+
+from openpyxl import Workbook
+import ingesta
+from embeddings import EmbedderFalso, embeber_concurrente, pipeline_streaming
+from lector_planillas import iterar_filas
+from benchmarks.bench_offline import CLIENTES, ESTADOS, SERVICIOS
+
+def generar_libro(ruta, filas, hojas):
+    """Libro con `hojas` hojas de `filas` filas cada una (escritura write_only: no ocupa memoria)."""
+    libro = Workbook(write_only=True)
+    for h in range(hojas):
+        hoja = libro.create_sheet(f"Hoja{h + 1}")
+        hoja.append(["ID", "CODIGO DE OFERTA", "CLIENTE", "ESTADO  DE OFERTA", "DESCRIPCION", "MONTO"])
+        for i in range(1, filas + 1):
+            hoja.append([i, f"OF-{17 + i % 8}-{i:05d}", CLIENTES[i % len(CLIENTES)], ESTADOS[i % len(ESTADOS)],
+                         f"{SERVICIOS[i % len(SERVICIOS)]} en planta {i % 9 + 1}", round(5000 + i * 13.7, 2)])
+    libro.save(ruta)
+    return ruta
+
+def medir(fn):
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    n = fn()
+    segundos = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return n, segundos, pico / 2**20
+
+def modo_original(ruta, embedder):
+    """Como `procesar_excel_concurrente`: DataFrame completo, iterrows y todos los vectores en memoria."""
+    df = ingesta.leer_archivo(ruta)
+    filas = list(ingesta.construir_filas(df))
+    vectores, _ = embeber_concurrente([c for _, c, _ in filas], embedder)
+    registros = [{"content": c, "metadata": m, "embedding": v.tolist()} for (_, c, m), v in zip(filas, vectores)]
+    return len(registros)
+
+def modo_streaming(ruta, embedder):
+    registros = ({"content": c, "metadata": m} for _, c, m in iterar_filas(ruta))
+    return pipeline_streaming(registros, embedder, lambda lote: None).insertadas
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filas", type=int, nargs="+", default=[5000, 20000], help="Filas por hoja (una corrida por valor)")
+    parser.add_argument("--hojas", type=int, default=1)
+    parser.add_argument("--dimension", type=int, default=768)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="ragia_lectura_")
+    for filas in args.filas:
+        ruta = generar_libro(os.path.join(tmp, f"planilla_{filas}.xlsx"), filas, args.hojas)
+        print(f"\n📄 {filas} filas x {args.hojas} hoja(s) ({os.path.getsize(ruta) / 2**20:.1f} MB)")
+        for nombre, modo in [("original", modo_original), ("streaming", modo_streaming)]:
+            if nombre == "original" and args.hojas > 1: print("   (el modo original solo lee la primera hoja)")
+            n, seg, pico = medir(lambda: modo(ruta, EmbedderFalso(dimension=args.dimension, latencia=0.0)))
+            print(f"   {nombre:10s} {n:7d} filas en {seg:6.2f}s ({n / seg:8.1f} filas/s) | pico {pico:8.1f} MB")
+
+if __name__ == "__main__":
+    main()
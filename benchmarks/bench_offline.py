@@ -0,0 +1,239 @@
+"""
+Suite offline de rendimiento (sin red): ingesta de planillas + repetición de un corpus de
+preguntas contra `consultas.chatear` (o `achatear`), con Gemini y Supabase simulados
+(benchmarks/falsos.py). Reporta throughput, latencia de cola y llamadas a APIs por ruta.
+Con `--base` compara contra un resultado anterior y sale con código 1 si hay regresión (CI).
+
+Uso:
+  python -m benchmarks.bench_offline --usuarios 8 --latencia 0.05 --tasa-429 0.02 --json resultado.json
+  python -m benchmarks.bench_offline --planillas file_4.xlsx --preguntas mis_preguntas.jsonl --base resultado.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+# Todo el estado en disco (cachés, trazas, planes SQL...) va a un directorio temporal: corridas reproducibles
+TMP = tempfile.mkdtemp(prefix="ragia_bench_")
+for var, archivo in [("EMBED_CACHE_PATH", "embeddings.sqlite"), ("VERSION_DATOS_PATH", "version_datos"),
+                     ("PLANES_SQL_PATH", "planes_sql.json"), ("RESUMEN_PATH", "resumen.json"),
+                     ("ROUTER_LOG_PATH", "rutas_router.jsonl"), ("TRAZAS_PATH", "trazas.jsonl"),
+                     ("INGESTA_BITACORA_PATH", "ingesta_bitacora.sqlite"), ("INGESTA_FALLIDOS_PATH", "ingesta_fallidos.jsonl"),
+                     ("INDICE_SNAPSHOT", "indice_documentos"), ("SQL_CURSORES_PATH", "cursores_sql.sqlite")]:
+    os.environ[var] = os.path.join(TMP, archivo)
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:9")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "bench.bench.bench")
+
+import pandas as pd
+import consultas
+import consultas_async
+import ingesta
+import planificador
+import trazas
+from evidencia import CHARS_POR_TOKEN
+from benchmarks.falsos import GenaiFalso, SupabaseFalso
+
+CORPUS = os.path.join(os.path.dirname(__file__), "corpus", "preguntas.jsonl")
+CLIENTES = ["Minera Sur", "Antamina", "Southern Peru", "Cerro Verde", "Volcan", "Minsur", "Chinalco", "Las Bambas"]
+ESTADOS = ["PENDIENTE", "ADJUDICADO", "NO ADJUDICADO"]
+SERVICIOS = ["mantenimiento de fajas transportadoras", "chancado primario", "montaje electromecánico",
+             "suministro de bombas", "ingeniería de detalle", "reparación de molinos", "obras civiles"]
+
+def generar_planilla(ruta, filas, semilla=0):
+    """Planilla sintética con las columnas del Excel real (id, código, cliente, estado, descripción, monto)."""
+    rng = random.Random(semilla)
+    datos = [{
+        "ID": i,
+        "CODIGO DE OFERTA": f"OF-{rng.randint(17, 24)}-{i:04d}",
+        "CLIENTE": rng.choice(CLIENTES),
+        "ESTADO DE OFERTA": rng.choice(ESTADOS),
+        "DESCRIPCION": f"{rng.choice(SERVICIOS)} en planta {rng.randint(1, 9)}",
+        "MONTO": round(rng.uniform(5_000, 900_000), 2),
+    } for i in range(1, filas + 1)]
+    pd.DataFrame(datos).to_excel(ruta, index=False)
+    return ruta
+
+def instalar_falsos(args):
+    genai_f = GenaiFalso(latencia=args.latencia, jitter=args.jitter, tasa_429=args.tasa_429, semilla=args.semilla,
+                         latencia_ktoken=args.latencia_ktoken)
+    db = SupabaseFalso(latencia=args.latencia_db)
+    consultas.client = ingesta.client = genai_f
+    consultas.supabase = ingesta.supabase = db
+    consultas.RESUMEN.supabase = db
+    consultas_async._supabase_async = db.asincrono()
+    planificador.BACKOFF_BASE_S = args.backoff
+    planificador._planificador = planificador.Planificador(rpm_defecto=args.rpm or 1e9)
+    return genai_f, db
+
+def percentiles(valores):
+    orden = sorted(valores)
+    return {f"p{int(q * 100)}_ms": round(trazas.cuantil(orden, q) * 1000, 1) for q in trazas.CUANTILES}
+
+# --- 1. INGESTA ---
+def correr_ingesta(planillas, args, genai_f, db):
+    antes = dict(genai_f.llamadas)
+    inicio = time.perf_counter()
+    if args.ingesta == "streaming": ingesta.procesar_archivos_streaming(planillas)
+    else:
+        for ruta in planillas:
+            if args.ingesta == "fila": ingesta.procesar_excel_universal(ruta)
+            else: ingesta.procesar_excel_concurrente(ruta)
+    segundos = time.perf_counter() - inicio
+    filas = db.con.execute("select count(*) from documentos_dj").fetchone()[0]
+    consultas.ESQUEMA.invalidar()
+    return {
+        "filas": filas,
+        "segundos": round(segundos, 3),
+        "filas_por_seg": round(filas / segundos, 1) if segundos else 0.0,
+        "llamadas_embed": genai_f.llamadas["embed"] - antes.get("embed", 0),
+        "inserts": db.llamadas["documentos_dj.insert"],
+    }
+
+# --- 2. PREGUNTAS ---
+def cargar_corpus(ruta, repeticiones):
+    with open(ruta, encoding="utf-8") as f:
+        preguntas = [json.loads(l) for l in f if l.strip()]
+    return preguntas * repeticiones
+
+def correr_preguntas(preguntas, args):
+    latencias = []
+
+    def una(p):
+        t0 = time.perf_counter()
+        consultas.chatear(p["q"], p.get("historial", []), "Bench")
+        latencias.append(time.perf_counter() - t0)
+
+    async def una_async(p, sem):
+        async with sem:
+            t0 = time.perf_counter()
+            await consultas_async.achatear(p["q"], p.get("historial", []), "Bench")
+            latencias.append(time.perf_counter() - t0)
+
+    async def todas_async():
+        sem = asyncio.Semaphore(args.usuarios)
+        await asyncio.gather(*(una_async(p, sem) for p in preguntas))
+
+    inicio = time.perf_counter()
+    if args.modo == "async":
+        asyncio.run(todas_async())
+    else:
+        with ThreadPoolExecutor(max_workers=args.usuarios) as pool: list(pool.map(una, preguntas))
+    segundos = time.perf_counter() - inicio
+    return {"preguntas": len(preguntas), "segundos": round(segundos, 3),
+            "preguntas_por_seg": round(len(preguntas) / segundos, 2), **percentiles(latencias)}
+
+def resumen_por_ruta():
+    """Latencias y llamadas por ruta, leídas de las trazas JSONL que deja `trazas`."""
+    por_ruta = defaultdict(lambda: {"latencias": [], "llm": 0, "embed": 0, "db": 0, "429": 0, "tokens": 0})
+    with open(trazas.RUTA_TRAZAS, encoding="utf-8") as f:
+        for linea in f:
+            t = json.loads(linea)
+            r = por_ruta[t.get("ruta", "?")]
+            r["latencias"].append(t["total_ms"] / 1000)
+            for s in t["spans"]:
+                if s["nombre"] == "llm":
+                    r["llm"] += s.get("intentos", 1)
+                    r["tokens"] += s.get("prompt_chars", 0) / CHARS_POR_TOKEN
+                elif s["nombre"] == "embedding" and not s.get("cache"): r["embed"] += 1
+                elif s["nombre"].startswith("db."): r["db"] += 1
+                elif s["nombre"] == "espera_429": r["429"] += 1
+    salida = {}
+    for ruta, r in sorted(por_ruta.items()):
+        n = len(r["latencias"])
+        salida[ruta] = {"n": n, **percentiles(r["latencias"]),
+                        **{f"{k}_por_pregunta": round(r[k] / n, 2) for k in ("llm", "embed", "db", "429", "tokens")}}
+    return salida
+
+# --- 3. COMPARACIÓN (CI) ---
+def regresiones(actual, base, tolerancia):
+    """Métricas peores que la base en más de `tolerancia` (latencias y llamadas por ruta, throughput)."""
+    problemas = []
+
+    def peor(nombre, nuevo, viejo, mayor_es_peor=True):
+        if viejo is None or nuevo is None: return
+        limite = viejo * (1 + tolerancia) if mayor_es_peor else viejo * (1 - tolerancia)
+        if (nuevo > limite + 1e-9) if mayor_es_peor else (nuevo < limite - 1e-9):
+            problemas.append(f"{nombre}: {viejo} -> {nuevo}")
+
+    peor("preguntas/s", actual["preguntas"]["preguntas_por_seg"], base["preguntas"]["preguntas_por_seg"], mayor_es_peor=False)
+    peor("p95 global (ms)", actual["preguntas"]["p95_ms"], base["preguntas"]["p95_ms"])
+    if "ingesta" in base and "ingesta" in actual:
+        peor("ingesta filas/s", actual["ingesta"]["filas_por_seg"], base["ingesta"]["filas_por_seg"], mayor_es_peor=False)
+    for ruta, r in actual["rutas"].items():
+        b = base["rutas"].get(ruta)
+        if not b: continue
+        peor(f"{ruta} p95 (ms)", r["p95_ms"], b["p95_ms"])
+        for k in ("llm_por_pregunta", "embed_por_pregunta", "db_por_pregunta", "tokens_por_pregunta"):
+            peor(f"{ruta} {k}", r.get(k), b.get(k))
+    return problemas
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--preguntas", default=CORPUS, help="JSONL con {'q': ..., 'historial': [...]} por línea")
+    parser.add_argument("--planillas", nargs="*", help="Excel/CSV a ingerir (por defecto, una sintética)")
+    parser.add_argument("--filas", type=int, default=500, help="Filas de la planilla sintética")
+    parser.add_argument("--ingesta", choices=["streaming", "lotes", "fila"], default="streaming")
+    parser.add_argument("--modo", choices=["sync", "async"], default="sync")
+    parser.add_argument("--sql-modo", choices=["plantilla", "clasico"], default=consultas.SQL_MODO,
+                        help="Ruta SQL: 1 llamada con plantilla y respuesta local, o SQL + narración")
+    parser.add_argument("--usuarios", type=int, default=8, help="Preguntas simultáneas")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--latencia", type=float, default=0.05, help="Latencia por llamada a Gemini (s)")
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--latencia-ktoken", type=float, default=0.0, help="Latencia extra por 1000 tokens de prompt (s)")
+    parser.add_argument("--latencia-db", type=float, default=0.005)
+    parser.add_argument("--tasa-429", type=float, default=0.0)
+    parser.add_argument("--backoff", type=float, default=0.2, help="Backoff base tras un 429 (el real es 2 s)")
+    parser.add_argument("--rpm", type=float, default=0, help="Cuota por modelo de texto (0 = sin cuota; embeddings a EMBED_RPS*60)")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--json", help="Guarda el resultado aquí")
+    parser.add_argument("--base", help="Resultado anterior para detectar regresiones")
+    parser.add_argument("--tolerancia", type=float, default=0.25)
+    args = parser.parse_args()
+
+    genai_f, db = instalar_falsos(args)
+    consultas.SQL_MODO = args.sql_modo
+    planillas = args.planillas or [generar_planilla(os.path.join(TMP, "ofertas.xlsx"), args.filas, args.semilla)]
+
+    resultado = {"config": {k: v for k, v in vars(args).items() if k not in ("json", "base")}}
+    resultado["ingesta"] = correr_ingesta(planillas, args, genai_f, db)
+    resultado["preguntas"] = correr_preguntas(cargar_corpus(args.preguntas, args.repeticiones), args)
+    resultado["rutas"] = resumen_por_ruta()
+    resultado["llamadas"] = {"gemini": dict(genai_f.llamadas), "supabase": dict(db.llamadas)}
+
+    print("\n" + "=" * 78)
+    i = resultado["ingesta"]
+    print(f"📥 Ingesta: {i['filas']} filas en {i['segundos']}s ({i['filas_por_seg']} filas/s) | "
+          f"{i['llamadas_embed']} llamadas de embedding | {i['inserts']} inserts")
+    p = resultado["preguntas"]
+    print(f"💬 Preguntas ({args.modo}, {args.usuarios} usuarios): {p['preguntas']} en {p['segundos']}s "
+          f"({p['preguntas_por_seg']}/s) | p50={p['p50_ms']}ms p95={p['p95_ms']}ms p99={p['p99_ms']}ms")
+    print(f"\n{'ruta':<10}{'n':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'llm/q':>8}{'emb/q':>8}{'db/q':>8}{'429/q':>8}{'tok/q':>8}")
+    for ruta, r in resultado["rutas"].items():
+        print(f"{ruta:<10}{r['n']:>5}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}"
+              f"{r['llm_por_pregunta']:>8}{r['embed_por_pregunta']:>8}{r['db_por_pregunta']:>8}{r['429_por_pregunta']:>8}{r['tokens_por_pregunta']:>8.0f}")
+    print(f"\nGemini: {dict(sorted((k, v) for k, v in genai_f.llamadas.items() if ':' not in k))}")
+    print(f"Supabase: {dict(sorted(db.llamadas.items()))}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f: json.dump(resultado, f, ensure_ascii=False, indent=1)
+        print(f"💾 Resultado en {args.json}")
+
+    if args.base:
+        with open(args.base, encoding="utf-8") as f: base = json.load(f)
+        problemas = regresiones(resultado, base, args.tolerancia)
+        if problemas:
+            print(f"\n❌ Regresiones (tolerancia {args.tolerancia:.0%}):")
+            for pr in problemas: print(f"   - {pr}")
+            sys.exit(1)
+        print(f"\n✅ Sin regresiones frente a {args.base}")
+
+if __name__ == "__main__":
+    main()
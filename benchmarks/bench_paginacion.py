@@ -0,0 +1,97 @@
+"""
+Benchmark offline de la paginación SQL: para consultas que devuelven muchas filas, compara
+el resultado completo de query_exec (como antes) contra la primera página + total
+(`consultas.ejecutar_pagina`): filas y bytes que viajan, memoria pico, tokens del prompt de
+narración y tiempo. Después recorre una lista con "muéstrame más" por `consultas.chatear`
+y cuenta las llamadas a Gemini de cada página.
+
+Uso: python -m benchmarks.bench_paginacion --filas 5000
+"""
+import argparse
+import json
+import os
+import time
+import tracemalloc
+from types import SimpleNamespace
+from benchmarks.bench_offline import TMP, generar_planilla, instalar_falsos, correr_ingesta
+import consultas
+from evidencia import estimar_tokens
+from trazas import nuevo_id
+
+CASOS = [
+    ("lista 3 columnas", "SELECT metadata->>'codigo de oferta' AS codigo, metadata->>'cliente' AS cliente, "
+                         "metadata->>'estado de oferta' AS estado FROM documentos_dj"),
+    ("lista metadata", "SELECT metadata FROM documentos_dj"),
+    ("pendientes", "SELECT metadata->>'codigo de oferta' AS codigo, metadata->>'cliente' AS cliente FROM documentos_dj "
+                   "WHERE metadata->>'estado de oferta' ILIKE '%PENDIENT%' ORDER BY 1"),
+    ("conteo", "SELECT COUNT(*) FROM documentos_dj WHERE metadata->>'estado de oferta' ILIKE '%PENDIENT%'"),
+]
+
+def medir(fn):
+    """(resultado, ms, KB de memoria pico)."""
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    res = fn()
+    ms = (time.perf_counter() - t0) * 1000
+    pico = tracemalloc.get_traced_memory()[1] / 1024
+    tracemalloc.stop()
+    return res, ms, pico
+
+def comparar(q_sql):
+    nombre, sql = q_sql
+    q = f"Bench: {nombre}"
+    completo, ms_a, kb_a = medir(lambda: consultas.execute_sql_query(sql))
+    pagina, ms_d, kb_d = medir(lambda: consultas.ejecutar_pagina(sql))
+    antes = {"filas": len(completo), "kb": len(json.dumps(completo, ensure_ascii=False)) / 1024, "pico_kb": kb_a,
+             "tokens": estimar_tokens(consultas.prompt_narracion_sql(q, completo)), "ms": ms_a}
+    despues = {"filas": len(pagina["filas"]), "kb": len(json.dumps(pagina["filas"], ensure_ascii=False)) / 1024,
+               "pico_kb": kb_d, "tokens": estimar_tokens(consultas.prompt_narracion_sql(q, pagina["filas"], pagina)),
+               "ms": ms_d}
+    assert pagina["total"] == len(completo), (pagina["total"], len(completo))
+    return nombre, pagina["total"], antes, despues
+
+def recorrer(q, genai_f, max_paginas):
+    """Pregunta + "muéstrame más" hasta el final de la lista: (llamadas LLM, ms, primera línea) por turno."""
+    historial, turnos = [], []
+    for pregunta in [q] + ["muéstrame más"] * max_paginas:
+        llm0 = genai_f.llamadas["generate"] + genai_f.llamadas["stream"]
+        traza_id = nuevo_id()
+        t0 = time.perf_counter()
+        resp = consultas.chatear(pregunta, historial, "Bench", traza_id=traza_id)
+        ms = (time.perf_counter() - t0) * 1000
+        llm = genai_f.llamadas["generate"] + genai_f.llamadas["stream"] - llm0
+        pie = resp.strip().splitlines()[-1]
+        turnos.append((pregunta, llm, ms, pie))
+        historial += [{"role": "user", "content": pregunta, "traza": traza_id},
+                      {"role": "model", "content": resp, "traza": traza_id}]
+        if "muéstrame más" not in pie: break
+    return turnos
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filas", type=int, default=5000)
+    parser.add_argument("--latencia", type=float, default=0.05, help="Latencia por llamada a Gemini (s)")
+    parser.add_argument("--latencia-db", type=float, default=0.005)
+    parser.add_argument("--paginas", type=int, default=4, help="Máximo de 'muéstrame más' seguidos")
+    parser.add_argument("--pregunta", default="ofertas pendientes del 2023 con su código y cliente")
+    parser.add_argument("--semilla", type=int, default=0)
+    args = parser.parse_args()
+
+    falsos = SimpleNamespace(latencia=args.latencia, jitter=0.0, tasa_429=0.0, semilla=args.semilla, latencia_ktoken=0.0,
+                             latencia_db=args.latencia_db, backoff=0.2, rpm=0)
+    genai_f, db = instalar_falsos(falsos)
+    ingesta_args = SimpleNamespace(ingesta="streaming")
+    correr_ingesta([generar_planilla(os.path.join(TMP, "ofertas.xlsx"), args.filas, args.semilla)], ingesta_args, genai_f, db)
+
+    print(f"📊 {args.filas} filas | {consultas.FILAS_POR_PAGINA} filas por página")
+    print(f"{'caso':<18}{'total':>7}{'filas':>13}{'KB':>15}{'pico KB':>17}{'tok prompt':>15}{'ms':>15}")
+    for nombre, total, a, d in map(comparar, CASOS):
+        celdas = [f"{a[k]:.0f}→{d[k]:.0f}" for k in ("filas", "kb", "pico_kb", "tokens", "ms")]
+        print(f"{nombre:<18}{total:>7}{celdas[0]:>13}{celdas[1]:>15}{celdas[2]:>17}{celdas[3]:>15}{celdas[4]:>15}")
+
+    print("\n💬 Lista paginada por el chat:")
+    for pregunta, llm, ms, pie in recorrer(args.pregunta, genai_f, args.paginas):
+        print(f"   {pregunta:<40} llm={llm}  {ms:7.1f} ms  {pie[:70]}")
+
+if __name__ == "__main__":
+    main()
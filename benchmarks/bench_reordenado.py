@@ -0,0 +1,110 @@
+"""
+Benchmark offline de relevancia de la evidencia RAG: preguntas generadas desde una planilla
+sintética con sus documentos relevantes conocidos (por código, por servicio + planta, por
+servicio + cliente), contra lo que recibe el LLM en tres variantes:
+  original   exactos + top-5 vectorial en orden de llegada (combinar_resultados)
+  rrf        RRF de exactos + top-N vectorial, sin BM25
+  rrf+bm25   RRF de exactos + top-N vectorial + BM25 sobre `content` (reordenar_hibrido)
+Mide, sobre lo que entra al prompt, precisión, recall, MRR, nDCG@k, documentos y tokens de evidencia, y el
+tiempo del reordenado (sin contar la búsqueda).
+
+Uso: python -m benchmarks.bench_reordenado --filas 3000 --preguntas 150
+"""
+import argparse
+import math
+import os
+import random
+import statistics
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+from benchmarks.bench_offline import TMP, generar_planilla, instalar_falsos, correr_ingesta
+import consultas
+import reordenador
+from evidencia import empaquetar_docs, relevancia
+
+def preguntas_con_relevantes(docs, n, rng):
+    """[(tipo, pregunta, ids relevantes)] desde la metadata de la tabla."""
+    por = defaultdict(set)
+    for d in docs:
+        m = d["metadata"]
+        por[("servicio_planta", m["descripcion"])].add(d["id"])
+        por[("servicio_cliente", m["descripcion"].split(" en planta")[0], m["cliente"])].add(d["id"])
+    salida = []
+    for _ in range(n):
+        d = rng.choice(docs)
+        m = d["metadata"]
+        servicio, planta = m["descripcion"].split(" en planta ")
+        tipo = rng.choice(["codigo", "servicio_planta", "servicio_cliente"])
+        if tipo == "codigo":
+            salida.append((tipo, f"¿Qué se ofertó en la {m['codigo de oferta']}?", {d["id"]}))
+        elif tipo == "servicio_planta":
+            salida.append((tipo, f"ofertas de {servicio} en planta {planta}", por[(tipo, m["descripcion"])]))
+        else:
+            salida.append((tipo, f"¿qué ofertas de {servicio} le hicimos a {m['cliente']}?",
+                           por[(tipo, servicio, m["cliente"])]))
+    return salida
+
+def metricas(enviados, relevantes, k):
+    """Sobre los documentos que de verdad entran al prompt (empaquetar_docs corta al presupuesto de tokens)."""
+    texto, stats = empaquetar_docs(enviados, consultas.MODEL_RAG) if enviados else ("", {"incluidos": 0, "tokens": 0})
+    ids = [d["id"] for d in sorted(enviados, key=relevancia, reverse=True)[:stats["incluidos"]]]
+    aciertos = [i in relevantes for i in ids]
+    dcg = sum(1 / math.log2(p + 2) for p, a in enumerate(aciertos[:k]) if a)
+    idcg = sum(1 / math.log2(p + 2) for p in range(min(k, len(relevantes))))
+    primero = next((p for p, a in enumerate(aciertos) if a), None)
+    return {
+        "docs": len(ids),
+        "precision": sum(aciertos) / len(ids) if ids else 0.0,
+        "recall": min(1.0, sum(aciertos) / min(len(relevantes), k)),
+        "mrr": 1 / (primero + 1) if primero is not None else 0.0,
+        "ndcg": dcg / idcg if idcg else 0.0,
+        "tokens": stats["tokens"],
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filas", type=int, default=3000)
+    parser.add_argument("--preguntas", type=int, default=150)
+    parser.add_argument("--k", type=int, default=reordenador.TOP_K, help="Documentos que llegan al LLM")
+    parser.add_argument("--candidatos", type=int, default=reordenador.CANDIDATOS)
+    parser.add_argument("--semilla", type=int, default=0)
+    args = parser.parse_args()
+
+    falsos = SimpleNamespace(latencia=0.0, jitter=0.0, tasa_429=0.0, semilla=args.semilla, latencia_ktoken=0.0,
+                             latencia_db=0.0, backoff=0.2, rpm=0)
+    genai_f, db = instalar_falsos(falsos)
+    correr_ingesta([generar_planilla(os.path.join(TMP, "ofertas.xlsx"), args.filas, args.semilla)],
+                   SimpleNamespace(ingesta="streaming"), genai_f, db)
+    indice, docs = consultas.obtener_indice_lexico()
+    preguntas = preguntas_con_relevantes(list(docs.values()), args.preguntas, random.Random(args.semilla))
+
+    variantes = {
+        "original": lambda q, ex, vec: sorted(consultas.combinar_resultados(ex, vec[:5]), key=relevancia, reverse=True),
+        "rrf": lambda q, ex, vec: reordenador.reordenar(q, ex, vec, None, None, args.k, args.candidatos)[0],
+        "rrf+bm25": lambda q, ex, vec: reordenador.reordenar(q, ex, vec, indice, docs, args.k, args.candidatos)[0],
+    }
+    resultados = defaultdict(lambda: defaultdict(list))   # variante -> tipo -> [métricas]
+    tiempos = defaultdict(list)
+    for tipo, q, relevantes in preguntas:
+        exactos = consultas.search_exact_flexible(q)
+        vectoriales = consultas.search_vector(q, top_k=args.candidatos)
+        for nombre, fn in variantes.items():
+            t0 = time.perf_counter()
+            enviados = fn(q, [dict(d) for d in exactos], [dict(d) for d in vectoriales])
+            tiempos[nombre].append((time.perf_counter() - t0) * 1000)
+            m = metricas(enviados, relevantes, args.k)
+            resultados[nombre][tipo].append(m)
+            resultados[nombre]["todas"].append(m)
+
+    print(f"\n📊 {len(docs)} docs | {len(preguntas)} preguntas | k={args.k} | {args.candidatos} candidatos vectoriales/BM25")
+    print(f"{'variante':<10}{'tipo':<18}{'docs':>7}{'P':>7}{'recall':>8}{'MRR':>7}{'nDCG':>7}{'tokens':>8}{'ms':>7}")
+    for nombre in variantes:
+        for tipo, ms in sorted(resultados[nombre].items(), key=lambda x: x[0] != "todas"):
+            prom = {c: statistics.mean(m[c] for m in ms) for c in ms[0]}
+            ms_txt = f"{statistics.median(tiempos[nombre]):.2f}" if tipo == "todas" else ""
+            print(f"{nombre:<10}{tipo:<18}{prom['docs']:>7.1f}{prom['precision']:>7.2f}{prom['recall']:>8.2f}"
+                  f"{prom['mrr']:>7.2f}{prom['ndcg']:>7.2f}{prom['tokens']:>8.0f}{ms_txt:>7}")
+
+if __name__ == "__main__":
+    main()
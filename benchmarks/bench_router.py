@@ -0,0 +1,105 @@
+"""
+Evaluación offline del router: el original (subcadenas + LLM para lo demás) vs el nuevo
+(palabras con límite de palabra + clasificador local + LLM solo si duda).
+El LLM no se llama: se cuenta su latencia como `--latencia-llm` y sus preguntas como de acuerdo
+con la etiqueta, así que "acuerdo" mide cuánto coincide el router con lo que haría el LLM, no
+exactitud; la exactitud real es la de las decididas localmente ("aciertan").
+
+Uso: python -m benchmarks.bench_router --latencia-llm 0.8 [--umbral 0.7] [--log .cache/rutas_router.jsonl]
+"""
+import argparse
+import time
+
+from router_local import RouterLocal, ruta_por_palabras, EJEMPLOS_BASE
+
+# Preguntas etiquetadas a mano, distintas de EJEMPLOS_BASE
+PREGUNTAS = [
+    ("cuantas ofertas pendientes hay", "SQL"), ("lista las adjudicadas del 2024", "SQL"),
+    ("que le cotizamos a minsur", "SQL"), ("dame el detalle de la OF-24-0012", "SQL"),
+    ("cuantos proyectos ganamos con southern", "SQL"), ("clientes con mas propuestas", "SQL"),
+    ("que propuestas tenemos abiertas", "SQL"), ("a que empresas les vendimos el año pasado", "SQL"),
+    ("cuanto cotizamos en total", "SQL"), ("que servicios ofrecimos a antamina", "SQL"),
+    ("cual es el id 150", "SQL"), ("propuestas enviadas a la mina", "SQL"),
+    ("que cotizaciones siguen en evaluacion", "SQL"), ("en que proyectos participamos", "SQL"),
+    ("ranking de clientes por monto", "SQL"), ("cuales perdimos este año", "SQL"),
+
+    ("que hora es", "WEB"), ("como estara el clima en cusco", "WEB"),
+    ("a cuanto esta el dolar hoy", "WEB"), ("quien es el presidente de chile", "WEB"),
+    ("ultimas noticias de mineria", "WEB"), ("cual es la capital de francia", "WEB"),
+    ("quien gano el mundial", "WEB"), ("precio del oro", "WEB"),
+    ("cuando es el proximo feriado", "WEB"), ("que paso en la bolsa de valores", "WEB"),
+    ("cuantos habitantes tiene arequipa", "WEB"), ("quien escribio cien años de soledad", "WEB"),
+    ("que temperatura hace en piura", "WEB"), ("cual es la moneda de japon", "WEB"),
+    ("presidente de estados unidos", "WEB"), ("donde queda la ciudad de trujillo", "WEB"),
+
+    ("hola que tal", "GENERAL"), ("ahora cuentame un chiste", "GENERAL"),
+    ("muchas gracias", "GENERAL"), ("buenas tardes", "GENERAL"),
+    ("que sabes hacer", "GENERAL"), ("escribeme un haiku", "GENERAL"),
+    ("dame un consejo para estudiar", "GENERAL"), ("como te llamas", "GENERAL"),
+    ("ayudame a escribir una carta", "GENERAL"), ("explicame que es la fotosintesis", "GENERAL"),
+    ("estoy aburrido", "GENERAL"), ("chau", "GENERAL"),
+    ("dime algo bonito", "GENERAL"), ("que opinas de la amistad", "GENERAL"),
+    ("ideas para un regalo", "GENERAL"), ("traduce hola al frances", "GENERAL"),
+]
+
+def ruta_por_palabras_original(q):
+    """Router anterior: subcadenas sin límites ("id" dentro de "presidente", "hora" dentro de "ahora")."""
+    q_lower = q.lower()
+    for kw in ["pendiente", "adjudicad", "ganad", "perdid", "oferta", "licitacion", "cliente", "202", "201",
+               "200", "estado", "codigo", "id", "of-", "sz-", "disponible", "vigente", "proceso", "base de datos"]:
+        if kw in q_lower: return "SQL"
+    for kw in ["hora", "clima", "tiempo", "noticia", "dolar", "dólar", "precio", "busca en google",
+               "quién es", "cuando es", "resultados del", "actualidad", "hoy"]:
+        if kw in q_lower: return "WEB"
+    return None
+
+def evaluar(nombre, decidir, latencia_llm):
+    aciertos, al_llm, segundos = 0, 0, 0.0
+    for q, esperada in PREGUNTAS:
+        t0 = time.perf_counter()
+        ruta = decidir(q)
+        segundos += time.perf_counter() - t0
+        if ruta is None:
+            al_llm += 1
+            aciertos += 1           # Las decide el LLM: cuentan como acuerdo
+        elif ruta == esperada:
+            aciertos += 1
+    n = len(PREGUNTAS)
+    locales = n - al_llm
+    local_ok = aciertos - al_llm
+    print(f"{nombre:<10} acuerdo con LLM={aciertos / n:6.1%} | locales={locales:>2}/{n} "
+          f"(aciertan {local_ok / locales if locales else 0:6.1%}) | llamadas LLM={al_llm:>2} | "
+          f"decisión local={segundos / n * 1e6:6.1f}µs | latencia media={(segundos + al_llm * latencia_llm) / n * 1000:6.0f}ms")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latencia-llm", type=float, default=0.8)
+    parser.add_argument("--umbral", type=float, default=None)
+    parser.add_argument("--log", default=None, help="JSONL de decisiones del LLM para entrenar además")
+    args = parser.parse_args()
+
+    router = RouterLocal(ruta_log=args.log)
+    if args.umbral is not None: router.umbral = args.umbral
+    t0 = time.perf_counter()
+    n = router.entrenar()
+    print(f"Entrenado con {n} ejemplos en {(time.perf_counter() - t0) * 1000:.0f}ms "
+          f"({len(EJEMPLOS_BASE)} base) | umbral={router.umbral}\n")
+
+    def nuevo(q):
+        return ruta_por_palabras(q) or router.clasificar(q)[0]
+
+    evaluar("original", ruta_por_palabras_original, args.latencia_llm)
+    evaluar("nuevo", nuevo, args.latencia_llm)
+
+    errores = [(q, e, nuevo(q)) for q, e in PREGUNTAS if nuevo(q) not in (None, e)]
+    if errores:
+        print("\nErrores del nuevo router:")
+        for q, e, r in errores: print(f"   {q!r}: esperada {e}, obtuvo {r}")
+    errores = [(q, e, ruta_por_palabras_original(q)) for q, e in PREGUNTAS
+               if ruta_por_palabras_original(q) not in (None, e)]
+    if errores:
+        print("\nErrores del router original:")
+        for q, e, r in errores: print(f"   {q!r}: esperada {e}, obtuvo {r}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Compromiso recall vs tamaño/latencia de los modos de almacenamiento de vectores (sin red):
+float32 / halfvec / int8, con el índice sobre el vector completo o sobre un prefijo Matryoshka,
+con y sin re-orden de candidatos con el vector completo. La verdad es el top-k exacto en float32.
+
+Corpus: filas de una planilla (la del negocio con --planilla, o una sintética) convertidas en
+texto igual que la ingesta; consultas: el corpus de preguntas + fragmentos de filas al azar.
+Vectores: offline con benchmarks.falsos.vector_simulado, o reales con --snapshot (índice local).
+OJO: los vectores simulados no están entrenados tipo Matryoshka (truncar = proyección aleatoria),
+así que el recall con prefijo es una cota pesimista; con text-embedding-004 real es mejor.
+
+Uso: python -m benchmarks.bench_vectores --filas 20000 --k 5
+     python -m benchmarks.bench_vectores --planilla file_4.xlsx
+     python -m benchmarks.bench_vectores --snapshot .cache/indice_documentos
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import numpy as np
+from embeddings import serializar_vector, normalize_matrix, FACTOR_CANDIDATOS
+from indice_local import IndiceVectorial
+from lector_planillas import iterar_filas
+from benchmarks.bench_offline import generar_planilla, CORPUS
+from benchmarks.falsos import vector_simulado
+
+BYTES = {"float32": 4, "halfvec": 2, "int8": 1}
+DIMS = (768, 384, 256, 128)
+
+def cargar_corpus(args):
+    """(matriz de documentos, matriz de consultas)."""
+    rng = random.Random(args.semilla)
+    if args.snapshot:
+        real = IndiceVectorial.cargar(args.snapshot, mmap=False)
+        docs = np.asarray(real.completa if real.completa is not None else real.matriz, dtype=np.float32)
+        ruido = np.random.default_rng(args.semilla).standard_normal((args.consultas, docs.shape[1])).astype(np.float32)
+        consultas = normalize_matrix(docs[[rng.randrange(len(docs)) for _ in range(args.consultas)]]) + 0.05 * ruido
+        return normalize_matrix(docs), normalize_matrix(consultas)
+
+    ruta = args.planilla or generar_planilla(os.path.join(tempfile.mkdtemp(), "planilla.xlsx"), args.filas, args.semilla)
+    textos = [contenido for _, contenido, _ in iterar_filas(ruta)]
+    with open(CORPUS, encoding="utf-8") as f:
+        preguntas = [json.loads(l)["q"] for l in f if l.strip()]
+    # Consultas "de fila": 2-3 campos de una fila al azar (como quien busca una oferta concreta)
+    for _ in range(max(0, args.consultas - len(preguntas))):
+        partes = rng.choice(textos).split(". ")
+        preguntas.append(". ".join(rng.sample(partes, min(len(partes), rng.choice((2, 3))))))
+    return normalize_matrix([vector_simulado(t) for t in textos]), normalize_matrix([vector_simulado(q) for q in preguntas])
+
+def verdad(docs, consultas, k):
+    sims = consultas.astype(np.float64) @ docs.astype(np.float64).T
+    return [set(np.argsort(-fila)[:k].tolist()) for fila in sims]
+
+def construir(docs, almacen, dim, factor):
+    """IndiceVectorial que se comporta como el almacenamiento: halfvec = vectores redondeados a float16."""
+    base = docs.astype(np.float16).astype(np.float32) if almacen == "halfvec" else docs
+    idx = IndiceVectorial(cuantizar=almacen == "int8", dim=dim if dim < docs.shape[1] else None, factor_candidatos=factor)
+    idx.agregar([{"id": i, "content": "", "metadata": {}, "embedding": v} for i, v in enumerate(base)])
+    return idx
+
+def medir(idx, consultas, exactos, k, reordenar):
+    aciertos, tiempos = 0, []
+    for q, esperados in zip(consultas, exactos):
+        t0 = time.perf_counter()
+        res = idx.buscar(q, match_threshold=-1.0, match_count=k, reordenar=reordenar)
+        tiempos.append(time.perf_counter() - t0)
+        aciertos += len({r["id"] for r in res} & esperados)
+    return aciertos / (k * len(consultas)), float(np.percentile(np.array(tiempos) * 1000, 50))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filas", type=int, default=20000, help="Filas de la planilla sintética")
+    parser.add_argument("--planilla", help="Planilla real (se embebe offline con vector_simulado)")
+    parser.add_argument("--snapshot", help="Snapshot real del índice local (vectores de Gemini)")
+    parser.add_argument("--consultas", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--dims", type=int, nargs="+", default=list(DIMS))
+    parser.add_argument("--factor", type=int, default=FACTOR_CANDIDATOS, help="Candidatos = k x factor al re-ordenar")
+    parser.add_argument("--semilla", type=int, default=0)
+    args = parser.parse_args()
+
+    docs, consultas = cargar_corpus(args)
+    n, d = docs.shape
+    exactos = verdad(docs, consultas, args.k)
+    muestra = docs[0]
+    json_float = len(json.dumps(muestra.tolist()))
+    print(f"📊 {n} docs x {d} dims, {len(consultas)} consultas, recall@{args.k} contra float32 exacto "
+          f"(re-orden de {args.k * args.factor} candidatos)")
+    print(f"📦 Payload por vector: JSON de floats {json_float / 1024:.1f} KB | "
+          f"texto vector {len(serializar_vector(muestra, 'vector')) / 1024:.1f} KB | "
+          f"texto halfvec {len(serializar_vector(muestra, 'halfvec')) / 1024:.1f} KB\n")
+    print(f"{'almacén':<8} {'dims':>5} {'re-orden':>8} {'recall':>7} {'p50 ms':>7} {'tabla MB':>9} {'índice MB':>10}")
+
+    for almacen in ("float32", "halfvec", "int8"):
+        for dim in [x for x in args.dims if x <= d]:
+            idx = construir(docs, almacen, dim, args.factor)
+            # Tabla: el vector completo en el tipo de la columna (int8 solo existe en el índice local)
+            tabla = n * d * BYTES["float32" if almacen == "int8" else almacen] / 2**20
+            indice = n * (dim * BYTES[almacen] + (4 if almacen == "int8" else 0)) / 2**20
+            opciones = (False, True) if idx.aproximado else (False,)
+            for reordenar in opciones:
+                recall, p50 = medir(idx, consultas, exactos, args.k, reordenar)
+                print(f"{almacen:<8} {dim:>5} {'sí' if reordenar else 'no':>8} {recall:>7.3f} {p50:>7.2f} "
+                      f"{tabla:>9.1f} {indice:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,382 @@
+"""
+Dobles locales y deterministas de los servicios externos, para medir sin red:
+- GenaiFalso: `genai.Client` (models / aio.models) con latencia configurable e inyección de 429.
+- SupabaseFalso: `table(...)` y `rpc(...)` de supabase-py sobre SQLite (metadata como JSON,
+  `->>` nativo de SQLite, ILIKE -> LIKE) y `match_documentos` por coseno con numpy.
+"""
+import re
+import json
+import time
+import random
+import hashlib
+import sqlite3
+import asyncio
+import threading
+from types import SimpleNamespace
+from collections import Counter
+from functools import lru_cache
+import numpy as np
+
+from cache_respuestas import normalizar_pregunta
+from plan_sql import extraer_parametros, CLAUSULAS_ESTADO, clausula_anio
+from evidencia import estimar_tokens
+
+# --- 1. GEMINI ---
+class Error429Falso(Exception):
+    def __init__(self): super().__init__("429 RESOURCE_EXHAUSTED (simulado)")
+
+def _pregunta(prompt, patron):
+    m = re.search(patron, prompt, re.DOTALL)
+    return m.group(1) if m else ""
+
+def sql_simulado(q):
+    """SQL que escribiría el modelo para la pregunta (o texto sin SELECT, que manda la ruta a RAG)."""
+    q_lower = q.lower()
+    params = extraer_parametros(q)
+    filtros = []
+    codigo = re.search(r"\b((?:OF|SZ)-[\w-]+)", q, re.IGNORECASE)
+    if codigo: filtros.append(f"metadata->>'codigo de oferta' ILIKE '%{codigo.group(1).upper()}%'")
+    if "estado" in params: filtros.append(f"({CLAUSULAS_ESTADO[params['estado']]})")
+    if "anio" in params: filtros.append(clausula_anio(params["anio"]))
+    if not filtros: return "No aplica SQL para esta pregunta."
+    where = " AND ".join(filtros)
+    if re.search(r"cuant|total|cantidad", q_lower):
+        return f"```sql\nSELECT COUNT(*) FROM documentos_dj WHERE {where};\n```"
+    return ("SELECT metadata->>'codigo de oferta' AS codigo, metadata->>'cliente' AS cliente, "
+            f"metadata->>'estado de oferta' AS estado FROM documentos_dj WHERE {where} LIMIT 50")
+
+def respuesta_sql_simulada(q):
+    """Salida JSON (SQL + plantilla) del modo plantilla: la que pide `plantilla_sql.INSTRUCCIONES`."""
+    sql = sql_simulado(q)
+    if "SELECT" not in sql: return json.dumps({"sql": "", "encabezado": "", "fila": "", "vacio": ""})
+    sql = re.sub(r"```(?:sql)?|;", "", sql).strip()
+    vacio = "No encontré ofertas con esos filtros. Prueba con otro estado o año."
+    if "COUNT(*)" in sql:
+        return json.dumps({"sql": sql, "encabezado": "Hay **{count}** ofertas que cumplen.", "fila": "", "vacio": vacio})
+    return json.dumps({"sql": sql, "encabezado": "Encontré {total} ofertas:", "fila": "* {codigo}: {cliente} ({estado})",
+                       "vacio": vacio}, ensure_ascii=False)
+
+def texto_simulado(prompt):
+    """Respuesta determinista según el tipo de prompt (router, SQL o narración)."""
+    if "Router." in prompt:
+        q = _pregunta(prompt, r"PREGUNTA: '(.*?)'\n").lower()
+        if re.search(r"empresa|cotiz|propuest|proyecto|vend", q): return "SQL"
+        if re.search(r"quien|cual es|cuanto cuesta|donde", q): return "WEB"
+        return "GENERAL"
+    if "EXPERTO EN SQL" in prompt and "RESPONDE SOLO UN JSON" in prompt:
+        return respuesta_sql_simulada(_pregunta(prompt, r"PREGUNTA: '(.*?)'\n"))
+    if "EXPERTO EN SQL" in prompt:
+        return sql_simulado(_pregunta(prompt, r"PREGUNTA: '(.*?)'\n"))
+    return f"Respuesta simulada ({len(prompt)} caracteres de contexto)."
+
+DIMENSION = 768
+
+@lru_cache(maxsize=50000)
+def _vector_palabra(palabra):
+    semilla = int.from_bytes(hashlib.sha256(palabra.encode("utf-8")).digest()[:8], "little")
+    return np.random.default_rng(semilla).standard_normal(DIMENSION).astype(np.float32)
+
+def vector_simulado(texto):
+    """Suma de vectores por palabra: textos que comparten palabras quedan cerca (como un embedding real)."""
+    palabras = normalizar_pregunta(texto).split() or [""]
+    v = np.sum([_vector_palabra(p) for p in palabras], axis=0)
+    return v / (np.linalg.norm(v) or 1.0)
+
+class _ModelosFalsos:
+    def __init__(self, cliente): self.c = cliente
+
+    def generate_content(self, model, contents, config=None):
+        self.c._llamada("generate", model)
+        time.sleep(self.c.latencia_llamada(contents))
+        return SimpleNamespace(text=texto_simulado(contents))
+
+    def generate_content_stream(self, model, contents, config=None):
+        self.c._llamada("stream", model)
+        texto = texto_simulado(contents)
+        trozos = [texto[i:i + self.c.tam_trozo] for i in range(0, len(texto), self.c.tam_trozo)]
+        time.sleep(self.c.latencia_llamada(contents))
+        for i, t in enumerate(trozos):
+            if i: time.sleep(self.c.latencia_trozo)
+            yield SimpleNamespace(text=t)
+
+    def embed_content(self, model, contents, config=None):
+        textos = [contents] if isinstance(contents, str) else list(contents)
+        self.c._llamada("embed", model, len(textos))
+        time.sleep(self.c.latencia_llamada())
+        return self.c._embeddings(textos, config)
+
+class _ModelosFalsosAsync:
+    def __init__(self, cliente): self.c = cliente
+
+    async def generate_content(self, model, contents, config=None):
+        self.c._llamada("generate", model)
+        await asyncio.sleep(self.c.latencia_llamada(contents))
+        return SimpleNamespace(text=texto_simulado(contents))
+
+    async def generate_content_stream(self, model, contents, config=None):
+        self.c._llamada("stream", model)
+        texto = texto_simulado(contents)
+        latencia = self.c.latencia_llamada(contents)
+
+        async def trozos():
+            await asyncio.sleep(latencia)
+            for i in range(0, len(texto), self.c.tam_trozo):
+                if i: await asyncio.sleep(self.c.latencia_trozo)
+                yield SimpleNamespace(text=texto[i:i + self.c.tam_trozo])
+        return trozos()
+
+    async def embed_content(self, model, contents, config=None):
+        textos = [contents] if isinstance(contents, str) else list(contents)
+        self.c._llamada("embed", model, len(textos))
+        await asyncio.sleep(self.c.latencia_llamada())
+        return self.c._embeddings(textos, config)
+
+class GenaiFalso:
+    """
+    Reemplazo de `genai.Client`. Cada llamada tarda `latencia` (+ `jitter` aleatorio con semilla,
+    + `latencia_ktoken` por cada 1000 tokens de prompt: el prefill) y falla con 429 con
+    probabilidad `tasa_429`. Cuenta llamadas por tipo y por modelo, y tokens de prompt.
+    """
+
+    def __init__(self, latencia=0.05, jitter=0.0, tasa_429=0.0, semilla=0, tam_trozo=16, latencia_trozo=0.005,
+                 latencia_ktoken=0.0):
+        self.latencia = latencia
+        self.latencia_ktoken = latencia_ktoken
+        self.jitter = jitter
+        self.tasa_429 = tasa_429
+        self.tam_trozo = tam_trozo
+        self.latencia_trozo = latencia_trozo
+        self.rng = random.Random(semilla)
+        self.llamadas = Counter()
+        self.lock = threading.Lock()
+        self.models = _ModelosFalsos(self)
+        self.aio = SimpleNamespace(models=_ModelosFalsosAsync(self))
+
+    def _llamada(self, tipo, model, textos=0):
+        with self.lock:
+            self.llamadas[tipo] += 1
+            self.llamadas[f"{tipo}:{model}"] += 1
+            self.llamadas["textos_embebidos"] += textos
+            falla = self.rng.random() < self.tasa_429
+            if falla: self.llamadas["429"] += 1
+        if falla: raise Error429Falso()
+
+    def latencia_llamada(self, prompt=""):
+        tokens = estimar_tokens(prompt) if isinstance(prompt, str) else 0
+        with self.lock:
+            self.llamadas["tokens_prompt"] += tokens
+            return self.latencia + self.rng.random() * self.jitter + self.latencia_ktoken * tokens / 1000
+
+    def _embeddings(self, textos, config):
+        dim = getattr(config, "output_dimensionality", None) or DIMENSION
+        return SimpleNamespace(embeddings=[SimpleNamespace(values=vector_simulado(t)[:dim].tolist()) for t in textos])
+
+# --- 2. SUPABASE ---
+COLUMNAS_JSON = {"metadata", "datos"}
+ESQUEMA = """
+create table documentos_dj (id integer primary key autoincrement, content text, metadata text,
+                            embedding text, content_hash text);
+create index documentos_dj_hash on documentos_dj (content_hash);
+create table resumen_dj (id integer primary key, datos text, actualizado text default current_timestamp);
+"""
+
+def columna_sql(col):
+    """'metadata->>estado de oferta' (estilo PostgREST) -> "metadata->>'estado de oferta'" (SQLite)."""
+    col = col.strip()
+    if "->>" in col:
+        base, clave = col.split("->>", 1)
+        return f"{base}->>'{clave.strip(chr(39))}'"
+    return f'"{col}"'
+
+def patron_like(valor):
+    return str(valor).replace("*", "%")
+
+def postgres_a_sqlite(sql):
+    """Lo justo para el SQL que escribe el modelo: ILIKE, casts `::tipo`, COUNT(*) con nombre 'count'."""
+    sql = re.sub(r"\bILIKE\b", "LIKE", sql, flags=re.IGNORECASE)
+    sql = re.sub(r"(LIKE\s+'[^']*\\[^']*')", lambda m: m.group(1) + " ESCAPE '\\'", sql)   # '\_' como en Postgres
+    sql = re.sub(r"::\s*\w+", "", sql)
+    sql = re.sub(r"\bcount\(\s*\*\s*\)(?!\s+(?:as|over)\b)", "count(*) AS count", sql, flags=re.IGNORECASE)
+    return sql
+
+def _salida(fila):
+    d = dict(fila)
+    for k, v in d.items():
+        if k in COLUMNAS_JSON and isinstance(v, str): d[k] = json.loads(v)
+        elif isinstance(v, str) and v[:1] == "{":
+            try: d[k] = json.loads(v)
+            except ValueError: pass
+    return d
+
+def _entrada(fila):
+    d = {}
+    for k, v in fila.items():
+        if isinstance(v, (dict, list)): v = json.dumps(v, ensure_ascii=False)
+        elif isinstance(v, np.ndarray): v = json.dumps(v.tolist())
+        d[k] = v
+    return d
+
+class _Consulta:
+    """Constructor encadenable con la misma forma que el de supabase-py (select/filtros/insert/...)."""
+
+    def __init__(self, db, tabla, asincrono):
+        self.db, self.tabla, self.asincrono = db, tabla, asincrono
+        self.op, self.columnas, self.filas = "select", "*", None
+        self.filtros, self.params = [], []
+        self.orden, self.limite, self.desde = None, None, None
+
+    # Operación
+    def select(self, columnas="*", count=None):
+        self.op, self.columnas = "select", columnas
+        return self
+    def insert(self, filas):
+        self.op, self.filas = "insert", filas if isinstance(filas, list) else [filas]
+        return self
+    def upsert(self, filas):
+        self.op, self.filas = "upsert", filas if isinstance(filas, list) else [filas]
+        return self
+    def delete(self):
+        self.op = "delete"
+        return self
+
+    # Filtros
+    def _filtro(self, sql, *params):
+        self.filtros.append(sql)
+        self.params.extend(params)
+        return self
+    def eq(self, col, val): return self._filtro(f"{columna_sql(col)} = ?", val)
+    def neq(self, col, val): return self._filtro(f"{columna_sql(col)} != ?", val)
+    def gt(self, col, val): return self._filtro(f"{columna_sql(col)} > ?", val)
+    def lt(self, col, val): return self._filtro(f"{columna_sql(col)} < ?", val)
+    def ilike(self, col, patron): return self._filtro(f"{columna_sql(col)} LIKE ?", patron_like(patron))
+    def in_(self, col, valores):
+        valores = list(valores)
+        if not valores: return self._filtro("0")
+        return self._filtro(f"{columna_sql(col)} IN ({','.join('?' * len(valores))})", *valores)
+    def or_(self, filtro):
+        """Formato PostgREST: 'col.op.valor,col.op."valor con ."'."""
+        partes, params = [], []
+        for col, op, valor in re.findall(r'([^,]+?)\.(eq|ilike)\.("[^"]*"|[^,]*)', filtro):
+            valor = valor.strip('"')
+            partes.append(f"{columna_sql(col)} {'=' if op == 'eq' else 'LIKE'} ?")
+            params.append(valor if op == "eq" else patron_like(valor))
+        return self._filtro("(" + " OR ".join(partes) + ")", *params)
+
+    # Orden y paginado
+    def order(self, col, desc=False):
+        self.orden = f"{columna_sql(col)} {'DESC' if desc else 'ASC'}"
+        return self
+    def limit(self, n):
+        self.limite = n
+        return self
+    def range(self, desde, hasta):
+        self.desde, self.limite = desde, hasta - desde + 1
+        return self
+
+    def execute(self):
+        if self.asincrono:
+            async def _async():
+                await asyncio.sleep(self.db.latencia)
+                return self.db._ejecutar(self)
+            return _async()
+        time.sleep(self.db.latencia)
+        return self.db._ejecutar(self)
+
+class _Rpc:
+    def __init__(self, db, nombre, params, asincrono):
+        self.db, self.nombre, self.params, self.asincrono = db, nombre, params, asincrono
+
+    def execute(self):
+        if self.asincrono:
+            async def _async():
+                await asyncio.sleep(self.db.latencia)
+                return self.db._rpc(self.nombre, self.params)
+            return _async()
+        time.sleep(self.db.latencia)
+        return self.db._rpc(self.nombre, self.params)
+
+class _SupabaseFalsoAsync:
+    def __init__(self, base): self.base = base
+    def table(self, nombre): return _Consulta(self.base, nombre, True)
+    def rpc(self, nombre, params): return _Rpc(self.base, nombre, params, True)
+
+class SupabaseFalso:
+    """Cliente Supabase sobre SQLite en memoria (o en `ruta`). `asincrono()` da la versión para `await`."""
+
+    def __init__(self, ruta=":memory:", latencia=0.0):
+        self.latencia = latencia
+        self.con = sqlite3.connect(ruta, check_same_thread=False)
+        self.con.row_factory = sqlite3.Row
+        self.con.executescript(ESQUEMA)
+        self.lock = threading.RLock()
+        self.llamadas = Counter()
+        self._matriz = None   # (ids, filas, matriz normalizada) para match_documentos
+
+    def asincrono(self):
+        """Misma base de datos y contadores, pero `execute()` devuelve una corrutina."""
+        return _SupabaseFalsoAsync(self)
+
+    def table(self, nombre): return _Consulta(self, nombre, False)
+    def rpc(self, nombre, params): return _Rpc(self, nombre, params, False)
+
+    def _ejecutar(self, c):
+        self.llamadas[f"{c.tabla}.{c.op}"] += 1
+        where = f" WHERE {' AND '.join(c.filtros)}" if c.filtros else ""
+        with self.lock:
+            if c.op in ("insert", "upsert"):
+                filas = [_entrada(f) for f in c.filas]
+                for f in filas:
+                    cols = list(f)
+                    verbo = "INSERT OR REPLACE" if c.op == "upsert" else "INSERT"
+                    cur = self.con.execute(f"{verbo} INTO {c.tabla} ({','.join(columna_sql(k) for k in cols)}) "
+                                           f"VALUES ({','.join('?' * len(cols))})", [f[k] for k in cols])
+                    f["id"] = f.get("id", cur.lastrowid)
+                self.con.commit()
+                self._matriz = None
+                return SimpleNamespace(data=[_salida(f) for f in filas], count=None)
+            if c.op == "delete":
+                filas = self.con.execute(f"SELECT id FROM {c.tabla}{where}", c.params).fetchall()
+                self.con.execute(f"DELETE FROM {c.tabla}{where}", c.params)
+                self.con.commit()
+                self._matriz = None
+                return SimpleNamespace(data=[dict(f) for f in filas], count=None)
+            columnas = ", ".join(columna_sql(x) for x in c.columnas.split(",")) if c.columnas.strip() != "*" else "*"
+            sql = f"SELECT {columnas} FROM {c.tabla}{where}"
+            if c.orden: sql += f" ORDER BY {c.orden}"
+            if c.limite is not None: sql += f" LIMIT {int(c.limite)}"
+            if c.desde: sql += f" OFFSET {int(c.desde)}"
+            filas = self.con.execute(sql, c.params).fetchall()
+        return SimpleNamespace(data=[_salida(f) for f in filas], count=None)
+
+    def _fila_como_texto(self, sql):
+        """`t::text` (la fila entera, la clave de paginacion_sql) no existe en SQLite: json_array de sus columnas."""
+        if "t::text" not in sql: return sql
+        interno = re.search(r"from \((.*)\) as t\b", sql, re.DOTALL).group(1)
+        columnas = [d[0] for d in self.con.execute(f"select * from ({postgres_a_sqlite(interno)}) limit 0").description]
+        return sql.replace("t::text", "json_array(" + ", ".join(f't."{c}"' for c in columnas) + ")")
+
+    def _rpc(self, nombre, params):
+        self.llamadas[f"rpc.{nombre}"] += 1
+        if nombre == "query_exec":
+            with self.lock:
+                filas = self.con.execute(postgres_a_sqlite(self._fila_como_texto(params["query"]))).fetchall()
+            return SimpleNamespace(data=[_salida(f) for f in filas])
+        if nombre == "match_documentos":
+            return SimpleNamespace(data=self._match(params["query_embedding"], params["match_threshold"], params["match_count"]))
+        raise Exception(f"Función '{nombre}' no existe (simulado)")
+
+    def _match(self, vector, umbral, cantidad):
+        with self.lock:
+            if self._matriz is None:
+                filas = self.con.execute("SELECT id, content, metadata, embedding FROM documentos_dj "
+                                         "WHERE embedding IS NOT NULL ORDER BY id").fetchall()
+                matriz = np.array([json.loads(f["embedding"]) for f in filas], dtype=np.float32).reshape(len(filas), -1)
+                if len(filas): matriz /= np.maximum(np.linalg.norm(matriz, axis=1, keepdims=True), 1e-12)
+                self._matriz = ([{"id": f["id"], "content": f["content"], "metadata": json.loads(f["metadata"])} for f in filas], matriz)
+            docs, matriz = self._matriz
+        if not docs: return []
+        # PostgREST acepta el vector como lista o como texto '[...]' (embeddings.serializar_vector)
+        q = np.asarray(json.loads(vector) if isinstance(vector, str) else vector, dtype=np.float32)
+        sims = matriz @ (q / (np.linalg.norm(q) or 1.0))
+        orden = [i for i in np.argsort(-sims)[:cantidad] if sims[i] > umbral]
+        return [{**docs[i], "similarity": float(sims[i])} for i in orden]
@@ -0,0 +1,115 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+
+# --- CONFIGURACIÓN ---
+RUTA_BITACORA = os.environ.get("INGESTA_BITACORA_PATH", ".cache/ingesta_bitacora.sqlite")
+RUTA_FALLIDOS = os.environ.get("INGESTA_FALLIDOS_PATH", ".cache/ingesta_fallidos.jsonl")
+
+_fallidos_lock = threading.Lock()
+
+def id_corrida(rutas, hojas=None):
+    """Misma lista de archivos (y hojas) = misma corrida, para poder reanudarla."""
+    base = "\x1f".join(sorted(os.path.abspath(r) for r in rutas)) + "\x1e" + "\x1f".join(sorted(hojas or []))
+    return hashlib.sha256(base.encode("utf-8")).hexdigest()[:16]
+
+def registrar_fallido(registros, etapa, error, corrida=None, lote=None, ruta=RUTA_FALLIDOS):
+    """Agrega un lote fallido (sin los vectores) al archivo dead-letter JSONL, para revisarlo o reintentarlo."""
+    linea = {
+        "fecha": time.strftime("%Y-%m-%d %H:%M:%S"), "corrida": corrida, "lote": lote, "etapa": etapa,
+        "error": str(error),
+        "filas": [{k: v for k, v in r.items() if k != "embedding"} for r in registros],
+    }
+    try:
+        with _fallidos_lock:
+            if os.path.dirname(ruta): os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            with open(ruta, "a", encoding="utf-8") as f:
+                f.write(json.dumps(linea, ensure_ascii=False, default=str) + "\n")
+    except OSError as e:
+        print(f"   ⚠️ No se pudo escribir el dead-letter: {e}")
+    print(f"   🪦 Lote {lote} ({len(registros)} filas, {etapa}) enviado a {ruta}")
+
+class Bitacora:
+    """
+    Bitácora local de una corrida de ingesta, por posición de fila en el stream de lectura.
+    Guarda el vector de cada fila embebida y marca las que ya se insertaron (ahí se borra el vector).
+    Con `reanudar=True` se saltan las insertadas y se reutilizan los vectores guardados: no se
+    vuelve a llamar al API de embeddings por filas ya hechas. Si el archivo cambió (otro
+    content_hash en esa posición) la fila se procesa de nuevo.
+    """
+
+    def __init__(self, corrida, ruta=RUTA_BITACORA, reanudar=False):
+        if ruta != ":memory:" and os.path.dirname(ruta):
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        self.corrida = corrida
+        self.ruta = ruta
+        self.saltadas = 0
+        self.recuperadas = 0
+        self.fallidas = 0
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(ruta, check_same_thread=False)
+        self.db.execute("pragma journal_mode=wal")
+        self.db.execute("""
+            create table if not exists filas (
+                corrida text not null,
+                pos integer not null,
+                content_hash text not null,
+                vector blob,
+                insertada integer not null default 0,
+                primary key (corrida, pos)
+            )""")
+        if not reanudar:
+            self.db.execute("delete from filas where corrida = ?", (corrida,))
+        self.db.commit()
+
+    def hechas(self):
+        with self.lock:
+            return self.db.execute("select count(*) from filas where corrida = ? and insertada = 1",
+                                   (self.corrida,)).fetchone()[0]
+
+    def recuperar(self, lote):
+        """Quita del lote las filas ya insertadas y completa "embedding" con los vectores guardados."""
+        posiciones = [r["pos"] for r in lote]
+        marcas = ",".join("?" * len(posiciones))
+        with self.lock:
+            guardadas = {pos: (h, blob, insertada) for pos, h, blob, insertada in self.db.execute(
+                f"select pos, content_hash, vector, insertada from filas where corrida = ? and pos in ({marcas})",
+                [self.corrida, *posiciones])}
+        pendientes = []
+        for r in lote:
+            h, blob, insertada = guardadas.get(r["pos"], (None, None, 0))
+            if h == r["content_hash"]:
+                if insertada:
+                    self.saltadas += 1
+                    continue
+                if blob is not None and "embedding" not in r:
+                    r["embedding"] = np.frombuffer(blob, dtype=np.float32).tolist()
+                    self.recuperadas += 1
+            pendientes.append(r)
+        return pendientes
+
+    def embebidos(self, lote):
+        filas = [(self.corrida, r["pos"], r["content_hash"], np.asarray(r["embedding"], dtype=np.float32).tobytes())
+                 for r in lote]
+        with self.lock:
+            self.db.executemany("insert or replace into filas (corrida, pos, content_hash, vector, insertada) "
+                                "values (?, ?, ?, ?, 0)", filas)
+            self.db.commit()
+
+    def insertados(self, lote):
+        with self.lock:
+            self.db.executemany("update filas set insertada = 1, vector = null where corrida = ? and pos = ?",
+                                [(self.corrida, r["pos"]) for r in lote])
+            self.db.commit()
+
+    def fallido(self, n_lote, lote, etapa, error):
+        with self.lock: self.fallidas += len(lote)
+        registrar_fallido(lote, etapa, error, corrida=self.corrida, lote=n_lote)
+
+    def stats(self):
+        return {"corrida": self.corrida, "saltadas": self.saltadas, "recuperadas": self.recuperadas,
+                "fallidas": self.fallidas, "insertadas_total": self.hechas()}
@@ -1,13 +1,18 @@
 import os
-import logging
+import time
 import asyncio
+import logging
 from dotenv import load_dotenv
 from telegram import Update
 from telegram.constants import ParseMode, ChatAction
+from telegram.error import RetryAfter
 from telegram.ext import ApplicationBuilder, ContextTypes, CommandHandler, MessageHandler, filters
 
-# Importamos tu cerebro
-from consultas import chatear
+# Importamos tu cerebro (versión async: no ocupa hilos mientras espera a la IA)
+from consultas_async import achatear_stream
+from consultas import precalentar
+from trazas import nuevo_id, iniciar_servidor_metricas
+from memoria_conversaciones import obtener_memoria
 
 load_dotenv(".env")
 TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN")
@@ -15,7 +20,39 @@ TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN")
 if not TOKEN: raise ValueError("❌ Falta TELEGRAM_BOT_TOKEN")
 
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
-user_histories = {}
+memoria = obtener_memoria()   # Historiales acotados y persistentes (MEMORIA_BACKEND)
+
+EDIT_INTERVALO_S = 1.5   # Telegram limita las ediciones por chat: editamos como mucho cada 1.5 s
+MAX_TELEGRAM = 4096      # Largo máximo de un mensaje
+
+async def mostrar_en_streaming(update: Update, trozos):
+    """Muestra la respuesta mientras llega: un solo mensaje que se va editando (con throttle)."""
+    mensaje, texto, proximo = None, "", 0.0
+    async for trozo in trozos:
+        texto += trozo
+        if time.monotonic() < proximo or not texto.strip() or len(texto) > MAX_TELEGRAM - 2: continue
+        proximo = time.monotonic() + EDIT_INTERVALO_S
+        try:
+            if mensaje is None: mensaje = await update.message.reply_text(texto + " ▌")
+            else: await mensaje.edit_text(texto + " ▌")
+        except RetryAfter as e:
+            espera = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else e.retry_after
+            proximo = time.monotonic() + espera
+        except: pass
+    return mensaje, texto
+
+async def enviar_final(update: Update, mensaje, texto):
+    """Deja el texto definitivo (con Markdown si se puede), partiendo en varios mensajes si es largo."""
+    partes = [texto[i:i + MAX_TELEGRAM] for i in range(0, len(texto), MAX_TELEGRAM)] or ["(sin respuesta)"]
+    for i, parte in enumerate(partes):
+        try:
+            if i == 0 and mensaje is not None: await mensaje.edit_text(parte, parse_mode=ParseMode.MARKDOWN)
+            else: await update.message.reply_text(parte, parse_mode=ParseMode.MARKDOWN)
+        except:
+            try:
+                if i == 0 and mensaje is not None: await mensaje.edit_text(parte)
+                else: await update.message.reply_text(parte)
+            except: pass
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Bienvenida bonita."""
@@ -36,52 +73,51 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     info_usuario = f"Nombre: {user.first_name}, User: @{user.username}, ID: {user_id}"
     
-    if user_id not in user_histories: user_histories[user_id] = []
-    history = user_histories[user_id]
+    history = await asyncio.to_thread(memoria.historial, user_id)
 
     await context.bot.send_chat_action(chat_id=update.effective_chat.id, action=ChatAction.TYPING)
 
     # --- CALLBACK: El puente entre Cerebro y Telegram ---
-    def notificar_usuario(mensaje):
-        async def enviar():
-            try:
-                # Manda el mensaje de "🚧 IA saturada..."
-                await update.message.reply_text(f"🚧 {mensaje}")
-                # Renueva el estado "escribiendo..."
-                await context.bot.send_chat_action(chat_id=update.effective_chat.id, action=ChatAction.TYPING)
-            except: pass
-        
-        # Inyectamos esto en el hilo principal de Telegram
-        asyncio.run_coroutine_threadsafe(enviar(), loop)
+    async def notificar_usuario(mensaje):
+        try:
+            # Manda el mensaje de "🚧 IA saturada..."
+            await update.message.reply_text(f"🚧 {mensaje}")
+            # Renueva el estado "escribiendo..."
+            await context.bot.send_chat_action(chat_id=update.effective_chat.id, action=ChatAction.TYPING)
+        except: pass
+
+    # Misma traza para el mensaje, sus spans y los logs
+    traza_id = nuevo_id()
 
     try:
-        loop = asyncio.get_running_loop()
-        print(f"📩 Mensaje de {user.first_name}: {text}")
+        print(f"📩 Mensaje de {user.first_name} [traza {traza_id}]: {text}")
         
-        # Pasamos 'notificar_usuario' al cerebro
-        response = await asyncio.to_thread(chatear, text, history, info_usuario, notificar_usuario)
-
-        history.append({"role": "user", "content": text})
-        history.append({"role": "model", "content": response})
-        if len(history) > 10: user_histories[user_id] = history[-10:]
+        # Pasamos 'notificar_usuario' al cerebro; la respuesta llega por trozos
+        metricas = {}
+        trozos = achatear_stream(text, history, info_usuario, notificar_usuario, metricas, traza_id=traza_id)
+        mensaje, response = await mostrar_en_streaming(update, trozos)
+        await enviar_final(update, mensaje, response)
+        print(f"   ⏱️ TTFT {metricas.get('ttft_s')}s | total {metricas.get('total_s')}s")
 
-        try:
-            await update.message.reply_text(response, parse_mode=ParseMode.MARKDOWN)
-        except:
-            await update.message.reply_text(response)
+        await asyncio.to_thread(memoria.agregar, user_id, [
+            {"role": "user", "content": text, "traza": traza_id},
+            {"role": "model", "content": response, "traza": traza_id}])
 
     except Exception as e:
-        print(f"⚠️ Error: {e}")
-        await update.message.reply_text("Error interno.")
+        print(f"⚠️ Error [traza {traza_id}]: {e}")
+        await update.message.reply_text(f"Error interno (ref. {traza_id}).")
 
 async def reset_memory(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    user_histories[user_id] = []
+    await asyncio.to_thread(memoria.borrar, user_id)
     await update.message.reply_text("🧠 Memoria borrada.")
 
 if __name__ == '__main__':
-    print("🤖 BOT ONLINE...")
-    application = ApplicationBuilder().token(TOKEN).build()
+    print(f"🤖 BOT ONLINE... | memoria {memoria.stats()}")
+    iniciar_servidor_metricas()   # /metrics si METRICAS_PUERTO está definido
+    precalentar()                 # Clientes y esquema en segundo plano: el bot ya escucha mientras tanto
+    # concurrent_updates: atiende varios mensajes a la vez (el cerebro ya es async)
+    application = ApplicationBuilder().token(TOKEN).concurrent_updates(True).build()
     application.add_handler(CommandHandler('start', start))
     application.add_handler(CommandHandler('borrar', reset_memory))
     application.add_handler(MessageHandler(filters.TEXT & (~filters.COMMAND), handle_message))
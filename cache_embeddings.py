@@ -0,0 +1,154 @@
+import os
+import time
+import atexit
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+
+# --- CONFIGURACIÓN ---
+RUTA_CACHE = os.environ.get("EMBED_CACHE_PATH", ".cache/embeddings.sqlite")
+MAX_ENTRADAS = int(os.environ.get("EMBED_CACHE_MAX", "200000"))
+HOLGURA = 0.05              # Al pasar el tope se desaloja hasta el 95%: el count(*) corre una vez cada ~5% de inserts
+USOS_POR_LOTE = 500         # `ultimo_uso` de los aciertos se escribe en lotes (o cada USOS_CADA_S)
+USOS_CADA_S = 30.0
+
+class CacheEmbeddings:
+    """
+    Caché persistente de embeddings direccionada por contenido.
+    Clave = sha256(modelo, dimensión, task_type, texto); valor = vector float32 en binario.
+    Tiene tope de entradas con desalojo LRU y contadores de aciertos/fallos.
+    Las lecturas no escriben: el `ultimo_uso` de los aciertos se acumula y se guarda por lotes.
+    """
+
+    def __init__(self, ruta=RUTA_CACHE, max_entradas=MAX_ENTRADAS):
+        if ruta != ":memory:" and os.path.dirname(ruta):
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        self.ruta = ruta
+        self.max_entradas = max_entradas
+        self.aciertos = 0
+        self.fallos = 0
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(ruta, check_same_thread=False)
+        self.db.execute("pragma journal_mode=wal")
+        self.db.execute("""
+            create table if not exists embeddings (
+                clave blob primary key,
+                vector blob not null,
+                ultimo_uso real not null
+            )""")
+        self.db.execute("create index if not exists embeddings_uso on embeddings (ultimo_uso)")
+        self.db.commit()
+        # Estimación de entradas: solo sube con los inserts de este proceso (un "replace" la sobrestima),
+        # y el count(*) real se hace recién cuando pasa el tope
+        self.estimadas = self.db.execute("select count(*) from embeddings").fetchone()[0]
+        self.usos = {}              # clave -> último acierto aún no escrito
+        self.usos_guardados = time.time()
+        atexit.register(self.guardar_usos)
+
+    @staticmethod
+    def clave(model, dimension, task_type, texto):
+        base = f"{model}\x1f{dimension}\x1f{task_type}\x1f{texto}"
+        return hashlib.sha256(base.encode("utf-8")).digest()
+
+    def get_many(self, model, dimension, task_type, textos):
+        """Devuelve una lista alineada con `textos`: vector float32 o None si no está."""
+        claves = [self.clave(model, dimension, task_type, t) for t in textos]
+        encontrados = {}
+        with self.lock:
+            for i in range(0, len(claves), 500):
+                trozo = claves[i:i + 500]
+                marcas = ",".join("?" * len(trozo))
+                for clave, blob in self.db.execute(f"select clave, vector from embeddings where clave in ({marcas})", trozo):
+                    encontrados[clave] = np.frombuffer(blob, dtype=np.float32)
+            ahora = time.time()
+            self.usos.update((c, ahora) for c in encontrados)
+            if len(self.usos) >= USOS_POR_LOTE or (self.usos and ahora - self.usos_guardados > USOS_CADA_S):
+                self._guardar_usos()
+                self.db.commit()
+            self.aciertos += len(encontrados)
+            self.fallos += len(claves) - len(encontrados)
+        return [encontrados.get(c) for c in claves]
+
+    def get(self, model, dimension, task_type, texto):
+        return self.get_many(model, dimension, task_type, [texto])[0]
+
+    def put_many(self, model, dimension, task_type, textos, vectores):
+        ahora = time.time()
+        filas = [
+            (self.clave(model, dimension, task_type, t), np.asarray(v, dtype=np.float32).tobytes(), ahora)
+            for t, v in zip(textos, vectores) if v is not None
+        ]
+        with self.lock:
+            self.db.executemany("insert or replace into embeddings values (?, ?, ?)", filas)
+            self.estimadas += len(filas)
+            if self.estimadas > self.max_entradas: self._desalojar()
+            self.db.commit()
+
+    def put(self, model, dimension, task_type, texto, vector):
+        self.put_many(model, dimension, task_type, [texto], [vector])
+
+    def _guardar_usos(self):
+        if self.usos:
+            self.db.executemany("update embeddings set ultimo_uso = ? where clave = ?",
+                                [(t, c) for c, t in self.usos.items()])
+            self.usos = {}
+        self.usos_guardados = time.time()
+
+    def guardar_usos(self):
+        with self.lock:
+            self._guardar_usos()
+            self.db.commit()
+
+    def _desalojar(self):
+        self._guardar_usos()        # Que el LRU vea los aciertos recientes
+        total = self.db.execute("select count(*) from embeddings").fetchone()[0]
+        if total > self.max_entradas:
+            sobran = total - int(self.max_entradas * (1 - HOLGURA))
+            self.db.execute(
+                "delete from embeddings where clave in (select clave from embeddings order by ultimo_uso limit ?)",
+                (sobran,)
+            )
+            total -= sobran
+        self.estimadas = total
+
+    def stats(self):
+        with self.lock:
+            total = self.db.execute("select count(*) from embeddings").fetchone()[0]
+        consultas = self.aciertos + self.fallos
+        return {
+            "entradas": total,
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "tasa_acierto": self.aciertos / consultas if consultas else 0.0,
+        }
+
+class EmbedderConCache:
+    """Envuelve un embedder (lista de textos -> vectores) y solo le pide los que faltan en caché."""
+
+    def __init__(self, embedder, cache, model, dimension, task_type):
+        self.embedder = embedder
+        self.cache = cache
+        self.model = model
+        self.dimension = dimension
+        self.task_type = task_type
+
+    def __call__(self, textos):
+        textos = list(textos)
+        vectores = self.cache.get_many(self.model, self.dimension, self.task_type, textos)
+        faltan = [i for i, v in enumerate(vectores) if v is None]
+        if faltan:
+            nuevos = self.embedder([textos[i] for i in faltan])
+            for i, v in zip(faltan, nuevos): vectores[i] = v
+            self.cache.put_many(self.model, self.dimension, self.task_type, [textos[i] for i in faltan], nuevos)
+        return vectores
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def obtener_cache():
+    """Caché única por proceso (compartida por ingesta y consultas)."""
+    global _cache
+    with _cache_lock:
+        if _cache is None: _cache = CacheEmbeddings()
+        return _cache
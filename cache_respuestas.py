@@ -0,0 +1,115 @@
+import os
+import re
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+import numpy as np
+
+# --- CONFIGURACIÓN ---
+RUTA_VERSION = os.environ.get("VERSION_DATOS_PATH", ".cache/version_datos")
+TTL_S = float(os.environ.get("RESP_CACHE_TTL", "600"))
+UMBRAL_SIMILITUD = float(os.environ.get("RESP_CACHE_UMBRAL", "0.95"))
+MAX_ENTRADAS = 1000
+
+# --- VERSIÓN DE LOS DATOS (la ingesta la marca, las cachés la leen) ---
+def marcar_datos_cambiados():
+    """La ingesta llama a esto cuando cambia `documentos_dj`: invalida cachés de otros procesos."""
+    if os.path.dirname(RUTA_VERSION): os.makedirs(os.path.dirname(RUTA_VERSION), exist_ok=True)
+    with open(RUTA_VERSION, "w", encoding="utf-8") as f:
+        f.write(str(time.time()))
+
+def version_datos():
+    try: return os.stat(RUTA_VERSION).st_mtime_ns
+    except OSError: return 0
+
+def normalizar_pregunta(q):
+    """Minúsculas, sin tildes ni signos, espacios simples: '¿Cuántas pendientes hay?' -> 'cuantas pendientes hay'."""
+    q = unicodedata.normalize("NFKD", q.lower())
+    q = "".join(c for c in q if not unicodedata.combining(c))
+    return re.sub(r"\s+", " ", re.sub(r"[^\w\s-]", " ", q)).strip()
+
+class CacheRespuestas:
+    """
+    Caché de respuestas delante de `chatear`: acierta por pregunta normalizada idéntica o,
+    dentro de la misma ruta y con la misma `firma` (códigos, años, estados), por similitud
+    de embedding >= `umbral`. Las entradas caducan por TTL y se descartan todas cuando
+    cambia la versión de los datos.
+    """
+
+    def __init__(self, ttl=TTL_S, umbral=UMBRAL_SIMILITUD, max_entradas=MAX_ENTRADAS):
+        self.ttl = ttl
+        self.umbral = umbral
+        self.max_entradas = max_entradas
+        self.entradas = OrderedDict()   # pregunta normalizada -> {ruta, firma, respuesta, vector, expira}
+        self.version = version_datos()
+        self.lock = threading.Lock()
+        self.aciertos_exactos = 0
+        self.aciertos_semanticos = 0
+        self.fallos = 0
+
+    def _vigentes(self):
+        version = version_datos()
+        if version != self.version:
+            self.entradas.clear()
+            self.version = version
+        ahora = time.time()
+        for clave in [c for c, e in self.entradas.items() if e["expira"] < ahora]:
+            del self.entradas[clave]
+
+    def buscar(self, q, ruta=None, vector=None, firma=None):
+        """Respuesta guardada o None. La búsqueda semántica solo corre si se da `ruta` y `vector`."""
+        clave = normalizar_pregunta(q)
+        with self.lock:
+            self._vigentes()
+            entrada = self.entradas.get(clave)
+            if entrada:
+                self.entradas.move_to_end(clave)
+                self.aciertos_exactos += 1
+                return entrada["respuesta"]
+            if ruta and vector is not None:
+                candidatas = [(c, e) for c, e in self.entradas.items()
+                              if e["ruta"] == ruta and e["firma"] == firma and e["vector"] is not None]
+                if candidatas:
+                    matriz = np.stack([e["vector"] for _, e in candidatas])
+                    q_vec = np.asarray(vector, dtype=np.float32)
+                    sims = matriz @ (q_vec / (np.linalg.norm(q_vec) or 1.0))
+                    mejor = int(np.argmax(sims))
+                    if sims[mejor] >= self.umbral:
+                        self.entradas.move_to_end(candidatas[mejor][0])
+                        self.aciertos_semanticos += 1
+                        return candidatas[mejor][1]["respuesta"]
+            self.fallos += 1
+            return None
+
+    def hay_candidatas(self, ruta, firma=None):
+        """Si alguna entrada vigente de `ruta` y `firma` tiene vector (si no, no vale la pena embeber la pregunta)."""
+        with self.lock:
+            self._vigentes()
+            return any(e["ruta"] == ruta and e["firma"] == firma and e["vector"] is not None
+                       for e in self.entradas.values())
+
+    def guardar(self, q, ruta, respuesta, vector=None, firma=None):
+        if vector is not None:
+            vector = np.asarray(vector, dtype=np.float32)
+            vector = vector / (np.linalg.norm(vector) or 1.0)
+        with self.lock:
+            self._vigentes()
+            self.entradas[normalizar_pregunta(q)] = {
+                "ruta": ruta, "firma": firma, "respuesta": respuesta, "vector": vector,
+                "expira": time.time() + self.ttl
+            }
+            while len(self.entradas) > self.max_entradas: self.entradas.popitem(last=False)
+
+    def invalidar(self):
+        with self.lock: self.entradas.clear()
+
+    def stats(self):
+        consultas = self.aciertos_exactos + self.aciertos_semanticos + self.fallos
+        return {
+            "entradas": len(self.entradas),
+            "aciertos_exactos": self.aciertos_exactos,
+            "aciertos_semanticos": self.aciertos_semanticos,
+            "fallos": self.fallos,
+            "tasa_acierto": (self.aciertos_exactos + self.aciertos_semanticos) / consultas if consultas else 0.0,
+        }
@@ -2,11 +2,27 @@ import os
 import json
 import re
 import time
-import google.genai as genai
-from google.genai import types 
-from supabase import create_client, Client
 from dotenv import load_dotenv
 from datetime import datetime, timedelta, timezone
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from cache_embeddings import obtener_cache
+from indice_local import IndiceVectorial
+from embeddings import serializar_vector, DIM_INDICE, FACTOR_CANDIDATOS
+from evidencia import empaquetar_docs, empaquetar_filas, tabla
+from memoria_conversaciones import resumir_local
+from indice_exacto import IndiceExacto
+from indice_lexico import IndiceBM25
+from cache_respuestas import CacheRespuestas, normalizar_pregunta
+from plan_sql import CacheSQL, clausula_anio
+from plantilla_sql import SQL_MODO, ESQUEMA_RESPUESTA, INSTRUCCIONES, leer_respuesta, plantilla_reutilizable, renderizar
+from paginacion_sql import (FILAS_POR_PAGINA, SQL_TIMEOUT_S, sql_pagina, pagina_de,
+                            es_pedido_de_mas, pie_pagina, obtener_cursores)
+from reordenador import RERANK, CANDIDATOS, reordenar
+from resumen_stats import ResumenStats, COL_CLIENTE
+from planificador import obtener_planificador, SistemaSaturado
+from router_local import RouterLocal, ruta_por_palabras
+from trazas import Traza, activar, anotar, span, propagar, con_traza, traza_actual
 
 # --- CARGAR CLAVES ---
 load_dotenv(".env")
@@ -17,14 +33,55 @@ GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
 
 if not GEMINI_API_KEY: raise ValueError("Falta GEMINI_API_KEY en .env")
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-client = genai.Client(api_key=GEMINI_API_KEY)
-
 # --- CONFIGURACIÓN ---
 MODEL_LOGIC = "models/gemini-2.5-flash"
 MODEL_RAG = "models/gemini-3-flash-preview"
 EMBEDDING_MODEL = "models/text-embedding-004"
 TABLE_NAME = "documentos_dj"
+MATCH_THRESHOLD = 0.45
+
+# Backend de búsqueda vectorial: "rpc" (match_documentos en Supabase) o "local" (IndiceVectorial)
+RAG_BACKEND = os.environ.get("RAG_BACKEND", "rpc")
+INDICE_SNAPSHOT = os.environ.get("INDICE_SNAPSHOT", ".cache/indice_documentos")
+INDICE_CUANTIZAR = os.environ.get("INDICE_CUANTIZAR", "0") == "1"
+INDICE_REFRESCO_S = 300
+# Backend de búsqueda exacta: "db" (ILIKE en Supabase) o "local" (IndiceExacto en memoria)
+EXACT_BACKEND = os.environ.get("EXACT_BACKEND", "db")
+ESQUEMA_REFRESCO_S = float(os.environ.get("ESQUEMA_REFRESCO_S", "600"))
+ESQUEMA_REINTENTO_S = 30   # Si la detección falló, se vuelve a intentar pronto (no queda [] para siempre)
+
+# --- CLIENTES (se crean al primer uso, no al importar) ---
+class Perezoso:
+    """
+    Se usa como el cliente mismo (`supabase.table(...)`, `client.models...`), pero lo crea con
+    `fabrica()` recién al primer uso y lo comparte en todo el proceso.
+    """
+
+    def __init__(self, fabrica):
+        self.fabrica = fabrica
+        self.objeto = None
+        self.lock = threading.Lock()
+
+    def obtener(self):
+        if self.objeto is None:
+            with self.lock:
+                if self.objeto is None: self.objeto = self.fabrica()
+        return self.objeto
+
+    def __getattr__(self, nombre):
+        return getattr(self.obtener(), nombre)
+
+def crear_supabase():
+    from supabase import create_client, ClientOptions
+    # El servidor corta el SQL a los SQL_TIMEOUT_S; el cliente no espera mucho más que eso
+    return create_client(SUPABASE_URL, SUPABASE_KEY, options=ClientOptions(postgrest_client_timeout=SQL_TIMEOUT_S + 5))
+
+def crear_gemini():
+    import google.genai as genai
+    return genai.Client(api_key=GEMINI_API_KEY)
+
+supabase = Perezoso(crear_supabase)
+client = Perezoso(crear_gemini)
 
 # --- 0. UTILIDAD DE HORA (NUEVO) ---
 def obtener_hora_lima():
@@ -34,32 +91,102 @@ def obtener_hora_lima():
     return lima_time.strftime("%A %d de %B del %Y, %I:%M %p (Hora Perú)")
 
 # --- 1. SEGURIDAD ---
-def call_gemini_safe(model, prompt, retries=3, notify_callback=None, tools=None):
+MSG_DESCARTADA = "Sistema saturado: hay demasiadas consultas en cola. Intenta en unos segundos."
+
+def esperar_429(model, attempt, notify_callback):
+    """Avisa al planificador del 429 (penaliza al modelo para todos) y espera el backoff con jitter."""
+    wait_time = obtener_planificador().reportar_429(model)
+    msg = f"🚦 IA saturada. Esperando {wait_time:.0f}s... (Intento {attempt+1})"
+    print(f"   {msg}")
+    if notify_callback: notify_callback(msg)
+    with span("espera_429", modelo=model, intento=attempt + 1):
+        time.sleep(wait_time)
+
+def config_herramientas(tools, esquema=None):
+    """GenerateContentConfig con `tools` y/o salida JSON según `esquema` (None si no hay nada); google.genai se importa recién aquí."""
+    if not tools and not esquema: return None
+    from google.genai import types
+    if esquema: return types.GenerateContentConfig(tools=tools, response_mime_type="application/json", response_schema=esquema)
+    return types.GenerateContentConfig(tools=tools)
+
+def call_gemini_safe(model, prompt, retries=3, notify_callback=None, tools=None, esquema=None):
     """
     Función maestra para llamar a la IA. Soporta herramientas (Google Search) y reintentos.
+    Cada intento pasa por el planificador compartido (cuota por modelo, cola por prioridad).
     """
-    for attempt in range(retries):
-        try:
-            config = None
-            if tools:
-                config = types.GenerateContentConfig(tools=tools)
-
-            return client.models.generate_content(
-                model=model, 
-                contents=prompt,
-                config=config
-            ).text.strip()
-            
-        except Exception as e:
-            if "429" in str(e) or "RESOURCE_EXHAUSTED" in str(e):
-                wait_time = 25 
-                msg = f"🚦 IA saturada. Esperando {wait_time}s... (Intento {attempt+1})"
-                print(f"   {msg}")
-                if notify_callback: notify_callback(msg)
-                time.sleep(wait_time)
-            else:
-                return f"Error IA: {str(e)}"
-    return "Sistema saturado. Intenta más tarde."
+    planificador = obtener_planificador()
+    with span("llm", modelo=model, prompt_chars=len(prompt), herramientas=bool(tools)) as s:
+        for attempt in range(retries):
+            s["intentos"] = attempt + 1
+            try:
+                with span("cola", modelo=model): planificador.adquirir(model)
+                config = config_herramientas(tools, esquema)
+
+                texto = client.models.generate_content(
+                    model=model, 
+                    contents=prompt,
+                    config=config
+                ).text.strip()
+                planificador.reportar_exito(model)
+                s["respuesta_chars"] = len(texto)
+                return texto
+                
+            except SistemaSaturado as e:
+                print(f"   🚦 Descartada: {e}")
+                s["descartada"] = True
+                if notify_callback: notify_callback("🚦 Mucha demanda ahora mismo, intenta en unos segundos.")
+                return MSG_DESCARTADA
+            except Exception as e:
+                if "429" in str(e) or "RESOURCE_EXHAUSTED" in str(e):
+                    esperar_429(model, attempt, notify_callback)
+                else:
+                    s["error"] = str(e)
+                    return f"Error IA: {str(e)}"
+        return "Sistema saturado. Intenta más tarde."
+
+def call_gemini_stream(model, prompt, retries=3, notify_callback=None, tools=None):
+    """
+    Como `call_gemini_safe`, pero entrega el texto por trozos a medida que llega.
+    Solo reintenta los 429 antes del primer trozo (después ya no se puede repetir).
+    """
+    planificador = obtener_planificador()
+    with span("llm", modelo=model, prompt_chars=len(prompt), herramientas=bool(tools), stream=True) as s:
+        s["respuesta_chars"] = 0
+        for attempt in range(retries):
+            s["intentos"] = attempt + 1
+            emitido = False
+            try:
+                with span("cola", modelo=model): planificador.adquirir(model)
+                config = config_herramientas(tools)
+                for chunk in client.models.generate_content_stream(model=model, contents=prompt, config=config):
+                    if chunk.text:
+                        emitido = True
+                        s["respuesta_chars"] += len(chunk.text)
+                        yield chunk.text
+                planificador.reportar_exito(model)
+                return
+            except SistemaSaturado as e:
+                print(f"   🚦 Descartada: {e}")
+                s["descartada"] = True
+                yield MSG_DESCARTADA
+                return
+            except Exception as e:
+                if emitido:
+                    s["error"] = str(e)
+                    yield f"\n[Respuesta cortada: {e}]"
+                    return
+                if "429" in str(e) or "RESOURCE_EXHAUSTED" in str(e):
+                    esperar_429(model, attempt, notify_callback)
+                else:
+                    s["error"] = str(e)
+                    yield f"Error IA: {str(e)}"
+                    return
+        yield "Sistema saturado. Intenta más tarde."
+
+def responder(model, prompt, cb, stream=False, tools=None):
+    """Paso final (narración): el texto completo o, con `stream`, un generador de trozos."""
+    if stream: return call_gemini_stream(model, prompt, notify_callback=cb, tools=tools)
+    return call_gemini_safe(model, prompt, notify_callback=cb, tools=tools)
 
 # --- 2. HERRAMIENTAS DB ---
 def detectar_esquema_db():
@@ -69,121 +196,340 @@ def detectar_esquema_db():
         return []
     except: return []
 
-COLUMNAS_REALES = detectar_esquema_db()
+class Esquema:
+    """
+    Columnas de metadata de la tabla: se detectan al primer uso y se refrescan cada `refresco` s.
+    Vencidas, se siguen sirviendo mientras un hilo aparte las vuelve a leer (la consulta a la DB
+    nunca se hace con el lock tomado). Si la DB no responde se conservan las últimas conocidas y
+    se reintenta en ESQUEMA_REINTENTO_S.
+    """
+
+    def __init__(self, refresco=ESQUEMA_REFRESCO_S):
+        self.refresco = refresco
+        self.columnas = []
+        self.expira = 0.0
+        self.refrescando = False
+        self.primera = threading.Event()    # Hasta la primera detección no hay nada que servir
+        self.lock = threading.Lock()
 
-def obtener_estados_validos():
-    try:
-        resp = supabase.table(TABLE_NAME).select("metadata").limit(200).execute()
-        estados = set()
-        if resp.data:
-            for d in resp.data:
-                estado = d['metadata'].get('estado de oferta')
-                if estado: estados.add(str(estado).upper())
-        return list(estados)
-    except:
-        return ["PENDIENTE", "ADJUDICADO", "NO ADJUDICADO"]
+    def obtener(self):
+        with self.lock:
+            vencidas = time.time() >= self.expira and not self.refrescando
+            if vencidas: self.refrescando = True
+        if vencidas and self.primera.is_set():
+            threading.Thread(target=self._refrescar, daemon=True).start()
+        elif vencidas:
+            self._refrescar()
+        else:
+            self.primera.wait(timeout=ESQUEMA_REINTENTO_S)
+        return self.columnas
+
+    def _refrescar(self):
+        nuevas = detectar_esquema_db()
+        with self.lock:
+            if nuevas: self.columnas = nuevas
+            self.expira = time.time() + (self.refresco if nuevas else ESQUEMA_REINTENTO_S)
+            self.refrescando = False
+        self.primera.set()
+
+    def invalidar(self):
+        with self.lock: self.expira = 0.0
+
+ESQUEMA = Esquema()
+
+def columnas_reales():
+    return ESQUEMA.obtener()
+
+def limpiar_sql(sql_query):
+    """Quita los ``` del modelo y el ';'. Devuelve None si no es un SELECT."""
+    clean_sql = re.sub(r"```sql|```", "", sql_query, flags=re.IGNORECASE).strip().replace(";", "")
+    return clean_sql if clean_sql.lower().startswith("select") else None
 
 def execute_sql_query(sql_query):
     try:
-        clean_sql = re.sub(r"```sql|```", "", sql_query, flags=re.IGNORECASE).strip().replace(";", "")
-        if not clean_sql.lower().startswith("select"): return "Error: SQL inválido."
+        clean_sql = limpiar_sql(sql_query)
+        if not clean_sql: return "Error: SQL inválido."
         print(f"   [Debug SQL]: {clean_sql}") 
-        resp = supabase.rpc("query_exec", {"query": clean_sql}).execute()
+        with span("db.query_exec", sql_chars=len(clean_sql)) as s:
+            resp = supabase.rpc("query_exec", {"query": clean_sql}).execute()
+            s["filas"] = len(resp.data) if isinstance(resp.data, list) else 1
         return resp.data
     except Exception as e: return f"Error DB: {str(e)}"
 
+def ejecutar_pagina(sql_query, cursor=None):
+    """
+    Una página del SELECT (tope FILAS_POR_PAGINA en el servidor) en una sola llamada: {"filas", "desde",
+    "total", "hay_mas", "clave", "repetidas"}, o el texto de error. Sin `cursor` es la primera página
+    (y trae el total); con el cursor guardado, la siguiente.
+    """
+    clean_sql = limpiar_sql(sql_query)
+    if not clean_sql: return "Error: SQL inválido."
+    res = execute_sql_query(sql_pagina(clean_sql, FILAS_POR_PAGINA, cursor))
+    if isinstance(res, str): return res
+    return pagina_de(res, cursor)
+
 # --- 3. BUSCADOR VECTORIAL/EXACTO ---
 def get_embedding(text):
-    try:
-        resp = client.models.embed_content(model=EMBEDDING_MODEL, contents=text)
-        return resp.embeddings[0].values
-    except: return []
+    with span("embedding", modelo=EMBEDDING_MODEL, texto_chars=len(text)) as s:
+        cache = obtener_cache()
+        guardado = cache.get(EMBEDDING_MODEL, None, None, text)
+        s["cache"] = guardado is not None
+        if guardado is not None: return guardado.tolist()
+        try:
+            with span("cola", modelo=EMBEDDING_MODEL): obtener_planificador().adquirir(EMBEDDING_MODEL)
+            resp = client.models.embed_content(model=EMBEDDING_MODEL, contents=text)
+            vector = resp.embeddings[0].values
+            cache.put(EMBEDDING_MODEL, None, None, text, vector)
+            return vector
+        except Exception as e:
+            s["error"] = str(e)
+            return []
 
-def search_exact_flexible(query):
-    resultados = []
-    ids_encontrados = set()
+def extraer_tokens(query):
+    """Códigos (OF-.., SZ-..) y números de la pregunta, para la búsqueda exacta."""
     patron_txt = re.findall(r"\b((?:OF|SZ|SZ\d)-[\w\d_.-]+)\b", query, re.IGNORECASE)
     patron_num = re.findall(r"\b(\d+)\b", query)
-    tokens = set(patron_txt + patron_num)
+    return set(patron_txt + patron_num)
 
-    if not tokens: return []
-    
+def columnas_codigo():
+    return [c for c in columnas_reales() if "codigo" in c or "oferta" in c]
+
+def busquedas_exactas(tokens):
+    """Pares (etiqueta, columna, operador, token) en el orden de prioridad de la búsqueda exacta."""
+    pares = []
     for token in tokens:
-        cols_codigo = [c for c in COLUMNAS_REALES if "codigo" in c or "oferta" in c]
-        for col in cols_codigo:
-            try:
-                res = supabase.table(TABLE_NAME).select("*").ilike(f"metadata->>{col}", f"%{token}%").execute()
-                for d in res.data:
-                    if d['id'] not in ids_encontrados:
-                        d['source_type'] = f"EXACTO ({col})"
-                        resultados.append(d)
-                        ids_encontrados.add(d['id'])
-            except: pass
-        
-        if token.isdigit() and "id_excel" in COLUMNAS_REALES:
-            try:
-                res = supabase.table(TABLE_NAME).select("*").eq("metadata->>id_excel", token).execute()
-                for d in res.data:
-                    if d['id'] not in ids_encontrados:
-                        d['source_type'] = "ID EXCEL"
-                        resultados.append(d)
-                        ids_encontrados.add(d['id'])
-            except: pass
+        for col in columnas_codigo():
+            pares.append((f"EXACTO ({col})", col, "ilike", token))
+        if token.isdigit() and "id_excel" in columnas_reales():
+            pares.append(("ID EXCEL", "id_excel", "eq", token))
+    return pares
+
+def filtro_or(pares):
+    """Junta todos los pares en UN filtro `or` de PostgREST (valores entre comillas por los '.')."""
+    partes = []
+    for _, col, op, token in pares:
+        valor = f'"*{token}*"' if op == "ilike" else f'"{token}"'
+        partes.append(f"metadata->>{col}.{op}.{valor}")
+    return ",".join(partes)
+
+def comparador_par(op, token):
+    """Replica localmente el filtro de la DB (ILIKE '%token%', donde '_' es comodín, o igualdad)."""
+    if op == "eq": return lambda val: val == token
+    patron = ".*".join(".".join(re.escape(p) for p in trozo.split("_")) for trozo in token.split("%"))
+    return re.compile(patron, re.IGNORECASE | re.DOTALL).search
+
+def etiquetar_exactos(filas, pares):
+    """Asigna a cada fila la etiqueta del primer par que la encuentra (como si fueran consultas separadas)."""
+    resultados, ids_encontrados = [], set()
+    for etiqueta, col, op, token in pares:
+        coincide = comparador_par(op, token)
+        for d in filas:
+            if d['id'] not in ids_encontrados and col in (d.get('metadata') or {}) and coincide(str(d['metadata'][col])):
+                d['source_type'] = etiqueta
+                resultados.append(d)
+                ids_encontrados.add(d['id'])
+    return resultados
+
+def _consulta_par(par):
+    _, col, op, token = par
+    try:
+        if op == "eq": return supabase.table(TABLE_NAME).select("*").eq(f"metadata->>{col}", token).execute().data
+        return supabase.table(TABLE_NAME).select("*").ilike(f"metadata->>{col}", f"%{token}%").execute().data
+    except: return []
+
+_indice_exacto = None
+_indice_exacto_refrescado = 0.0
+_indice_exacto_lock = threading.Lock()
+
+def obtener_indice_exacto():
+    """Índice exacto del proceso: se construye una vez y se refresca cada INDICE_REFRESCO_S."""
+    global _indice_exacto, _indice_exacto_refrescado
+    with _indice_exacto_lock:
+        if _indice_exacto is None:
+            _indice_exacto = IndiceExacto()
+            _indice_exacto_refrescado = time.time()
+            _indice_exacto.cargar_desde_supabase(supabase, TABLE_NAME)
+            print(f"   📇 Índice exacto construido ({len(_indice_exacto)} docs)")
+        elif time.time() - _indice_exacto_refrescado > INDICE_REFRESCO_S:
+            _indice_exacto_refrescado = time.time()
+            try: _indice_exacto.refrescar(supabase, TABLE_NAME)
+            except Exception as e: print(f"   ⚠️ No se pudo refrescar el índice exacto: {e}")
+        return _indice_exacto
+
+_indice_lexico = None       # (índice, docs, versión): se reemplaza entero, nunca se modifica en el lugar
+_indice_lexico_lock = threading.Lock()
+
+def obtener_indice_lexico():
+    """
+    BM25 sobre `content` con los docs del índice exacto. Cuando ese se refresca se arma un índice
+    nuevo y se publica de una vez: quien ya tenía el anterior sigue leyéndolo sin carreras. (índice, docs).
+    """
+    global _indice_lexico
+    exacto = obtener_indice_exacto()
+    actual = _indice_lexico
+    if actual is not None and actual[2] == _indice_exacto_refrescado: return actual[0], actual[1]
+    with _indice_lexico_lock:
+        if _indice_lexico is None or _indice_lexico[2] != _indice_exacto_refrescado:
+            version, docs = _indice_exacto_refrescado, exacto.docs
+            indice = IndiceBM25()
+            indice.agregar(docs.values())
+            _indice_lexico = (indice, docs, version)
+            print(f"   🔤 Índice BM25 armado ({len(indice)} docs)")
+        return _indice_lexico[0], _indice_lexico[1]
+
+def search_exact_flexible(query):
+    tokens = extraer_tokens(query)
+    if not tokens: return []
+    pares = busquedas_exactas(tokens)
+    if not pares: return []
+    with span("db.exacta", backend=EXACT_BACKEND, pares=len(pares)) as s:
+        resultados = _buscar_exactos(pares)
+        s["filas"] = len(resultados)
+        return resultados
+
+def _buscar_exactos(pares):
+    if EXACT_BACKEND == "local":
+        try:
+            return etiquetar_exactos(obtener_indice_exacto().candidatos(pares), pares)
+        except Exception as e:
+            print(f"   ⚠️ Índice exacto no disponible ({e}); usando la DB.")
+
+    # Una sola consulta para todos los tokens x columnas
+    try:
+        res = supabase.table(TABLE_NAME).select("*").or_(filtro_or(pares)).execute()
+        return etiquetar_exactos(res.data or [], pares)
+    except Exception as e:
+        print(f"   ⚠️ Filtro combinado falló ({e}); consultando por separado.")
+
+    # Respaldo: una consulta por par, todas en paralelo
+    with ThreadPoolExecutor(max_workers=min(8, len(pares))) as pool:
+        respuestas = list(pool.map(_consulta_par, pares))
+    resultados, ids_encontrados = [], set()
+    for (etiqueta, _, _, _), filas in zip(pares, respuestas):
+        for d in filas or []:
+            if d['id'] not in ids_encontrados:
+                d['source_type'] = etiqueta
+                resultados.append(d)
+                ids_encontrados.add(d['id'])
     return resultados
 
-def search_vector(query_text, top_k=5):
+_indice = None
+_indice_refrescado = 0.0
+_indice_lock = threading.Lock()
+
+def obtener_indice_local():
+    """Índice vectorial del proceso: se carga del snapshot (o de Supabase) y se refresca cada INDICE_REFRESCO_S."""
+    global _indice, _indice_refrescado
+    with _indice_lock:
+        if _indice is None:
+            # Mismo prefijo Matryoshka que el índice de Supabase (DIM_INDICE); 768 = vector completo
+            dim = DIM_INDICE if DIM_INDICE < 768 else None
+            if IndiceVectorial.existe(INDICE_SNAPSHOT):
+                try:
+                    _indice = IndiceVectorial.cargar(INDICE_SNAPSHOT)
+                    print(f"   📦 Índice local cargado del snapshot ({len(_indice)} docs)")
+                except (OSError, ValueError, KeyError) as e: print(f"   ⚠️ Snapshot ilegible ({e}): se reconstruye")
+                if _indice is not None and (_indice.cuantizar, _indice.dim) != (INDICE_CUANTIZAR, dim):
+                    print(f"   ⚠️ El snapshot es cuantizar={_indice.cuantizar}, dim={_indice.dim} y la configuración "
+                          f"pide cuantizar={INDICE_CUANTIZAR}, dim={dim}: se reconstruye")
+                    _indice = None
+            if _indice is None:
+                _indice = IndiceVectorial(cuantizar=INDICE_CUANTIZAR, dim=dim)
+                _indice_refrescado = time.time()
+                _indice.cargar_desde_supabase(supabase, TABLE_NAME)
+                _indice.guardar(INDICE_SNAPSHOT)
+                print(f"   📦 Índice local construido ({len(_indice)} docs)")
+        if time.time() - _indice_refrescado > INDICE_REFRESCO_S:
+            _indice_refrescado = time.time()
+            try:
+                if _indice.refrescar(supabase, TABLE_NAME): _indice.guardar(INDICE_SNAPSHOT)
+            except Exception as e: print(f"   ⚠️ No se pudo refrescar el índice: {e}")
+        return _indice
+
+def args_match(vec, top_k):
+    """Parámetros de `match_documentos`; el vector viaja como texto compacto, no como JSON de floats."""
+    args = {"query_embedding": serializar_vector(vec), "match_threshold": MATCH_THRESHOLD, "match_count": top_k}
+    # La versión con re-orden (analisis.py con DIM_INDICE < 768) acepta el factor de candidatos
+    if DIM_INDICE < 768: args["factor_candidatos"] = FACTOR_CANDIDATOS
+    return args
+
+def search_vector(query_text, top_k=5, tiempos=None):
+    t0 = time.perf_counter()
     vec = get_embedding(query_text)
+    if tiempos is not None: tiempos["embedding_ms"] = round((time.perf_counter() - t0) * 1000, 1)
     if not vec: return []
+    t0 = time.perf_counter()
     try:
-        return supabase.rpc("match_documentos", {"query_embedding": vec, "match_threshold": 0.45, "match_count": top_k}).execute().data or []
+        with span("db.vector", backend=RAG_BACKEND, top_k=top_k) as s:
+            if RAG_BACKEND == "local":
+                docs = obtener_indice_local().buscar(vec, MATCH_THRESHOLD, top_k)
+            else:
+                docs = supabase.rpc("match_documentos", args_match(vec, top_k)).execute().data or []
+            s["filas"] = len(docs)
+            return docs
     except: return []
+    finally:
+        if tiempos is not None: tiempos["vector_ms"] = round((time.perf_counter() - t0) * 1000, 1)
 
-def format_history(history):
+def format_history(history, ventana=6):
+    """Últimos `ventana` mensajes; lo anterior va como resumen rodante (el de la memoria del bot, si viene)."""
     if not history: return "Sin historial."
-    return "\n".join([f"{'USER' if m['role']=='user' else 'IA'}: {m['content']}" for m in history[-6:]])
+    resumen = history[0]["content"] if history[0]["role"] == "resumen" else ""
+    mensajes = [m for m in history if m["role"] != "resumen"]
+    if len(mensajes) > ventana: resumen = resumir_local(resumen, mensajes[:-ventana])
+    recientes = "\n".join([f"{'USER' if m['role']=='user' else 'IA'}: {m['content']}" for m in mensajes[-ventana:]])
+    return f"RESUMEN DE LO ANTERIOR:\n{resumen}\n---\n{recientes}" if resumen else recientes
 
 # --- 4. ROUTER INTELIGENTE ---
-def decide_route(q, history, cb):
-    q_lower = q.lower()
-
-    # RUTA 1: BASE DE DATOS (Fast-Path)
-    # Palabras clave del negocio fuerzan SQL.
-    keywords_db = [
-        "pendiente", "adjudicad", "ganad", "perdid", "oferta", "licitacion", 
-        "cliente", "202", "201", "200", "estado", "codigo", "id", "of-", "sz-", 
-        "disponible", "vigente", "proceso", "base de datos"
-    ]
-    for kw in keywords_db:
-        if kw in q_lower: return "SQL"
-
-    # RUTA 2: WEB (Fast-Path)
-    # Consultas de internet.
-    keywords_web = [
-        "hora", "clima", "tiempo", "noticia", "dolar", "dólar", "precio", 
-        "busca en google", "quién es", "cuando es", "resultados del", 
-        "actualidad", "hoy"
-    ]
-    for kw in keywords_web:
-        if kw in q_lower: return "WEB"
-
-    # RUTA 3: IA DECIDE
+def prompt_router(q, history):
     hist = format_history(history)
-    prompt = f"""
+    return f"""
     Router. HISTORIAL: {hist}\nPREGUNTA: '{q}'
     Clasifica:
     1. 'SQL': Preguntas sobre la empresa, licitaciones, ofertas internas.
     2. 'WEB': Preguntas de cultura general actual, clima, hora, noticias.
     3. 'GENERAL': Chistes, saludos, consejos, filosofía.
     Respuesta (SOLO PALABRA):"""
-    return call_gemini_safe(MODEL_LOGIC, prompt, notify_callback=cb).upper()
+
+ROUTER_LOCAL = RouterLocal()
+
+def texto_router(q, history):
+    """Las preguntas de seguimiento cortas ("¿y cuáles?") se clasifican junto al último mensaje del usuario."""
+    previas = [m["content"] for m in history or [] if m["role"] == "user"]
+    if previas and len(q.split()) <= 3: return f"{previas[-1]} {q}"
+    return q
+
+def ruta_local(q, history):
+    """RUTA 1/2: palabras clave; RUTA 3: clasificador local. None si ninguno está seguro."""
+    ruta = ruta_por_palabras(q)
+    if ruta: return ruta
+    mencion = RESUMEN.valor_mencionado(q)   # Nombra un cliente o estado real del catálogo
+    if mencion:
+        print(f"   [Router catálogo]: SQL ({mencion[0]} = {mencion[1]})")
+        return "SQL"
+    ruta, confianza = ROUTER_LOCAL.clasificar(texto_router(q, history))
+    print(f"   [Router local]: {ruta or 'dudoso'} ({confianza:.2f})")
+    return ruta
+
+def decide_route(q, history, cb):
+    with span("router") as s:
+        ruta = ruta_local(q, history)
+        s["decide"] = "local" if ruta else "llm"
+        if ruta: return ruta
+
+        # RUTA 4: IA DECIDE (y la decisión queda como ejemplo para el clasificador)
+        ruta = call_gemini_safe(MODEL_LOGIC, prompt_router(q, history), notify_callback=cb).upper()
+        ROUTER_LOCAL.registrar(q, ruta)
+        return ruta
 
 # --- 5. AGENTE WEB (CON HORA LOCAL) ---
-def response_web(q, history, cb):
-    print("   [Modo]: WEB SEARCH (Google)")
+def herramientas_web():
+    from google.genai import types
+    return [types.Tool(google_search=types.GoogleSearch())]
+
+def prompt_web(q, history):
     hora_actual = obtener_hora_lima() # <--- AQUÍ LA CLAVE
-    
-    google_search_tool = [types.Tool(google_search=types.GoogleSearch())]
-    prompt = f"""
+    return f"""
     Responde a la pregunta del usuario usando Google Search.
     
     CONTEXTO OBLIGATORIO:
@@ -195,16 +541,19 @@ def response_web(q, history, cb):
     
     Sé directo y útil.
     """
-    return call_gemini_safe(MODEL_LOGIC, prompt, notify_callback=cb, tools=google_search_tool)
+
+def response_web(q, history, cb, stream=False):
+    print("   [Modo]: WEB SEARCH (Google)")
+    return responder(MODEL_LOGIC, prompt_web(q, history), cb, stream, tools=herramientas_web())
 
 # --- 6. AGENTE SQL (CORPORATIVO) ---
-def response_sql(q, history, cb):
-    print("   [Modo]: SQL")
-    keys_json = ', '.join(COLUMNAS_REALES)
-    
-    prompt = f"""
+def prompt_sql(q, history):
+    keys_json = ', '.join(columnas_reales())
+    return f"""
     ERES UN EXPERTO EN SQL POSTGRESQL. TABLA: '{TABLE_NAME}'.
     CLAVES METADATA: {keys_json}.
+    VALORES REALES (catálogo, con cantidad de filas):
+{RESUMEN.texto_catalogo()}
     
     HISTORIAL: {format_history(history)}
     PREGUNTA: '{q}'
@@ -214,9 +563,9 @@ def response_sql(q, history, cb):
     
     2. **FECHAS Y AÑOS (REGLA MAESTRA):**
        - ¡NO USES COLUMNAS DE FECHA! BUSCA EN EL CÓDIGO DE OFERTA.
-       - Si piden "del 2024" -> `(metadata->>'codigo de oferta' ILIKE '%OF-24%' OR metadata->>'codigo de oferta' ILIKE '%_24%')`
-       - Si piden "del 2017" -> `(metadata->>'codigo de oferta' ILIKE '%OF-17%' OR metadata->>'codigo de oferta' ILIKE '%_17%')`
-       - Si hay códigos SZ, busca `_XX` al final (ej: `SZ%_17`).
+       - Si piden "del 2024" -> `{clausula_anio('24')}`
+       - Si piden "del 2017" -> `{clausula_anio('17')}`
+       - Si hay códigos SZ, busca `\\_XX` al final (ej: `SZ%\\_17`): el `_` suelto es comodín en ILIKE.
        
     3. **ESTADOS (LÓGICA EXACTA):**
        - "Adjudicadas" -> `metadata->>'estado de oferta' ILIKE '%ADJUDICAD%' AND metadata->>'estado de oferta' NOT ILIKE '%NO%'`
@@ -227,75 +576,226 @@ def response_sql(q, history, cb):
     4. **ANTI-CONTAMINACIÓN:**
        - Si la pregunta NO especifica año, NO filtres por año (aunque el historial lo mencione). Cuenta el TOTAL HISTÓRICO.
     
+    5. **LISTAS:** el resultado se pagina solo ({FILAS_POR_PAGINA} filas por página, con el total).
+       - No agregues LIMIT salvo que pidan "los N primeros"; usa ORDER BY si el orden importa.
+    
     Genera SOLO SQL.
     """
-    sql = call_gemini_safe(MODEL_LOGIC, prompt, notify_callback=cb)
-    
-    if "SELECT" not in sql.upper():
-         return response_hybrid_rag(q, history, cb)
 
-    res = execute_sql_query(sql)
-    
-    if isinstance(res, str): return f"Error SQL: {res}"
-    
-    if not res or (isinstance(res, list) and len(res) == 0) or (isinstance(res, list) and len(res)==1 and res[0].get('count') == 0):
-        estados_reales = obtener_estados_validos()
-        prompt_sugerencia = f"""
+def prompt_sql_plantilla(q, history):
+    """El mismo prompt de SQL, pero pide también cómo contar el resultado (salida JSON)."""
+    return prompt_sql(q, history).replace("Genera SOLO SQL.", INSTRUCCIONES)
+
+def narrar_local(respuesta, pagina):
+    """Respuesta armada con la plantilla del modelo (sin segunda llamada), o None si hay que narrar."""
+    with span("narracion_local") as s:
+        texto = renderizar(respuesta, pagina["filas"], total=pagina["total"])
+        s["local"] = texto is not None
+    if texto is not None: anotar(narracion="local")
+    return texto
+
+# Paginación: las páginas siguientes ("muéstrame más") salen del cursor, sin LLM
+def recordar_pagina(q, sql, pagina, respuesta):
+    """Si quedan filas, guarda el cursor con la traza de esta respuesta. Devuelve el pie de página."""
+    traza = traza_actual()
+    if pagina["hay_mas"]:
+        anotar(paginada=True)
+        if traza is not None:
+            obtener_cursores().guardar(traza.id, limpiar_sql(sql), pagina["desde"] + len(pagina["filas"]),
+                                       pagina["total"], respuesta, q, pagina["clave"], pagina["repetidas"])
+    return pie_pagina(pagina)
+
+def con_pie(resp, pie):
+    """Agrega el pie de página a la respuesta (texto o generador de trozos)."""
+    if not pie: return resp
+    if isinstance(resp, str): return resp + pie
+    def trozos():
+        yield from resp
+        yield pie
+    return trozos()
+
+def texto_pagina(cursor, pagina):
+    """Página siguiente con la misma plantilla de la primera (o en tabla): sin LLM."""
+    if not pagina["filas"]: return "No hay más filas en esa lista."
+    pie = recordar_pagina(cursor["pregunta"], cursor["sql"], pagina, cursor["respuesta"])
+    texto = renderizar(cursor["respuesta"], pagina["filas"], total=pagina["total"]) if cursor["respuesta"] else None
+    return (texto or tabla(pagina["filas"])) + pie
+
+def siguiente_pagina(q, history):
+    """Respuesta a "muéstrame más" si la última respuesta era una lista con más páginas; si no, None."""
+    if not es_pedido_de_mas(q): return None
+    cursor = obtener_cursores().del_historial(history)
+    if cursor is None: return None
+    anotar(ruta="SQL", origen_sql="cursor")
+    print(f"   [Paginación]: filas desde {cursor['desde'] + 1} (sin LLM)")
+    pagina = ejecutar_pagina(cursor["sql"], cursor)
+    if isinstance(pagina, str): return f"Error SQL: {pagina}"
+    return texto_pagina(cursor, pagina)
+
+def es_resultado_vacio(res):
+    return not res or (isinstance(res, list) and len(res) == 0) or (isinstance(res, list) and len(res)==1 and res[0].get('count') == 0)
+
+def prompt_sugerencia(q, valores_reales):
+    return f"""
         Usuario buscó: "{q}". SQL dio 0 resultados.
-        ESTADOS REALES: {json.dumps(estados_reales)}
-        INSTRUCCIONES: Di que no hay coincidencias y sugiere un estado real.
+        VALORES REALES (con cantidad de ofertas):
+{valores_reales}
+        INSTRUCCIONES: Di que no hay coincidencias y sugiere un valor real parecido (estado, cliente o año).
         """
-        return call_gemini_safe(MODEL_RAG, prompt_sugerencia, notify_callback=cb)
 
-    narracion = f"Pregunta: {q}\nDatos: {json.dumps(res, ensure_ascii=False)}\nResponde natural. Si es lista: * [CODIGO]: [CLIENTE] ([ESTADO])"
-    return call_gemini_safe(MODEL_RAG, narracion, notify_callback=cb)
+def prompt_narracion_sql(q, res, pagina=None):
+    filas = res if isinstance(res, list) else [res] if isinstance(res, dict) else None
+    if filas is None or not all(isinstance(f, dict) for f in filas):
+        return f"Pregunta: {q}\nDatos: {json.dumps(res, ensure_ascii=False)}\nResponde natural. Si es lista: * [CODIGO]: [CLIENTE] ([ESTADO])"
+    # Tabla compacta (o agregados + primeras filas si no cabe en el presupuesto del modelo)
+    with span("evidencia", tipo="sql") as s:
+        datos, stats = empaquetar_filas(filas, MODEL_RAG)
+        s.update(stats)
+    nota = "" if stats["incluidas"] == stats["filas"] else "\nNo se listan todas las filas: para totales usa los agregados y avisa que hay más."
+    cuantas = f"{stats['filas']} filas"
+    if pagina and pagina["hay_mas"]:
+        total = pagina["total"] if pagina["total"] is not None else f"más de {len(filas)}"
+        cuantas = f"primeras {len(filas)} de {total} filas"
+        nota += f"\nEs solo la primera página: el total real es {total}. No inventes las filas que faltan."
+    return f"Pregunta: {q}\nDatos ({cuantas}):\n{datos}\nResponde natural. Si es lista: * [CODIGO]: [CLIENTE] ([ESTADO]){nota}"
+
+PLANES_SQL = CacheSQL()
+RESUMEN = ResumenStats(supabase, tabla=TABLE_NAME)   # Resumen precalculado + catálogo de valores
+
+def response_sql(q, history, cb, stream=False):
+    print("   [Modo]: SQL")
+    # Conteos/listas por estado, año y cliente salen del resumen precalculado (sin LLM ni SQL)
+    directa = RESUMEN.responder(q) if es_cacheable(q, history) else None
+    if directa:
+        print("   [Resumen]: respondido desde el resumen precalculado")
+        anotar(origen_sql="resumen")
+        return directa
+
+    plan, respuesta = PLANES_SQL.buscar_con_respuesta(q) if es_cacheable(q, history) else (None, None)
+    if plan:
+        anotar(origen_sql="plan")
+        sql, pagina = plan, ejecutar_pagina(plan)
+        PLANES_SQL.registrar_uso(not isinstance(pagina, str))
+        if isinstance(pagina, str): plan = None   # Plan viejo que ya no sirve: se genera de nuevo
+        else: print(f"   [Plan SQL]: reutilizado sin LLM {PLANES_SQL.stats()}")
+
+    if not plan:
+        anotar(origen_sql="llm")
+        if SQL_MODO == "plantilla":
+            # Una sola llamada: el SQL y la plantilla de la respuesta (salida estructurada)
+            respuesta = leer_respuesta(call_gemini_safe(MODEL_LOGIC, prompt_sql_plantilla(q, history), notify_callback=cb,
+                                                        esquema=ESQUEMA_RESPUESTA))
+            sql = respuesta["sql"]
+        else:
+            respuesta, sql = None, call_gemini_safe(MODEL_LOGIC, prompt_sql(q, history), notify_callback=cb)
+        
+        if "SELECT" not in sql.upper():
+             return response_hybrid_rag(q, history, cb, stream)
+
+        pagina = ejecutar_pagina(sql)
+        
+        if isinstance(pagina, str): return f"Error SQL: {pagina}"
+        if es_cacheable(q, history): PLANES_SQL.guardar(q, limpiar_sql(sql), plantilla_reutilizable(respuesta))
+
+    # Solo viaja la primera página (+ el total); el resto, con "muéstrame más"
+    res = pagina["filas"]
+    pie = recordar_pagina(q, sql, pagina, respuesta)
+    local = narrar_local(respuesta, pagina)
+    if local is not None: return local + pie
+
+    if es_resultado_vacio(res):
+        return responder(MODEL_RAG, prompt_sugerencia(q, RESUMEN.texto_catalogo()), cb, stream)
+
+    return con_pie(responder(MODEL_RAG, prompt_narracion_sql(q, res, pagina), cb, stream), pie)
 
 # --- 7. AGENTE RAG ---
-def response_hybrid_rag(q, history, cb):
-    q_ctx = q
-    if len(history)>0 and len(q.split())<4: q_ctx = f"{q} (Contexto: {history[-1]['content']})"
+def query_con_contexto(q, history):
+    """Preguntas cortas de seguimiento se amplían con el último mensaje."""
+    if len(history)>0 and len(q.split())<4: return f"{q} (Contexto: {history[-1]['content']})"
+    return q
 
-    exact = search_exact_flexible(q)
-    vec = search_vector(q_ctx)
-    
+def combinar_resultados(exact, vec):
     combined = []
     ids = set()
     for d in exact:
         if d['id'] not in ids: combined.append(d); ids.add(d['id'])
     for d in vec:
         if d['id'] not in ids: d['source_type'] = "VECTOR"; combined.append(d); ids.add(d['id'])
+    return combined
 
-    evidencia = ""
-    for d in combined:
-        meta = d.get('metadata', {})
-        evidencia += f"--- DOC ({d.get('source_type')}) ---\nMeta: {json.dumps(meta, ensure_ascii=False)}\nTexto: {d.get('content')}\n"
+def reordenar_hibrido(q_busqueda, exact, vec):
+    """
+    Exactos + vectoriales + BM25 fusionados con RRF en un top-k sin duplicados (RERANK=1),
+    o la unión en orden de llegada como antes (RERANK=0).
+    """
+    if not RERANK: return combinar_resultados(exact, vec)
+    with span("reordenado", exactos=len(exact), vectoriales=len(vec)) as s:
+        try: indice, docs = obtener_indice_lexico()
+        except Exception as e:
+            print(f"   ⚠️ Índice BM25 no disponible ({e}); solo RRF de exactos y vectoriales.")
+            indice, docs = None, None
+        try: elegidos, stats = reordenar(q_busqueda, exact, vec, indice, docs)
+        except Exception as e:
+            print(f"   ⚠️ Reordenado falló ({e}); evidencia en orden de llegada.")
+            s["error"] = str(e)
+            return combinar_resultados(exact, vec[:5])
+        s.update(stats)
+    return elegidos
+
+def prompt_rag(q, history, combined):
+    # Cada documento una vez (metadata sin vacíos, sin repetir `content`), por relevancia y con presupuesto
+    with span("evidencia", tipo="rag") as s:
+        evidencia, stats = empaquetar_docs(combined, MODEL_RAG)
+        s.update(stats)
 
-    prompt = f"""
+    return f"""
     Eres un ANALISTA DE LICITACIONES.
     HISTORIAL: {format_history(history)}
-    EVIDENCIA: {evidencia}
+    EVIDENCIA:
+{evidencia}
     PREGUNTA: "{q}"
     Responde usando la evidencia.
     """
-    return call_gemini_safe(MODEL_RAG, prompt, notify_callback=cb)
+
+_tiempos = threading.local()
+
+def tiempos_ultima_recuperacion():
+    """Tiempos por etapa (ms) de la última recuperación RAG hecha en este hilo."""
+    return getattr(_tiempos, "rag", {})
+
+def recuperar_hibrido(q, history):
+    """Búsqueda exacta y vectorial en paralelo: la latencia es la de la más lenta, no la suma."""
+    tiempos = {}
+    inicio = time.perf_counter()
+
+    def exacto():
+        t0 = time.perf_counter()
+        try: return search_exact_flexible(q)
+        finally: tiempos["exacto_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+
+    # Con reordenado se traen más candidatos vectoriales: al LLM igual llegan solo los mejores
+    q_busqueda = query_con_contexto(q, history)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        f_exact = pool.submit(propagar(exacto))
+        f_vec = pool.submit(propagar(search_vector), q_busqueda, CANDIDATOS if RERANK else 5, tiempos)
+        exact, vec = f_exact.result(), f_vec.result()
+
+    t0 = time.perf_counter()
+    combined = reordenar_hibrido(q_busqueda, exact, vec)
+    tiempos["reordenado_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    tiempos["recuperacion_ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+    _tiempos.rag = tiempos
+    print(f"   [Tiempos RAG]: {tiempos}")
+    return combined
+
+def response_hybrid_rag(q, history, cb, stream=False):
+    combined = recuperar_hibrido(q, history)
+    return responder(MODEL_RAG, prompt_rag(q, history, combined), cb, stream)
 
 # --- 8. MAIN (PERSONALIDAD + HORA LOCAL) ---
-def chatear(q, history, datos_usuario="Anónimo", callback=None):
-    try:
-        print(f"   👤 {datos_usuario}")
-        ruta = decide_route(q, history, callback)
-        print(f"   [Ruta]: {ruta}")
-        
-        if "SQL" in ruta: 
-            resp = response_sql(q, history, callback)
-        elif "WEB" in ruta:
-            resp = response_web(q, history, callback)
-        elif "RAG" in ruta: 
-            resp = response_hybrid_rag(q, history, callback)
-        else: 
-            # --- RUTA GENERAL CON HORA ---
-            hora_peru = obtener_hora_lima()
-            prompt_general = f"""
+def prompt_general(q, datos_usuario):
+    hora_peru = obtener_hora_lima()
+    return f"""
             Eres una IA útil y amigable llamada 'Analista IA'.
             Usuario: {datos_usuario}.
             CONTEXTO: La hora actual en Perú es {hora_peru}.
@@ -306,11 +806,160 @@ def chatear(q, history, datos_usuario="Anónimo", callback=None):
             2. Si piden la hora, DASELA directamente del contexto (no busques).
             3. NO hables de licitaciones si no te preguntan.
             """
-            resp = call_gemini_safe(MODEL_RAG, prompt_general, notify_callback=callback)
-            
+
+# --- 9. CACHÉ DE RESPUESTAS ---
+CACHE_RESPUESTAS = CacheRespuestas()
+ESTADOS_FIRMA = ["no adjudicad", "adjudicad", "pendient", "disponible", "ganad", "perdid"]
+# Seguimientos que se apoyan en la respuesta anterior: "y cuántas de esas...", "¿y sus montos?",
+# "las mismas pero del 2023", "de ellos, ¿cuáles...?"
+ANAFORA = re.compile(r"^(?:y|e|pero|entonces|ahora|tambien|ademas|solo)\b|"
+                     r"\b(?:es[aeo]s?|est[aeo]s?|aquell[aeo]s?|ell[ao]s?|dich[ao]s?|mism[ao]s?|sus|"
+                     r"anterior(?:es)?|mencionad[ao]s?|previ[ao]s?)\b")
+
+def es_cacheable(q, history):
+    """
+    Con historial, las preguntas cortas o con referencias a lo anterior ("esas", "y cuántas...")
+    dependen de la conversación: no se responden desde ni se guardan en las cachés compartidas.
+    """
+    if not history: return True
+    return len(q.split()) >= 4 and not ANAFORA.search(normalizar_pregunta(q))
+
+def firma_pregunta(q):
+    """Lo que dos preguntas 'casi iguales' deben compartir: códigos, números, estados y clientes del catálogo."""
+    q_lower = q.lower()
+    estados = []
+    for e in ESTADOS_FIRMA:
+        if e in q_lower:
+            estados.append(e)
+            q_lower = q_lower.replace(e, " ")
+    clientes = sorted({v for col, v in RESUMEN.valores_mencionados(q) if col == COL_CLIENTE})
+    return (tuple(sorted(t.upper() for t in extraer_tokens(q))), tuple(estados), tuple(clientes))
+
+def embeber_para_cache(q, ruta_rapida, firma):
+    """Vector de la pregunta para la búsqueda semántica, solo si en la caché hay con qué compararlo."""
+    if not ruta_cacheable(ruta_rapida or "") or not CACHE_RESPUESTAS.hay_candidatas(ruta_rapida, firma): return None
+    return get_embedding(q) or None
+
+def guardar_en_cache(q, ruta, texto, vector, firma):
+    """
+    Guarda la respuesta. Sin `vector` (la búsqueda se lo saltó) queda para aciertos exactos y
+    el embedding se calcula después en un hilo, fuera del tiempo de respuesta.
+    """
+    CACHE_RESPUESTAS.guardar(q, ruta, texto, vector, firma)
+    if vector is None:
+        threading.Thread(target=lambda: CACHE_RESPUESTAS.guardar(q, ruta, texto, get_embedding(q) or None, firma),
+                         daemon=True, name="cache-embedding").start()
+
+def ruta_cacheable(ruta):
+    """Solo se cachean respuestas sobre los datos (WEB y GENERAL dependen de la hora/actualidad)."""
+    if "SQL" in ruta: return "SQL"
+    if "RAG" in ruta: return "RAG"
+    return None
+
+def respuesta_valida(resp):
+    return bool(resp) and not resp.startswith(("Error", "Sistema saturado"))
+
+def _al_terminar(trozos, fn):
+    """Reenvía los trozos y, al final, llama a `fn` con el texto completo."""
+    partes = []
+    for t in trozos:
+        partes.append(t)
+        yield t
+    fn("".join(partes))
+
+def chatear(q, history, datos_usuario="Anónimo", callback=None, stream=False, traza_id=None):
+    """
+    Responde la pregunta. Con `stream=True` puede devolver un generador de trozos de texto.
+    Todo queda en una traza (`traza_id`, o una nueva) con un span por etapa.
+    """
+    traza = Traza(traza_id, usuario=str(datos_usuario), pregunta_chars=len(q), stream=stream)
+    with activar(traza):
+        resp = _chatear(q, history, datos_usuario, callback, stream)
+    if not isinstance(resp, str): return con_traza(resp, traza)
+    traza.atributos["respuesta_chars"] = len(resp)
+    traza.cerrar(error=resp if resp.startswith("Error crítico") else None)
+    return resp
+
+def _chatear(q, history, datos_usuario, callback, stream):
+    try:
+        print(f"   👤 {datos_usuario}")
+        siguiente = siguiente_pagina(q, history)
+        if siguiente is not None: return siguiente
+
+        cacheable = es_cacheable(q, history)
+        ruta_rapida, vec_q, firma = None, None, None
+        if cacheable:
+            ruta_rapida, firma = ruta_por_palabras(q), firma_pregunta(q)
+            vec_q = embeber_para_cache(q, ruta_rapida, firma)
+            guardada = CACHE_RESPUESTAS.buscar(q, ruta_rapida, vec_q, firma)
+            if guardada:
+                print(f"   [Caché]: respuesta reutilizada {CACHE_RESPUESTAS.stats()}")
+                anotar(ruta="CACHE")
+                return guardada
+
+        ruta = decide_route(q, history, callback)
+        anotar(ruta=ruta)
+        print(f"   [Ruta]: {ruta}")
+        
+        if "SQL" in ruta: 
+            resp = response_sql(q, history, callback, stream)
+        elif "WEB" in ruta:
+            resp = response_web(q, history, callback, stream)
+        elif "RAG" in ruta: 
+            resp = response_hybrid_rag(q, history, callback, stream)
+        else: 
+            # --- RUTA GENERAL CON HORA ---
+            resp = responder(MODEL_RAG, prompt_general(q, datos_usuario), callback, stream)
+
+        traza = traza_actual()
+        def guardar(texto):
+            if traza is not None and traza.atributos.get("paginada"): return   # Su "muéstrame más" va con esta traza
+            if cacheable and ruta_cacheable(ruta) and respuesta_valida(texto):
+                if ruta_rapida == ruta_cacheable(ruta): guardar_en_cache(q, ruta_cacheable(ruta), texto, vec_q, firma)
+                else: CACHE_RESPUESTAS.guardar(q, ruta_cacheable(ruta), texto, None, firma)
+
+        if not isinstance(resp, str): return _al_terminar(resp, guardar)
+        guardar(resp)
         return resp
     except Exception as e: return f"Error crítico: {e}"
 
+def chatear_stream(q, history, datos_usuario="Anónimo", callback=None, metricas=None, traza_id=None):
+    """
+    Generador de trozos de la respuesta (solo la narración final va en streaming).
+    En `metricas` deja `ttft_s` (tiempo al primer trozo) y `total_s` por separado.
+    """
+    inicio = time.perf_counter()
+    metricas = metricas if metricas is not None else {}
+    resp = chatear(q, history, datos_usuario, callback, stream=True, traza_id=traza_id)
+    try:
+        for trozo in ([resp] if isinstance(resp, str) else resp):
+            if "ttft_s" not in metricas: metricas["ttft_s"] = round(time.perf_counter() - inicio, 3)
+            yield trozo
+    except Exception as e:
+        yield f"Error crítico: {e}"
+    metricas["total_s"] = round(time.perf_counter() - inicio, 3)
+    print(f"   [Streaming]: TTFT {metricas.get('ttft_s')}s | total {metricas['total_s']}s")
+
+# --- 10. ARRANQUE ---
+def precalentar(en_segundo_plano=True):
+    """
+    Crea los clientes y detecta el esquema antes de la primera pregunta (en un hilo: no demora el
+    arranque), y deja entrenando el router local (su propio hilo, re-entrena cada ROUTER_REENTRENAR_S).
+    """
+    ROUTER_LOCAL.iniciar()
+    def tarea():
+        inicio = time.perf_counter()
+        try:
+            supabase.obtener()
+            client.obtener()
+            columnas_reales()
+            if RERANK: obtener_indice_lexico()
+            print(f"🔥 Clientes y esquema listos en {time.perf_counter() - inicio:.2f}s ({len(ESQUEMA.columnas)} columnas)")
+        except Exception as e:
+            print(f"⚠️ Precalentamiento fallido (se reintenta en la primera pregunta): {e}")
+    if not en_segundo_plano: return tarea()
+    threading.Thread(target=tarea, daemon=True, name="precalentar").start()
+
 if __name__ == "__main__":
     print("--- CHAT RAG DEFINITIVO (WEB + DB + GENERAL) ---")
     hist = []
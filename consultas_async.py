@@ -0,0 +1,389 @@
+import time
+import asyncio
+import consultas
+from consultas import (
+    MODEL_LOGIC, MODEL_RAG, EMBEDDING_MODEL, TABLE_NAME, MATCH_THRESHOLD,
+    ruta_por_palabras, ruta_local, ROUTER_LOCAL, prompt_router, prompt_web, herramientas_web, prompt_sql, limpiar_sql,
+    es_resultado_vacio, prompt_sugerencia, prompt_narracion_sql, extraer_tokens, busquedas_exactas,
+    filtro_or, etiquetar_exactos, args_match, config_herramientas, prompt_sql_plantilla, narrar_local,
+    MSG_DESCARTADA, query_con_contexto, prompt_rag, prompt_general, obtener_indice_local,
+    obtener_indice_exacto, PLANES_SQL, RESUMEN, CACHE_RESPUESTAS, es_cacheable, firma_pregunta, ruta_cacheable, respuesta_valida,
+    guardar_en_cache,
+    recordar_pagina, texto_pagina, reordenar_hibrido,
+)
+from cache_embeddings import obtener_cache
+from plantilla_sql import ESQUEMA_RESPUESTA, leer_respuesta, plantilla_reutilizable
+from reordenador import RERANK, CANDIDATOS
+from paginacion_sql import (FILAS_POR_PAGINA, SQL_TIMEOUT_S, sql_pagina, pagina_de,
+                            es_pedido_de_mas, obtener_cursores)
+from planificador import obtener_planificador, SistemaSaturado
+from trazas import Traza, activar, anotar, span, acon_traza, traza_actual
+
+# Versión asíncrona de `consultas.chatear`: mismos prompts y rutas, pero sin bloquear hilos.
+# Los 429 esperan con asyncio.sleep, así un usuario saturado no frena a los demás.
+# Lo que puede tocar disco, SQLite o la DB (resumen, planes, caché, esquema, router local)
+# va con asyncio.to_thread: el event loop no espera a nadie.
+
+_supabase_async = None
+_supabase_lock = asyncio.Lock()
+
+async def obtener_supabase_async():
+    global _supabase_async
+    async with _supabase_lock:
+        if _supabase_async is None:
+            from supabase import acreate_client, AsyncClientOptions
+            _supabase_async = await acreate_client(consultas.SUPABASE_URL, consultas.SUPABASE_KEY,
+                                                   options=AsyncClientOptions(postgrest_client_timeout=SQL_TIMEOUT_S + 5))
+        return _supabase_async
+
+async def notificar(cb, msg):
+    """Acepta callbacks normales o async."""
+    if not cb: return
+    if asyncio.iscoroutinefunction(cb): await cb(msg)
+    else: cb(msg)
+
+# --- 1. SEGURIDAD ---
+async def generar(model, prompt, config=None):
+    """Única llamada real al API (punto de reemplazo para pruebas de carga)."""
+    resp = await consultas.client.aio.models.generate_content(model=model, contents=prompt, config=config)
+    return resp.text.strip()
+
+async def aesperar_429(model, attempt, notify_callback):
+    wait_time = obtener_planificador().reportar_429(model)
+    msg = f"🚦 IA saturada. Esperando {wait_time:.0f}s... (Intento {attempt+1})"
+    print(f"   {msg}")
+    await notificar(notify_callback, msg)
+    with span("espera_429", modelo=model, intento=attempt + 1):
+        await asyncio.sleep(wait_time)
+
+async def call_gemini_async(model, prompt, retries=3, notify_callback=None, tools=None, esquema=None):
+    planificador = obtener_planificador()
+    with span("llm", modelo=model, prompt_chars=len(prompt), herramientas=bool(tools)) as s:
+        for attempt in range(retries):
+            s["intentos"] = attempt + 1
+            try:
+                with span("cola", modelo=model): await planificador.aadquirir(model)
+                config = config_herramientas(tools, esquema)
+                texto = await generar(model, prompt, config)
+                planificador.reportar_exito(model)
+                s["respuesta_chars"] = len(texto)
+                return texto
+            except SistemaSaturado as e:
+                print(f"   🚦 Descartada: {e}")
+                s["descartada"] = True
+                await notificar(notify_callback, "🚦 Mucha demanda ahora mismo, intenta en unos segundos.")
+                return MSG_DESCARTADA
+            except Exception as e:
+                if "429" in str(e) or "RESOURCE_EXHAUSTED" in str(e):
+                    await aesperar_429(model, attempt, notify_callback)
+                else:
+                    s["error"] = str(e)
+                    return f"Error IA: {str(e)}"
+        return "Sistema saturado. Intenta más tarde."
+
+async def generar_stream(model, prompt, config=None):
+    """Versión en streaming de `generar` (async generator de trozos de texto)."""
+    async for chunk in await consultas.client.aio.models.generate_content_stream(model=model, contents=prompt, config=config):
+        if chunk.text: yield chunk.text
+
+async def call_gemini_async_stream(model, prompt, retries=3, notify_callback=None, tools=None):
+    """Como `call_gemini_async`, pero por trozos. Solo reintenta 429 antes del primer trozo."""
+    planificador = obtener_planificador()
+    with span("llm", modelo=model, prompt_chars=len(prompt), herramientas=bool(tools), stream=True) as s:
+        s["respuesta_chars"] = 0
+        for attempt in range(retries):
+            s["intentos"] = attempt + 1
+            emitido = False
+            try:
+                with span("cola", modelo=model): await planificador.aadquirir(model)
+                config = config_herramientas(tools)
+                async for trozo in generar_stream(model, prompt, config):
+                    emitido = True
+                    s["respuesta_chars"] += len(trozo)
+                    yield trozo
+                planificador.reportar_exito(model)
+                return
+            except SistemaSaturado as e:
+                print(f"   🚦 Descartada: {e}")
+                s["descartada"] = True
+                yield MSG_DESCARTADA
+                return
+            except Exception as e:
+                if emitido:
+                    s["error"] = str(e)
+                    yield f"\n[Respuesta cortada: {e}]"
+                    return
+                if "429" in str(e) or "RESOURCE_EXHAUSTED" in str(e):
+                    await aesperar_429(model, attempt, notify_callback)
+                else:
+                    s["error"] = str(e)
+                    yield f"Error IA: {str(e)}"
+                    return
+        yield "Sistema saturado. Intenta más tarde."
+
+async def aresponder(model, prompt, cb, stream=False, tools=None):
+    """Paso final (narración): el texto completo o, con `stream`, un async generator de trozos."""
+    if stream: return call_gemini_async_stream(model, prompt, notify_callback=cb, tools=tools)
+    return await call_gemini_async(model, prompt, notify_callback=cb, tools=tools)
+
+# --- 2. HERRAMIENTAS DB ---
+async def aexecute_sql_query(sql_query):
+    try:
+        clean_sql = limpiar_sql(sql_query)
+        if not clean_sql: return "Error: SQL inválido."
+        print(f"   [Debug SQL]: {clean_sql}")
+        sb = await obtener_supabase_async()
+        with span("db.query_exec", sql_chars=len(clean_sql)) as s:
+            resp = await sb.rpc("query_exec", {"query": clean_sql}).execute()
+            s["filas"] = len(resp.data) if isinstance(resp.data, list) else 1
+        return resp.data
+    except Exception as e: return f"Error DB: {str(e)}"
+
+async def aejecutar_pagina(sql_query, cursor=None):
+    clean_sql = limpiar_sql(sql_query)
+    if not clean_sql: return "Error: SQL inválido."
+    res = await aexecute_sql_query(sql_pagina(clean_sql, FILAS_POR_PAGINA, cursor))
+    if isinstance(res, str): return res
+    return pagina_de(res, cursor)
+
+async def asiguiente_pagina(q, history):
+    if not es_pedido_de_mas(q): return None
+    cursor = await asyncio.to_thread(obtener_cursores().del_historial, history)
+    if cursor is None: return None
+    anotar(ruta="SQL", origen_sql="cursor")
+    print(f"   [Paginación]: filas desde {cursor['desde'] + 1} (sin LLM)")
+    pagina = await aejecutar_pagina(cursor["sql"], cursor)
+    if isinstance(pagina, str): return f"Error SQL: {pagina}"
+    return await asyncio.to_thread(texto_pagina, cursor, pagina)
+
+async def acon_pie(resp, pie):
+    async for t in resp: yield t
+    yield pie
+
+# --- 3. BUSCADOR VECTORIAL/EXACTO ---
+async def aget_embedding(text):
+    with span("embedding", modelo=EMBEDDING_MODEL, texto_chars=len(text)) as s:
+        cache = await asyncio.to_thread(obtener_cache)
+        guardado = await asyncio.to_thread(cache.get, EMBEDDING_MODEL, None, None, text)
+        s["cache"] = guardado is not None
+        if guardado is not None: return guardado.tolist()
+        try:
+            with span("cola", modelo=EMBEDDING_MODEL): await obtener_planificador().aadquirir(EMBEDDING_MODEL)
+            resp = await consultas.client.aio.models.embed_content(model=EMBEDDING_MODEL, contents=text)
+            vector = resp.embeddings[0].values
+            await asyncio.to_thread(cache.put, EMBEDDING_MODEL, None, None, text, vector)
+            return vector
+        except Exception as e:
+            s["error"] = str(e)
+            return []
+
+async def asearch_exact_flexible(query):
+    tokens = extraer_tokens(query)
+    if not tokens: return []
+    pares = await asyncio.to_thread(busquedas_exactas, tokens)
+    if not pares: return []
+    with span("db.exacta", backend=consultas.EXACT_BACKEND, pares=len(pares)) as s:
+        resultados = await _abuscar_exactos(pares)
+        s["filas"] = len(resultados)
+        return resultados
+
+async def _abuscar_exactos(pares):
+    if consultas.EXACT_BACKEND == "local":
+        try:
+            indice = await asyncio.to_thread(obtener_indice_exacto)
+            return etiquetar_exactos(indice.candidatos(pares), pares)
+        except Exception as e:
+            print(f"   ⚠️ Índice exacto no disponible ({e}); usando la DB.")
+
+    sb = await obtener_supabase_async()
+
+    try:
+        res = await sb.table(TABLE_NAME).select("*").or_(filtro_or(pares)).execute()
+        return etiquetar_exactos(res.data or [], pares)
+    except Exception as e:
+        print(f"   ⚠️ Filtro combinado falló ({e}); consultando por separado.")
+
+    # Respaldo: todas las búsquedas salen a la vez; se combinan en el orden de prioridad
+    consultas_db = []
+    for etiqueta, col, op, token in pares:
+        tabla = sb.table(TABLE_NAME).select("*")
+        consulta = tabla.eq(f"metadata->>{col}", token) if op == "eq" else tabla.ilike(f"metadata->>{col}", f"%{token}%")
+        consultas_db.append((etiqueta, consulta))
+
+    respuestas = await asyncio.gather(*(c.execute() for _, c in consultas_db), return_exceptions=True)
+    resultados, ids_encontrados = [], set()
+    for (etiqueta, _), res in zip(consultas_db, respuestas):
+        if isinstance(res, Exception): continue
+        for d in res.data:
+            if d['id'] not in ids_encontrados:
+                d['source_type'] = etiqueta
+                resultados.append(d)
+                ids_encontrados.add(d['id'])
+    return resultados
+
+async def asearch_vector(query_text, top_k=5):
+    vec = await aget_embedding(query_text)
+    if not vec: return []
+    try:
+        with span("db.vector", backend=consultas.RAG_BACKEND, top_k=top_k) as s:
+            if consultas.RAG_BACKEND == "local":
+                indice = await asyncio.to_thread(obtener_indice_local)
+                docs = await asyncio.to_thread(indice.buscar, vec, MATCH_THRESHOLD, top_k)
+            else:
+                sb = await obtener_supabase_async()
+                resp = await sb.rpc("match_documentos", args_match(vec, top_k)).execute()
+                docs = resp.data or []
+            s["filas"] = len(docs)
+            return docs
+    except: return []
+
+# --- 4. ROUTER ---
+async def adecide_route(q, history, cb):
+    with span("router") as s:
+        ruta = await asyncio.to_thread(ruta_local, q, history)
+        s["decide"] = "local" if ruta else "llm"
+        if ruta: return ruta
+        ruta = (await call_gemini_async(MODEL_LOGIC, prompt_router(q, history), notify_callback=cb)).upper()
+        await asyncio.to_thread(ROUTER_LOCAL.registrar, q, ruta)
+        return ruta
+
+# --- 5/6/7. AGENTES ---
+async def aresponse_web(q, history, cb, stream=False):
+    print("   [Modo]: WEB SEARCH (Google)")
+    return await aresponder(MODEL_LOGIC, prompt_web(q, history), cb, stream, tools=herramientas_web())
+
+async def aresponse_sql(q, history, cb, stream=False):
+    print("   [Modo]: SQL")
+    directa = await asyncio.to_thread(RESUMEN.responder, q) if es_cacheable(q, history) else None
+    if directa:
+        print("   [Resumen]: respondido desde el resumen precalculado")
+        anotar(origen_sql="resumen")
+        return directa
+
+    plan, respuesta = (await asyncio.to_thread(PLANES_SQL.buscar_con_respuesta, q) if es_cacheable(q, history)
+                       else (None, None))
+    if plan:
+        anotar(origen_sql="plan")
+        sql, pagina = plan, await aejecutar_pagina(plan)
+        PLANES_SQL.registrar_uso(not isinstance(pagina, str))
+        if isinstance(pagina, str): plan = None
+        else: print(f"   [Plan SQL]: reutilizado sin LLM {PLANES_SQL.stats()}")
+
+    if not plan:
+        anotar(origen_sql="llm")
+        if consultas.SQL_MODO == "plantilla":
+            prompt = await asyncio.to_thread(prompt_sql_plantilla, q, history)
+            respuesta = leer_respuesta(await call_gemini_async(MODEL_LOGIC, prompt, notify_callback=cb,
+                                                               esquema=ESQUEMA_RESPUESTA))
+            sql = respuesta["sql"]
+        else:
+            prompt = await asyncio.to_thread(prompt_sql, q, history)
+            respuesta, sql = None, await call_gemini_async(MODEL_LOGIC, prompt, notify_callback=cb)
+
+        if "SELECT" not in sql.upper():
+            return await aresponse_hybrid_rag(q, history, cb, stream)
+
+        pagina = await aejecutar_pagina(sql)
+
+        if isinstance(pagina, str): return f"Error SQL: {pagina}"
+        if es_cacheable(q, history):
+            await asyncio.to_thread(PLANES_SQL.guardar, q, limpiar_sql(sql), plantilla_reutilizable(respuesta))
+
+    res = pagina["filas"]
+    pie = await asyncio.to_thread(recordar_pagina, q, sql, pagina, respuesta)
+    local = narrar_local(respuesta, pagina)
+    if local is not None: return local + pie
+
+    if es_resultado_vacio(res):
+        catalogo = await asyncio.to_thread(RESUMEN.texto_catalogo)
+        return await aresponder(MODEL_RAG, prompt_sugerencia(q, catalogo), cb, stream)
+
+    resp = await aresponder(MODEL_RAG, prompt_narracion_sql(q, res, pagina), cb, stream)
+    if not pie: return resp
+    return resp + pie if isinstance(resp, str) else acon_pie(resp, pie)
+
+async def aresponse_hybrid_rag(q, history, cb, stream=False):
+    q_busqueda = query_con_contexto(q, history)
+    exact, vec = await asyncio.gather(asearch_exact_flexible(q), asearch_vector(q_busqueda, CANDIDATOS if RERANK else 5))
+    combined = await asyncio.to_thread(reordenar_hibrido, q_busqueda, exact, vec)
+    return await aresponder(MODEL_RAG, prompt_rag(q, history, combined), cb, stream)
+
+# --- 8. MAIN ---
+async def _aal_terminar(trozos, fn):
+    partes = []
+    async for t in trozos:
+        partes.append(t)
+        yield t
+    await asyncio.to_thread(fn, "".join(partes))
+
+async def achatear(q, history, datos_usuario="Anónimo", callback=None, stream=False, traza_id=None):
+    """Responde la pregunta. Con `stream=True` puede devolver un async generator de trozos."""
+    traza = Traza(traza_id, usuario=str(datos_usuario), pregunta_chars=len(q), stream=stream)
+    with activar(traza):
+        resp = await _achatear(q, history, datos_usuario, callback, stream)
+    if not isinstance(resp, str): return acon_traza(resp, traza)
+    traza.atributos["respuesta_chars"] = len(resp)
+    await asyncio.to_thread(traza.cerrar, error=resp if resp.startswith("Error crítico") else None)
+    return resp
+
+async def _achatear(q, history, datos_usuario, callback, stream):
+    try:
+        print(f"   👤 {datos_usuario}")
+        siguiente = await asiguiente_pagina(q, history)
+        if siguiente is not None: return siguiente
+
+        cacheable = es_cacheable(q, history)
+        ruta_rapida, vec_q, firma = None, None, None
+        if cacheable:
+            ruta_rapida = ruta_por_palabras(q)
+            firma = await asyncio.to_thread(firma_pregunta, q)
+            hay = ruta_cacheable(ruta_rapida or "") and await asyncio.to_thread(CACHE_RESPUESTAS.hay_candidatas, ruta_rapida, firma)
+            if hay: vec_q = await aget_embedding(q) or None
+            guardada = await asyncio.to_thread(CACHE_RESPUESTAS.buscar, q, ruta_rapida, vec_q, firma)
+            if guardada:
+                print(f"   [Caché]: respuesta reutilizada {CACHE_RESPUESTAS.stats()}")
+                anotar(ruta="CACHE")
+                return guardada
+
+        ruta = await adecide_route(q, history, callback)
+        anotar(ruta=ruta)
+        print(f"   [Ruta]: {ruta}")
+
+        if "SQL" in ruta:
+            resp = await aresponse_sql(q, history, callback, stream)
+        elif "WEB" in ruta:
+            resp = await aresponse_web(q, history, callback, stream)
+        elif "RAG" in ruta:
+            resp = await aresponse_hybrid_rag(q, history, callback, stream)
+        else:
+            resp = await aresponder(MODEL_RAG, prompt_general(q, datos_usuario), callback, stream)
+
+        traza = traza_actual()
+        def guardar(texto):
+            if traza is not None and traza.atributos.get("paginada"): return
+            if cacheable and ruta_cacheable(ruta) and respuesta_valida(texto):
+                if ruta_rapida == ruta_cacheable(ruta): guardar_en_cache(q, ruta_cacheable(ruta), texto, vec_q, firma)
+                else: CACHE_RESPUESTAS.guardar(q, ruta_cacheable(ruta), texto, None, firma)
+
+        if not isinstance(resp, str): return _aal_terminar(resp, guardar)
+        await asyncio.to_thread(guardar, resp)
+        return resp
+    except Exception as e: return f"Error crítico: {e}"
+
+async def achatear_stream(q, history, datos_usuario="Anónimo", callback=None, metricas=None, traza_id=None):
+    """Async generator de trozos de la respuesta; deja `ttft_s` y `total_s` en `metricas`."""
+    inicio = time.perf_counter()
+    metricas = metricas if metricas is not None else {}
+    resp = await achatear(q, history, datos_usuario, callback, stream=True, traza_id=traza_id)
+    try:
+        if isinstance(resp, str):
+            metricas["ttft_s"] = round(time.perf_counter() - inicio, 3)
+            yield resp
+        else:
+            async for trozo in resp:
+                if "ttft_s" not in metricas: metricas["ttft_s"] = round(time.perf_counter() - inicio, 3)
+                yield trozo
+    except Exception as e:
+        yield f"Error crítico: {e}"
+    metricas["total_s"] = round(time.perf_counter() - inicio, 3)
+    print(f"   [Streaming]: TTFT {metricas.get('ttft_s')}s | total {metricas['total_s']}s")
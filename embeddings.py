@@ -0,0 +1,277 @@
+import os
+import time
+import queue
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+
+# --- CONFIGURACIÓN ---
+TAM_LOTE_EMBED = 100      # Máximo de textos por llamada a embed_content
+MAX_EN_VUELO = 4          # Peticiones simultáneas al API de embeddings
+
+# Almacenamiento en Supabase (ver analisis.py): "vector" = float32, "halfvec" = float16 (mitad de espacio).
+# DIM_INDICE < 768 indexa solo el prefijo Matryoshka y re-ordena los candidatos con el vector completo.
+ALMACEN_VECTORES = os.environ.get("ALMACEN_VECTORES", "vector")
+DIM_INDICE = int(os.environ.get("DIM_INDICE", "768"))
+FACTOR_CANDIDATOS = int(os.environ.get("FACTOR_CANDIDATOS", "4"))   # Candidatos = match_count x factor
+DIGITOS = {"vector": 7, "halfvec": 4}                               # Cifras significativas que vale la pena enviar
+
+# --- 1. LIMITADOR DE TASA ---
+class TokenBucket:
+    """Limitador 'token bucket' thread-safe: `tasa` fichas por segundo, ráfagas hasta `capacidad`."""
+
+    def __init__(self, tasa, capacidad=None):
+        self.tasa = float(tasa)
+        self.capacidad = float(capacidad if capacidad is not None else max(1.0, tasa))
+        self.fichas = self.capacidad
+        self.ultimo = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _rellenar(self):
+        ahora = time.monotonic()
+        self.fichas = min(self.capacidad, self.fichas + (ahora - self.ultimo) * self.tasa)
+        self.ultimo = ahora
+
+    def intentar(self, n=1):
+        """Toma `n` fichas si hay; si no, devuelve los segundos que faltan (0 = concedido)."""
+        with self.lock:
+            self._rellenar()
+            if self.fichas >= n:
+                self.fichas -= n
+                return 0.0
+            return (n - self.fichas) / self.tasa
+
+    def adquirir(self, n=1):
+        """Bloquea hasta poder tomar `n` fichas."""
+        while True:
+            espera = self.intentar(n)
+            if espera <= 0: return
+            time.sleep(espera)
+
+# --- 2. VECTORES ---
+def normalize_matrix(matriz):
+    """Normaliza cada fila (L2) de una matriz float32. Las filas nulas se dejan igual."""
+    arr = np.asarray(matriz, dtype=np.float32)
+    if arr.ndim == 1: arr = arr.reshape(1, -1)
+    normas = np.linalg.norm(arr, axis=1, keepdims=True)
+    normas[normas == 0] = 1.0
+    return arr / normas
+
+def truncar_matryoshka(matriz, dim):
+    """Primeras `dim` componentes, re-normalizadas (válido en modelos entrenados tipo Matryoshka)."""
+    arr = np.asarray(matriz, dtype=np.float32)
+    if arr.ndim == 1: arr = arr.reshape(1, -1)
+    return normalize_matrix(arr[:, :dim]) if dim and dim < arr.shape[1] else normalize_matrix(arr)
+
+def cuantizar_int8(matriz):
+    """int8 con escala por vector: fila ~= q * escala / 127."""
+    escalas = np.abs(matriz).max(axis=1).astype(np.float32)
+    escalas[escalas == 0] = 1.0
+    q = np.round(matriz / escalas[:, None] * 127).astype(np.int8)
+    return q, escalas
+
+def serializar_vector(vector, almacen=ALMACEN_VECTORES):
+    """
+    Vector para PostgREST como texto '[...]' con solo las cifras que el tipo de la columna guarda:
+    el JSON de floats de Python (~20 caracteres por número) pesa 2-3 veces más.
+    """
+    if vector is None: return None
+    digitos = DIGITOS.get(almacen, 7)
+    return "[" + ",".join(f"{x:.{digitos}g}" for x in np.asarray(vector, dtype=np.float32).tolist()) + "]"
+
+# --- 3. EMBEDDERS (intercambiables) ---
+class EmbedderGemini:
+    """Embebe una lista de textos en UNA sola llamada a `embed_content`."""
+
+    def __init__(self, client, model, dimension, task_type="RETRIEVAL_DOCUMENT"):
+        self.client = client
+        self.model = model
+        self.dimension = dimension
+        self.task_type = task_type
+
+    def __call__(self, textos):
+        from google.genai import types
+        result = self.client.models.embed_content(
+            model=self.model,
+            contents=list(textos),
+            config=types.EmbedContentConfig(
+                task_type=self.task_type,
+                output_dimensionality=self.dimension
+            )
+        )
+        return [e.values for e in result.embeddings]
+
+class EmbedderFalso:
+    """Embedder offline y determinista (para benchmarks): simula la latencia del API."""
+
+    def __init__(self, dimension=768, latencia=0.05, latencia_por_texto=0.0):
+        self.dimension = dimension
+        self.latencia = latencia
+        self.latencia_por_texto = latencia_por_texto
+        self.llamadas = 0
+        self.lock = threading.Lock()
+
+    def vector(self, texto):
+        semilla = int.from_bytes(hashlib.sha256(texto.encode("utf-8")).digest()[:8], "little")
+        return np.random.default_rng(semilla).standard_normal(self.dimension).astype(np.float32)
+
+    def __call__(self, textos):
+        with self.lock: self.llamadas += 1
+        time.sleep(self.latencia + self.latencia_por_texto * len(textos))
+        return [self.vector(t) for t in textos]
+
+# --- 4. PIPELINE CONCURRENTE ---
+class EstadisticasEmbedding:
+    def __init__(self):
+        self.filas = 0
+        self.fallidas = 0
+        self.llamadas = 0
+        self.insertadas = 0
+        self.segundos = 0.0
+        self.lock = threading.Lock()
+
+    @property
+    def filas_por_seg(self):
+        return self.filas / self.segundos if self.segundos else 0.0
+
+    def __str__(self):
+        return (f"{self.filas} filas en {self.segundos:.2f}s ({self.filas_por_seg:.1f} filas/s), "
+                f"{self.llamadas} llamadas, {self.fallidas} fallidas")
+
+def embeber_lote(textos, embedder, stats, limitador=None, reintentos=3, etiqueta=""):
+    """Una petición de embedding con reintentos. Devuelve la matriz normalizada o None si se agotaron."""
+    for intento in range(reintentos):
+        try:
+            if limitador: limitador.adquirir()    # SistemaSaturado del planificador = un intento fallido más
+            with stats.lock: stats.llamadas += 1
+            return normalize_matrix(embedder(textos))
+        except Exception as e:
+            print(f"   ⚠️ Lote {etiqueta} falló (Intento {intento+1}): {e}")
+            espera = limitador.penalizar(e) if hasattr(limitador, "penalizar") else None
+            time.sleep(espera if espera is not None else 2 ** intento)
+    return None
+
+def embeber_concurrente(textos, embedder, tam_lote=TAM_LOTE_EMBED, max_en_vuelo=MAX_EN_VUELO,
+                        limitador=None, reintentos=3):
+    """
+    Embebe `textos` en lotes de `tam_lote`, con hasta `max_en_vuelo` peticiones simultáneas.
+    Cada petición consume una ficha de `limitador` (TokenBucket, o el adaptador del planificador)
+    antes de salir; si el limitador tiene `penalizar(error)`, decide la espera tras un fallo.
+    Devuelve (vectores, stats): `vectores[i]` es una fila float32 normalizada o None si falló.
+    """
+    stats = EstadisticasEmbedding()
+    inicio = time.perf_counter()
+    vectores = [None] * len(textos)
+    lotes = [(i, textos[i:i + tam_lote]) for i in range(0, len(textos), tam_lote)]
+
+    def procesar(lote):
+        inicio_lote, textos_lote = lote
+        return inicio_lote, embeber_lote(textos_lote, embedder, stats, limitador, reintentos, inicio_lote)
+
+    with ThreadPoolExecutor(max_workers=max_en_vuelo) as pool:
+        futuros = [pool.submit(procesar, lote) for lote in lotes]
+        for fut in as_completed(futuros):
+            inicio_lote, matriz = fut.result()
+            if matriz is None:
+                stats.fallidas += min(tam_lote, len(textos) - inicio_lote)
+                continue
+            for j, fila in enumerate(matriz):
+                vectores[inicio_lote + j] = fila
+            stats.filas += len(matriz)
+
+    stats.segundos = time.perf_counter() - inicio
+    return vectores, stats
+
+# --- 5. PIPELINE EN STREAMING (lectura -> embedding -> insert) ---
+_FIN = object()
+
+def pipeline_streaming(registros, embedder, insertar, tam_lote=TAM_LOTE_EMBED, max_en_vuelo=MAX_EN_VUELO,
+                       limitador=None, reintentos=3, max_cola=None, bitacora=None):
+    """
+    Consume `registros` (iterable de dicts con "content", p. ej. un generador que lee la planilla)
+    sin materializarlo: este hilo arma lotes de `tam_lote`, `max_en_vuelo` hilos los embeben
+    y un hilo llama `insertar(lote)` con cada lote ya con "embedding".
+    Las colas entre etapas son acotadas (`max_cola` lotes), así que si el embedding o la base
+    van lentos la lectura se frena: la memoria no crece con el tamaño del archivo.
+    Los registros que ya traen "embedding" no se vuelven a embeber.
+    `bitacora` (opcional) recibe recuperar(lote) -> lote, embebidos(lote), insertados(lote)
+    y fallido(n_lote, lote, etapa, error): ver bitacora_ingesta.Bitacora.
+    Devuelve EstadisticasEmbedding (con `insertadas`).
+    """
+    stats = EstadisticasEmbedding()
+    inicio = time.perf_counter()
+    max_cola = max_cola or max_en_vuelo * 2
+    cola_textos = queue.Queue(maxsize=max_cola)
+    cola_insert = queue.Queue(maxsize=max_cola)
+
+    def fallar(n_lote, lote, etapa, error):
+        with stats.lock: stats.fallidas += len(lote)
+        if bitacora: bitacora.fallido(n_lote, lote, etapa, error)
+
+    def embeber():
+        while True:
+            item = cola_textos.get()
+            if item is _FIN:
+                cola_insert.put(_FIN)
+                return
+            n_lote, lote = item
+            try:
+                lote = embeber_pendientes(n_lote, lote)
+            except Exception as e:
+                # Si el hilo muriera, el de inserts esperaría para siempre su _FIN
+                print(f"   ❌ Error en lote {n_lote}: {e}")
+                fallar(n_lote, lote, "embedding", e)
+                continue
+            if lote: cola_insert.put((n_lote, lote))
+
+    def embeber_pendientes(n_lote, lote):
+        if bitacora: lote = bitacora.recuperar(lote)
+        faltan = [r for r in lote if "embedding" not in r]
+        if not faltan: return lote
+        matriz = embeber_lote([r["content"] for r in faltan], embedder, stats, limitador, reintentos, n_lote)
+        if matriz is None:
+            fallar(n_lote, faltan, "embedding", "reintentos agotados")
+            return [r for r in lote if "embedding" in r]
+        for registro, fila in zip(faltan, matriz):
+            registro["embedding"] = fila.tolist()
+        with stats.lock: stats.filas += len(faltan)
+        if bitacora: bitacora.embebidos(faltan)
+        return lote
+
+    def insertar_lotes():
+        pendientes = max_en_vuelo
+        while pendientes:
+            item = cola_insert.get()
+            if item is _FIN:
+                pendientes -= 1
+                continue
+            n_lote, lote = item
+            try:
+                insertar(lote)
+                stats.insertadas += len(lote)
+                if bitacora: bitacora.insertados(lote)
+            except Exception as e:
+                # Un error de la base no debe detener el hilo: la lectura quedaría bloqueada en la cola
+                print(f"   ❌ Error insertando lote {n_lote}: {e}")
+                fallar(n_lote, lote, "insert", e)
+
+    hilos = [threading.Thread(target=embeber, daemon=True) for _ in range(max_en_vuelo)]
+    hilos.append(threading.Thread(target=insertar_lotes, daemon=True))
+    for h in hilos: h.start()
+
+    try:
+        lote, n_lote = [], 0
+        for registro in registros:
+            lote.append(registro)
+            if len(lote) >= tam_lote:
+                cola_textos.put((n_lote, lote))
+                lote, n_lote = [], n_lote + 1
+        if lote: cola_textos.put((n_lote, lote))
+    finally:
+        # Aunque falle la lectura, se cierran las etapas con lo ya leído
+        for _ in range(max_en_vuelo): cola_textos.put(_FIN)
+        for h in hilos: h.join()
+
+    stats.segundos = time.perf_counter() - inicio
+    return stats
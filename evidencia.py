@@ -0,0 +1,166 @@
+import os
+import math
+from collections import Counter
+
+# --- CONFIGURACIÓN ---
+CHARS_POR_TOKEN = 4                 # Aproximación (español + números) sin tokenizer
+PRESUPUESTO_DEFECTO = 2000          # Tokens de evidencia por prompt
+PRESUPUESTOS = {                    # Por modelo: el de narración RAG tiene más margen
+    "models/gemini-3-flash-preview": 3000,
+    "models/gemini-2.5-flash": 2000,
+}
+MAX_CHARS_CAMPO = 300               # Un campo largo (descripciones) se recorta a esto
+MAX_DISTINTOS = 12                  # Columnas con hasta N valores distintos se resumen con conteos
+TOP_N = 5                           # Columnas con más valores: los N más frecuentes
+MAX_SEGUIMIENTO = 5000              # Valores distintos que se cuentan por columna (memoria acotada)
+VACIOS = {"", "nan", "nat", "none", "null", "-"}
+
+def estimar_tokens(texto):
+    return math.ceil(len(texto) / CHARS_POR_TOKEN)
+
+def presupuesto(modelo):
+    """Tokens de evidencia para `modelo` (EVIDENCIA_TOKENS fija uno para todos)."""
+    if os.environ.get("EVIDENCIA_TOKENS"): return int(os.environ["EVIDENCIA_TOKENS"])
+    return PRESUPUESTOS.get(modelo, PRESUPUESTO_DEFECTO)
+
+# --- 1. CAMPOS ÚTILES ---
+def valor_texto(v):
+    texto = " ".join(str(v).split()) if v is not None else ""
+    if texto.lower() in VACIOS: return ""
+    return texto if len(texto) <= MAX_CHARS_CAMPO else texto[:MAX_CHARS_CAMPO - 1] + "…"
+
+def campos(meta):
+    """Solo los campos con valor (sin vacíos), con el texto ya compacto."""
+    return {k: t for k, v in (meta or {}).items() if (t := valor_texto(v))}
+
+def texto_extra(content, meta):
+    """Lo que `content` agrega a la metadata: normalmente nada, porque se arma con los mismos "clave: valor"."""
+    if not content: return ""
+    resto = str(content)
+    for k, v in (meta or {}).items():
+        if v not in (None, ""): resto = resto.replace(f"{k}: {v}", "")
+    resto = resto.strip(" .\n")
+    return valor_texto(resto) if len(resto.replace(".", "").strip()) > 2 else ""
+
+# --- 2. TABLAS COMPACTAS ---
+def tabla(filas):
+    """
+    Filas (dicts) como tabla con el encabezado una sola vez: sin columnas vacías en todas
+    las filas, y las columnas con el mismo valor en todas van arriba, en una línea aparte.
+    """
+    if not filas: return "(sin filas)"
+    columnas = list(dict.fromkeys(k for f in filas for k in f))
+    celdas = [{c: valor_texto(f.get(c)) for c in columnas} for f in filas]
+    columnas = [c for c in columnas if any(f[c] for f in celdas)]
+    comunes = {}
+    if len(celdas) > 1:
+        comunes = {c: celdas[0][c] for c in columnas if celdas[0][c] and all(f[c] == celdas[0][c] for f in celdas)}
+    variables = [c for c in columnas if c not in comunes]
+    lineas = []
+    if comunes: lineas.append("En todas: " + "; ".join(f"{c}={v}" for c, v in comunes.items()))
+    if variables:
+        lineas.append(" | ".join(variables))
+        lineas.extend(" | ".join(f[c].replace("|", "/") for c in variables) for f in celdas)
+    return "\n".join(lineas)
+
+def es_numero(v):
+    try:
+        float(str(v).replace(",", ""))
+        return True
+    except ValueError:
+        return False
+
+def agregados(filas):
+    """
+    Resumen por columna en una sola pasada (sirve para un iterador de filas, con memoria acotada):
+    suma/mín/máx si es numérica, conteos si tiene pocos valores, si no cuántos distintos y los más frecuentes.
+    """
+    total = 0
+    columnas = {}   # col -> {"conteo": Counter (None si pasó de MAX_SEGUIMIENTO), "numeros": [n, suma, mín, máx] o None}
+    for f in filas:
+        total += 1
+        for c, v in f.items():
+            t = valor_texto(v)
+            if not t: continue
+            e = columnas.setdefault(c, {"conteo": Counter(), "distintos": 0, "numeros": [0, 0.0, math.inf, -math.inf]})
+            if e["conteo"] is not None:
+                e["conteo"][t] += 1
+                if len(e["conteo"]) > MAX_SEGUIMIENTO: e["conteo"] = None
+            if e["numeros"] is not None:
+                if es_numero(t):
+                    x = float(t.replace(",", ""))
+                    n = e["numeros"]
+                    e["numeros"] = [n[0] + 1, n[1] + x, min(n[2], x), max(n[3], x)]
+                else: e["numeros"] = None
+    lineas = [f"Total filas: {total}"]
+    for c, e in columnas.items():
+        conteo, nums = e["conteo"], e["numeros"]
+        if conteo is not None and len(conteo) <= MAX_DISTINTOS:
+            lineas.append(f"{c}: " + ", ".join(f"{v} ({n})" for v, n in conteo.most_common()))
+        elif nums is not None:
+            lineas.append(f"{c}: suma {nums[1]:,.2f}, mín {nums[2]:,.2f}, máx {nums[3]:,.2f}, promedio {nums[1] / nums[0]:,.2f}")
+        elif conteo is None:
+            lineas.append(f"{c}: más de {MAX_SEGUIMIENTO} valores distintos")
+        else:
+            top = [(v, n) for v, n in conteo.most_common(TOP_N) if n > 1]
+            lineas.append(f"{c}: {len(conteo)} valores distintos" +
+                          ("; más frecuentes: " + ", ".join(f"{v} ({n})" for v, n in top) if top else ""))
+    return "\n".join(lineas)
+
+def recortar(texto, tokens):
+    limite = tokens * CHARS_POR_TOKEN
+    return texto if len(texto) <= limite else texto[:limite - 1] + "…"
+
+def _mayor_prefijo(n, cabe):
+    """Mayor k <= n con cabe(k) cierto (cabe es monótona: si k no cabe, k+1 tampoco)."""
+    bajo, alto = 0, n
+    while bajo < alto:
+        medio = (bajo + alto + 1) // 2
+        if cabe(medio): bajo = medio
+        else: alto = medio - 1
+    return bajo
+
+# --- 3. EMPAQUETADO ---
+def relevancia(doc):
+    """El puntaje del reordenador si lo trae; si no, coincidencias exactas primero y después similitud vectorial."""
+    if doc.get("puntaje") is not None: return (doc["puntaje"], doc.get("similarity") or 0.0)
+    exacto = not str(doc.get("source_type") or "").startswith("VECTOR")
+    return (exacto, doc.get("similarity") or 0.0)
+
+def empaquetar_docs(docs, modelo):
+    """
+    Evidencia RAG dentro del presupuesto de `modelo`: cada documento una vez (metadata sin vacíos;
+    `content` solo si agrega algo), en tabla compacta, ordenados por relevancia y cortados al presupuesto.
+    Devuelve (texto, stats).
+    """
+    limite = presupuesto(modelo)
+    ordenados = sorted(docs, key=relevancia, reverse=True)
+    filas = []
+    for d in ordenados:
+        fila = {"fuente": d.get("source_type") or "VECTOR"}
+        if d.get("similarity") is not None: fila["similitud"] = f"{d['similarity']:.2f}"
+        fila.update(campos(d.get("metadata")))
+        extra = texto_extra(d.get("content"), d.get("metadata"))
+        if extra: fila["texto"] = extra
+        filas.append(fila)
+
+    n = _mayor_prefijo(len(filas), lambda k: estimar_tokens(tabla(filas[:k])) <= limite)
+    texto = tabla(filas[:n]) if n else recortar(tabla(filas[:1]), limite)
+    if n < len(filas): texto += f"\n({max(n, 1)} de {len(filas)} documentos, por relevancia)"
+    return texto, {"docs": len(filas), "incluidos": max(n, 1) if filas else 0, "tokens": estimar_tokens(texto)}
+
+def empaquetar_filas(filas, modelo):
+    """
+    Resultado SQL dentro del presupuesto: si cabe, tabla compacta; si no, agregados de todas
+    las filas + las primeras que quepan. Devuelve (texto, stats).
+    """
+    limite = presupuesto(modelo)
+    completo = tabla(filas)
+    if estimar_tokens(completo) <= limite:
+        return completo, {"filas": len(filas), "incluidas": len(filas), "tokens": estimar_tokens(completo)}
+
+    resumen = recortar(agregados(filas), limite // 2)
+    resto = limite - estimar_tokens(f"{resumen}\nPrimeras {len(filas)} de {len(filas)} filas:\n")
+    n = _mayor_prefijo(len(filas), lambda k: estimar_tokens(tabla(filas[:k])) <= resto)
+    texto = f"{resumen}\nPrimeras {n} de {len(filas)} filas:\n{tabla(filas[:n])}" if n else resumen
+    return texto, {"filas": len(filas), "incluidas": n, "tokens": estimar_tokens(texto)}
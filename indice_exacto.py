@@ -0,0 +1,139 @@
+import re
+import threading
+from collections import namedtuple
+
+# Todo lo que leen las búsquedas, en una sola tupla que nunca se modifica después de publicarse
+Instantanea = namedtuple("Instantanea", "docs por_valor trigramas")
+
+def trigramas(texto):
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+class IndiceExacto:
+    """
+    Índice en memoria de la metadata de `documentos_dj` para las búsquedas exactas:
+    - hash (columna, valor) -> ids, para igualdad (`id_excel`)
+    - trigramas por columna (construidos al primer uso), para los ILIKE '%token%'
+    Devuelve CANDIDATOS; la verificación fina (comodines de ILIKE) la hace quien consulta.
+    Las búsquedas leen `self.datos` sin lock; agregar/quitar/refrescar trabajan sobre una copia
+    y la publican con una sola asignación (entre ellos se serializan con `self.lock`).
+    """
+
+    def __init__(self):
+        # docs: id -> {"id", "content", "metadata"}; por_valor: (col, valor) -> set(ids);
+        # trigramas: col -> {trigrama -> set(ids)}
+        self.datos = Instantanea({}, {}, {})
+        self.lock = threading.Lock()
+
+    docs = property(lambda self: self.datos.docs)
+
+    def __len__(self):
+        return len(self.datos.docs)
+
+    # --- ESCRITURA (sobre una copia) ---
+    @staticmethod
+    def _copiar(d):
+        return Instantanea(dict(d.docs), {k: set(v) for k, v in d.por_valor.items()},
+                           {col: {t: set(v) for t, v in indice.items()} for col, indice in d.trigramas.items()})
+
+    @staticmethod
+    def _agregar(d, filas):
+        for f in filas:
+            if f["id"] in d.docs: IndiceExacto._quitar(d, [f["id"]])
+            meta = f.get("metadata") or {}
+            d.docs[f["id"]] = {"id": f["id"], "content": f.get("content"), "metadata": meta}
+            for col, val in meta.items():
+                val = str(val)
+                d.por_valor.setdefault((col, val), set()).add(f["id"])
+                if col in d.trigramas:
+                    for t in trigramas(val.lower()): d.trigramas[col].setdefault(t, set()).add(f["id"])
+
+    @staticmethod
+    def _quitar(d, ids):
+        """Quita los docs y sus entradas; los conjuntos que quedan vacíos se borran."""
+        ids = set(ids) & d.docs.keys()
+        for i in ids:
+            for col, val in d.docs.pop(i)["metadata"].items():
+                val = str(val)
+                claves = [(d.por_valor, (col, val))]
+                if col in d.trigramas: claves += [(d.trigramas[col], t) for t in trigramas(val.lower())]
+                for indice, clave in claves:
+                    conjunto = indice.get(clave)
+                    if conjunto is None: continue
+                    conjunto.discard(i)
+                    if not conjunto: del indice[clave]
+        return len(ids)
+
+    def agregar(self, filas):
+        with self.lock:
+            d = self._copiar(self.datos)
+            self._agregar(d, filas)
+            self.datos = d
+
+    def quitar(self, ids):
+        with self.lock:
+            d = self._copiar(self.datos)
+            n = self._quitar(d, ids)
+            self.datos = d
+        return n
+
+    # --- BÚSQUEDA ---
+    def _indice_columna(self, d, col):
+        if col in d.trigramas: return d.trigramas[col]
+        indice = {}
+        for i, doc in d.docs.items():
+            if col in doc["metadata"]:
+                for t in trigramas(str(doc["metadata"][col]).lower()): indice.setdefault(t, set()).add(i)
+        with self.lock:
+            # Se guarda solo si nadie publicó otra versión mientras tanto (si no, se arma de nuevo la próxima vez)
+            if self.datos is d: self.datos = d._replace(trigramas={**d.trigramas, col: indice})
+        return indice
+
+    def _ids_par(self, d, col, op, token):
+        if op == "eq": return d.por_valor.get((col, token), set())
+        # ILIKE: '_' y '%' son comodines -> se usa el trozo literal más largo para filtrar
+        trozo = max(re.split(r"[_%]", token.lower()), key=len)
+        if len(trozo) < 3:
+            return {i for i, doc in d.docs.items() if col in doc["metadata"]}
+        indice = self._indice_columna(d, col)
+        conjuntos = sorted((indice.get(t, set()) for t in trigramas(trozo)), key=len)
+        return set.intersection(*conjuntos) if conjuntos else set()
+
+    def candidatos(self, pares):
+        """Docs (copias, ordenados por id) que podrían cumplir algún par (etiqueta, col, op, token)."""
+        d = self.datos      # Una sola lectura: un `refrescar` a la par no cambia nada a mitad de la búsqueda
+        ids = set()
+        for _, col, op, token in pares: ids |= self._ids_par(d, col, op, token)
+        return [dict(d.docs[i]) for i in sorted(ids)]
+
+    # --- CARGA DESDE SUPABASE ---
+    @staticmethod
+    def _leer_nuevas(supabase, tabla, desde_id=0, tam_pagina=1000):
+        ultimo, filas = desde_id, []
+        while True:
+            resp = (supabase.table(tabla).select("id, content, metadata")
+                    .gt("id", ultimo).order("id").limit(tam_pagina).execute())
+            filas.extend(resp.data or [])
+            if not resp.data or len(resp.data) < tam_pagina: break
+            ultimo = resp.data[-1]["id"]
+        return filas
+
+    def cargar_desde_supabase(self, supabase, tabla, desde_id=0, tam_pagina=1000):
+        filas = self._leer_nuevas(supabase, tabla, desde_id, tam_pagina)
+        self.agregar(filas)
+        return len(filas)
+
+    def refrescar(self, supabase, tabla, tam_pagina=1000):
+        """Incremental: quita los ids borrados y carga los nuevos (se publica todo junto). Devuelve nº de cambios."""
+        vivos, desde = set(), 0
+        while True:
+            resp = supabase.table(tabla).select("id").order("id").range(desde, desde + tam_pagina - 1).execute()
+            vivos.update(d["id"] for d in resp.data or [])
+            if not resp.data or len(resp.data) < tam_pagina: break
+            desde += tam_pagina
+        nuevas = self._leer_nuevas(supabase, tabla, max(self.docs, default=0), tam_pagina)
+        with self.lock:
+            d = self._copiar(self.datos)
+            quitados = self._quitar(d, d.docs.keys() - vivos)
+            self._agregar(d, nuevas)
+            self.datos = d
+        return quitados + len(nuevas)
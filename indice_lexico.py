@@ -0,0 +1,90 @@
+import math
+import heapq
+from collections import Counter
+from cache_respuestas import normalizar_pregunta
+
+# --- CONFIGURACIÓN ---
+K1 = 1.2        # Saturación de la frecuencia del término
+B = 0.75        # Cuánto pesa el largo del documento
+MAX_DF = 0.5    # En `buscar`, los términos de más de la mitad de los docs no aportan y costarían una pasada entera
+PALABRAS_VACIAS = {
+    "de", "del", "la", "las", "el", "los", "un", "una", "unos", "unas", "y", "o", "en", "con", "por", "para",
+    "que", "a", "al", "se", "su", "sus", "es", "son", "lo", "le", "les", "me", "mi", "como", "hay", "cual",
+    "cuales", "sobre", "este", "esta", "estos", "estas", "ese", "esa", "dame", "muestra", "muestrame",
+}
+
+def terminos(texto):
+    """Palabras sin tildes, signos ni vacías, con el plural recortado ('molinos' -> 'molino')."""
+    salida = []
+    for p in normalizar_pregunta(texto or "").split():
+        if (len(p) < 2 and not p.isdigit()) or p in PALABRAS_VACIAS: continue
+        if len(p) > 5 and p.endswith(("ones", "ores")): p = p[:-2]
+        elif len(p) > 4 and p.endswith("s") and p[-2] not in "su": p = p[:-1]
+        salida.append(p)
+    return salida
+
+class IndiceBM25:
+    """
+    Índice invertido en memoria sobre `content` (término -> {id: frecuencia}) con puntaje
+    BM25 (Okapi). `buscar` da los mejores de toda la tabla; `puntajes` puntúa solo los ids
+    que se le pasan (los candidatos de las otras búsquedas). Las lecturas no toman lock: el
+    índice se arma completo antes de publicarse y después solo se lee (ver
+    consultas.obtener_indice_lexico).
+    """
+
+    def __init__(self, k1=K1, b=B, max_df=MAX_DF):
+        self.k1 = k1
+        self.b = b
+        self.max_df = max_df
+        self.listas = {}        # término -> {id: frecuencia}
+        self.largos = {}        # id -> nº de términos
+        self.terminos_doc = {}  # id -> términos distintos (para quitar el doc)
+        self.total_terminos = 0
+
+    def __len__(self):
+        return len(self.largos)
+
+    def agregar(self, filas):
+        """Agrega filas {"id", "content"} (si el id ya estaba, lo reemplaza)."""
+        for f in filas:
+            if f["id"] in self.largos: self.quitar([f["id"]])
+            conteo = Counter(terminos(f.get("content")))
+            for t, n in conteo.items(): self.listas.setdefault(t, {})[f["id"]] = n
+            self.largos[f["id"]] = sum(conteo.values())
+            self.terminos_doc[f["id"]] = tuple(conteo)
+            self.total_terminos += self.largos[f["id"]]
+
+    def quitar(self, ids):
+        n = 0
+        for i in ids:
+            if i not in self.largos: continue
+            for t in self.terminos_doc.pop(i):
+                lista = self.listas[t]
+                del lista[i]
+                if not lista: del self.listas[t]
+            self.total_terminos -= self.largos.pop(i)
+            n += 1
+        return n
+
+    def idf(self, termino):
+        n = len(self.listas.get(termino, ()))
+        return math.log(1 + (len(self.largos) - n + 0.5) / (n + 0.5))
+
+    def puntajes(self, consulta, ids=None):
+        """{id: puntaje BM25} de los docs con algún término de `consulta` (solo entre `ids`, si se dan)."""
+        if not self.largos: return {}
+        promedio = self.total_terminos / len(self.largos) or 1.0
+        salida = {}
+        for t in set(terminos(consulta)):
+            lista = self.listas.get(t)
+            if not lista or (ids is None and len(lista) > self.max_df * len(self.largos)): continue
+            idf = self.idf(t)
+            for i in (lista if ids is None else (i for i in ids if i in lista)):
+                tf = lista[i]
+                norma = self.k1 * (1 - self.b + self.b * self.largos[i] / promedio)
+                salida[i] = salida.get(i, 0.0) + idf * tf * (self.k1 + 1) / (tf + norma)
+        return salida
+
+    def buscar(self, consulta, k=20):
+        """Los `k` mejores de todo el índice: [(id, puntaje)] en orden descendente."""
+        return heapq.nlargest(k, self.puntajes(consulta).items(), key=lambda x: x[1])
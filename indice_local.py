@@ -0,0 +1,246 @@
+import os
+import glob
+import json
+import time
+from collections import namedtuple
+import numpy as np
+from embeddings import normalize_matrix, truncar_matryoshka, cuantizar_int8, FACTOR_CANDIDATOS
+
+# Todo lo que lee `buscar`, en una sola tupla: agregar/quitar arman una nueva y la publican con
+# una asignación, así una búsqueda concurrente con `refrescar` nunca mezcla ids y filas de dos versiones
+Instantanea = namedtuple("Instantanea", "ids matriz escalas completa docs")
+VACIA = Instantanea(np.zeros(0, dtype=np.int64), None, None, None, [])
+
+class IndiceVectorial:
+    """
+    Índice vectorial en memoria sobre `documentos_dj`: matriz contigua float32 (o int8 con
+    escala por vector) + documentos por fila. Responde top-k por coseno con la misma
+    semántica que `match_documentos` (similarity > match_threshold, orden descendente).
+    Con `dim` la primera pasada usa solo el prefijo Matryoshka de `dim` componentes; con `dim`
+    o `cuantizar`, los `match_count x factor_candidatos` mejores se re-ordenan con el vector
+    float32 completo (`self.completa`): después de `guardar` (y al `cargar`) se lee por mmap desde
+    el snapshot, así en RAM queda solo la matriz de la primera pasada.
+    La matriz int8 ocupa la cuarta parte pero busca más lento (numpy la pasa a float32 en cada
+    consulta): ~35 ms contra ~8.6 ms de float32 con 30k docs (benchmarks/bench_indice.py).
+    Los datos viven en `self.datos` (Instantanea), que solo se reemplaza entera.
+    """
+
+    def __init__(self, cuantizar=False, dim=None, factor_candidatos=FACTOR_CANDIDATOS):
+        self.cuantizar = cuantizar
+        self.dim = dim
+        self.factor_candidatos = factor_candidatos
+        # ids int64 (n,); matriz float32 (n, d) normalizada, o int8 si cuantizar (d = dim si hay);
+        # escalas float32 (n,) solo en int8; completa float32 (n, 768) para re-ordenar (None si la
+        # matriz ya es exacta); docs [{"id", "content", "metadata"}] alineado con ids
+        self.datos = VACIA
+
+    ids = property(lambda self: self.datos.ids)
+    matriz = property(lambda self: self.datos.matriz)
+    escalas = property(lambda self: self.datos.escalas)
+    completa = property(lambda self: self.datos.completa)
+    docs = property(lambda self: self.datos.docs)
+
+    def __len__(self):
+        return len(self.datos.ids)
+
+    @property
+    def aproximado(self):
+        return self.cuantizar or bool(self.dim)
+
+    # --- CONSTRUCCIÓN ---
+    def _bloque(self, filas):
+        """Instantanea solo con `filas` {"id", "content", "metadata", "embedding"} (embedding: lista o texto '[...]')."""
+        vectores = [json.loads(f["embedding"]) if isinstance(f["embedding"], str) else f["embedding"] for f in filas]
+        completos = normalize_matrix(vectores)
+        matriz, escalas = truncar_matryoshka(completos, self.dim), None
+        if self.cuantizar: matriz, escalas = cuantizar_int8(matriz)
+        return Instantanea(
+            ids=np.array([f["id"] for f in filas], dtype=np.int64),
+            matriz=matriz,
+            escalas=escalas,
+            completa=completos if self.aproximado else None,
+            docs=[{"id": f["id"], "content": f.get("content"), "metadata": f.get("metadata", {})} for f in filas],
+        )
+
+    @staticmethod
+    def _unir(bloques):
+        """Una sola concatenación por arreglo (agregar página a página con vstack copia todo cada vez)."""
+        bloques = [b for b in bloques if len(b.ids)]
+        if len(bloques) < 2: return bloques[0] if bloques else VACIA
+        unir = lambda campo: (np.concatenate([getattr(b, campo) for b in bloques])
+                              if getattr(bloques[0], campo) is not None else None)
+        return Instantanea(ids=unir("ids"), matriz=unir("matriz"), escalas=unir("escalas"), completa=unir("completa"),
+                           docs=[doc for b in bloques for doc in b.docs])
+
+    def agregar(self, filas):
+        """Agrega filas {"id", "content", "metadata", "embedding"} (embedding: lista o texto '[...]')."""
+        if not filas: return
+        self.datos = self._unir([self.datos, self._bloque(filas)])
+
+    def quitar(self, ids_a_quitar):
+        ids_a_quitar = set(ids_a_quitar)
+        d = self.datos
+        if not ids_a_quitar or d.matriz is None: return 0
+        mantener = np.array([i not in ids_a_quitar for i in d.ids.tolist()], dtype=bool)
+        self.datos = Instantanea(
+            ids=d.ids[mantener],
+            matriz=np.ascontiguousarray(d.matriz[mantener]),
+            escalas=d.escalas[mantener] if d.escalas is not None else None,
+            completa=np.ascontiguousarray(d.completa[mantener]) if d.completa is not None else None,
+            docs=[doc for doc, m in zip(d.docs, mantener) if m],
+        )
+        return int((~mantener).sum())
+
+    def cargar_desde_supabase(self, supabase, tabla, desde_id=0, tam_pagina=500):
+        """Trae (paginado por id) todas las filas con id > desde_id; se publican todas juntas al final."""
+        ultimo = desde_id
+        bloques = [self.datos]
+        while True:
+            resp = (supabase.table(tabla).select("id, content, metadata, embedding")
+                    .gt("id", ultimo).order("id").limit(tam_pagina).execute())
+            filas = [f for f in (resp.data or []) if f.get("embedding")]
+            if filas: bloques.append(self._bloque(filas))
+            if not resp.data or len(resp.data) < tam_pagina: break
+            ultimo = resp.data[-1]["id"]
+        self.datos = self._unir(bloques)
+        return sum(len(b.ids) for b in bloques[1:])
+
+    def refrescar(self, supabase, tabla, tam_pagina=1000):
+        """
+        Incremental: quita los ids que ya no existen y carga los ids nuevos. Devuelve nº de cambios.
+        Se arma aparte y se publica al final: las búsquedas ven la versión anterior o la nueva entera.
+        """
+        vivos = set()
+        desde = 0
+        while True:
+            resp = supabase.table(tabla).select("id").order("id").range(desde, desde + tam_pagina - 1).execute()
+            vivos.update(d["id"] for d in resp.data or [])
+            if not resp.data or len(resp.data) < tam_pagina: break
+            desde += tam_pagina
+        nuevo = IndiceVectorial(self.cuantizar, self.dim, self.factor_candidatos)
+        nuevo.datos = self.datos
+        quitados = nuevo.quitar(set(nuevo.ids.tolist()) - vivos)
+        cargados = nuevo.cargar_desde_supabase(supabase, tabla, desde_id=int(nuevo.ids.max()) if len(nuevo) else 0)
+        self.datos = nuevo.datos
+        return quitados + cargados
+
+    # --- BÚSQUEDA ---
+    def puntajes(self, query_embedding, datos=None):
+        """Similitud de la primera pasada (prefijo y/o int8: aproximada si `aproximado`)."""
+        d = datos or self.datos
+        q = truncar_matryoshka(query_embedding, self.dim)[0]
+        if self.cuantizar:
+            return (d.matriz @ q) * (d.escalas / 127)
+        return d.matriz @ q
+
+    @staticmethod
+    def _top(sims, k):
+        k = min(k, len(sims))
+        top = np.argpartition(-sims, k - 1)[:k]
+        return top[np.argsort(-sims[top])]
+
+    def buscar(self, query_embedding, match_threshold=0.45, match_count=5, reordenar=True):
+        """Equivalente local de `rpc('match_documentos', ...)`."""
+        d = self.datos      # Una sola lectura: un `refrescar` a la par no cambia nada a mitad de la búsqueda
+        if not len(d.ids): return []
+        sims = self.puntajes(query_embedding, d)
+        if self.aproximado and reordenar and d.completa is not None:
+            # Ordenados por fila: con mmap se leen del disco en orden
+            candidatos = np.sort(self._top(sims, match_count * self.factor_candidatos))
+            exactas = d.completa[candidatos] @ normalize_matrix(query_embedding)[0]
+            orden = self._top(exactas, match_count)
+            top, sims_top = candidatos[orden], exactas[orden]
+        else:
+            top = self._top(sims, match_count)
+            sims_top = sims[top]
+        return [
+            {**d.docs[i], "similarity": float(s)}
+            for i, s in zip(top, sims_top) if s > match_threshold
+        ]
+
+    # --- SNAPSHOT EN DISCO ---
+    # Cada versión va en archivos propios (`<ruta_base>.<version>.ids.npy`, `.vec.npy`, `.esc.npy` en
+    # int8, `.full.npy` si re-ordena, `.docs.json`) y `<ruta_base>.json` (el manifiesto) dice cuál es
+    # la vigente: se escribe al final con os.replace. Nunca se sobrescribe un archivo que otro proceso
+    # pueda tener mapeado, y una caída a mitad deja el manifiesto apuntando a la versión anterior completa.
+    # Se borran solo las versiones más viejas que la anterior: quien acaba de leer el manifiesto viejo
+    # todavía la encuentra, y la que otro proceso esté escribiendo (más nueva) no se toca.
+    @staticmethod
+    def existe(ruta_base):
+        return os.path.exists(f"{ruta_base}.json") or os.path.exists(f"{ruta_base}.vec.npy")
+
+    def guardar(self, ruta_base):
+        if os.path.dirname(ruta_base): os.makedirs(os.path.dirname(ruta_base), exist_ok=True)
+        d = self.datos
+        version = f"{time.time_ns():x}"
+        partes = {"ids": d.ids, "vec": d.matriz if d.matriz is not None else np.zeros((0, 0), np.float32),
+                  "esc": d.escalas, "full": d.completa}
+        archivos = {}
+        for parte, arreglo in partes.items():
+            if arreglo is None: continue
+            archivos[parte] = f"{os.path.basename(ruta_base)}.{version}.{parte}.npy"
+            np.save(os.path.join(os.path.dirname(ruta_base), archivos[parte]), arreglo)
+        archivos["docs"] = f"{os.path.basename(ruta_base)}.{version}.docs.json"
+        with open(os.path.join(os.path.dirname(ruta_base), archivos["docs"]), "w", encoding="utf-8") as f:
+            json.dump(d.docs, f, ensure_ascii=False)
+        anterior = IndiceVectorial._version_vigente(ruta_base)
+        manifiesto = {"version": version, "n": len(d.ids), "cuantizar": self.cuantizar, "dim": self.dim,
+                      "archivos": archivos}
+        with open(f"{ruta_base}.json.tmp", "w", encoding="utf-8") as f:
+            json.dump(manifiesto, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f"{ruta_base}.json.tmp", f"{ruta_base}.json")
+        # La matriz completa (solo para re-ordenar) pasa a leerse del disco: deja de ocupar RAM
+        if "full" in archivos and not isinstance(d.completa, np.memmap) and self.datos is d:
+            self.datos = d._replace(completa=np.load(os.path.join(os.path.dirname(ruta_base), archivos["full"]), mmap_mode="r"))
+        # Quien tenga mapeados los archivos borrados los sigue leyendo hasta soltarlos
+        for viejo in glob.glob(f"{glob.escape(ruta_base)}.*.npy") + glob.glob(f"{glob.escape(ruta_base)}.*docs.json"):
+            partes = os.path.basename(viejo)[len(os.path.basename(ruta_base)) + 1:].split(".")
+            sin_version = len(partes) == 2     # Formato anterior al manifiesto
+            try:
+                if sin_version or (anterior is not None and int(partes[0], 16) < anterior): os.remove(viejo)
+            except (OSError, ValueError): pass
+
+    @staticmethod
+    def _version_vigente(ruta_base):
+        try:
+            with open(f"{ruta_base}.json", encoding="utf-8") as f: return int(json.load(f)["version"], 16)
+        except (OSError, ValueError, KeyError): return None
+
+    @classmethod
+    def cargar(cls, ruta_base, mmap=True):
+        """Carga la versión vigente; con `mmap` las matrices se mapean desde disco en vez de copiarse."""
+        modo = "r" if mmap else None
+        if os.path.exists(f"{ruta_base}.json"):
+            with open(f"{ruta_base}.json", encoding="utf-8") as f: manifiesto = json.load(f)
+            rutas = {p: os.path.join(os.path.dirname(ruta_base), a) for p, a in manifiesto["archivos"].items()}
+        else:
+            manifiesto = None
+            rutas = {p: f"{ruta_base}.{p}.npy" for p in ("ids", "vec", "esc", "full")}
+            rutas["docs"] = f"{ruta_base}.docs.json"
+            rutas = {p: r for p, r in rutas.items() if os.path.exists(r)}
+        matriz = np.load(rutas["vec"], mmap_mode=modo)
+        completa = np.load(rutas["full"], mmap_mode=modo) if "full" in rutas else None
+        if manifiesto is not None: idx = cls(cuantizar=manifiesto["cuantizar"], dim=manifiesto["dim"])
+        else:
+            dim = matriz.shape[1] if completa is not None and matriz.size and matriz.shape[1] < completa.shape[1] else None
+            idx = cls(cuantizar=matriz.dtype == np.int8, dim=dim)
+        with open(rutas["docs"], encoding="utf-8") as f:
+            docs = json.load(f)
+        ids = np.load(rutas["ids"])
+        escalas = np.load(rutas["esc"]) if "esc" in rutas else None
+        largos = {"ids": len(ids), "docs": len(docs), "vec": len(matriz) if matriz.size else 0,
+                  "esc": len(escalas) if escalas is not None else None,
+                  "full": len(completa) if completa is not None else None}
+        if manifiesto is not None: largos["manifiesto"] = manifiesto["n"]
+        if len({n for n in largos.values() if n is not None}) > 1:
+            raise ValueError(f"Snapshot '{ruta_base}' inconsistente: {largos}")
+        idx.datos = Instantanea(
+            ids=ids,
+            matriz=matriz if matriz.size else None,
+            escalas=escalas,
+            completa=completa,
+            docs=docs,
+        )
+        return idx
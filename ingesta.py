@@ -1,4 +1,6 @@
 import os
+import sys
+import argparse
 import pandas as pd
 import numpy as np
 import google.genai as genai
@@ -7,7 +9,15 @@ from supabase import create_client, Client
 from dotenv import load_dotenv
 import time
 import re
+import hashlib
 import unicodedata
+from embeddings import TokenBucket, EmbedderGemini, embeber_concurrente, pipeline_streaming, serializar_vector
+from lector_planillas import iterar_filas
+from bitacora_ingesta import Bitacora, id_corrida, registrar_fallido
+from cache_embeddings import obtener_cache, EmbedderConCache
+from cache_respuestas import marcar_datos_cambiados
+from resumen_stats import construir_resumen, leer_metadatas, guardar_resumen
+from planificador import obtener_planificador, INGESTA
 
 # --- CARGAR CLAVES ---
 load_dotenv(".env")
@@ -25,6 +35,12 @@ client = genai.Client(api_key=GEMINI_API_KEY)
 TABLE_NAME = "documentos_dj"
 EMBEDDING_MODEL = "models/text-embedding-004"
 DIMENSION = 768
+EMBED_RPS = float(os.environ.get("EMBED_RPS", "10"))  # Peticiones de embedding por segundo
+INSERT_REINTENTOS = int(os.environ.get("INSERT_REINTENTOS", "4"))
+INSERT_BACKOFF_S = float(os.environ.get("INSERT_BACKOFF_S", "1"))   # Espera base: 1s, 2s, 4s...
+COLUMNAS_TABLA = ("content", "metadata", "embedding", "content_hash")
+
+LIMITADOR_EMBED = TokenBucket(EMBED_RPS)
 
 # --- HERRAMIENTAS ---
 def normalize_vector(vector):
@@ -34,8 +50,12 @@ def normalize_vector(vector):
     return (arr / norm).tolist()
 
 def get_embedding(text: str):
+    cache = obtener_cache()
+    guardado = cache.get(EMBEDDING_MODEL, DIMENSION, "RETRIEVAL_DOCUMENT", text)
+    if guardado is not None: return normalize_vector(guardado)
     try:
-        time.sleep(0.1) 
+        LIMITADOR_EMBED.adquirir()
+        obtener_planificador().adquirir(EMBEDDING_MODEL, INGESTA)
         result = client.models.embed_content(
             model=EMBEDDING_MODEL,
             contents=text,
@@ -44,11 +64,38 @@ def get_embedding(text: str):
                 output_dimensionality=DIMENSION
             )
         )
-        return normalize_vector(result.embeddings[0].values)
+        vector = normalize_vector(result.embeddings[0].values)
+        cache.put(EMBEDDING_MODEL, DIMENSION, "RETRIEVAL_DOCUMENT", text, vector)
+        return vector
     except Exception as e:
         print(f"❌ Error vectorizando: {e}")
         return None
 
+def crear_embedder():
+    """Embedder por lotes de Gemini, detrás de la caché persistente."""
+    return EmbedderConCache(
+        EmbedderGemini(client, EMBEDDING_MODEL, DIMENSION, task_type="RETRIEVAL_DOCUMENT"),
+        obtener_cache(), EMBEDDING_MODEL, DIMENSION, "RETRIEVAL_DOCUMENT"
+    )
+
+class LimitadorIngesta:
+    """
+    Ficha local (`rps` de esta ingesta) + turno de baja prioridad en el planificador del proceso.
+    La ingesta corre en su propio proceso: su cola y sus 429 no se comparten con el bot ni la web,
+    así que `rps` (EMBED_RPS) debe dejarles su parte de la cuota.
+    """
+
+    def __init__(self, rps):
+        self.local = TokenBucket(rps)
+        self.compartido = obtener_planificador().limitador(EMBEDDING_MODEL, INGESTA)
+
+    def adquirir(self):
+        self.local.adquirir()
+        self.compartido.adquirir()
+
+    def penalizar(self, error):
+        return self.compartido.penalizar(error)
+
 def limpiar_texto_nuclear(val):
     """Limpia valores y títulos: quita dobles espacios y normaliza."""
     if val is None: return ""
@@ -58,10 +105,23 @@ def limpiar_texto_nuclear(val):
     # Reemplaza cualquier secuencia de espacios por uno solo
     return re.sub(r'\s+', ' ', texto).strip()
 
+def hash_fila(contenido, meta):
+    """Huella estable de una fila: id_excel + contenido normalizado."""
+    base = f"{meta.get('id_excel', '')}\x1f{limpiar_texto_nuclear(contenido).lower()}"
+    return hashlib.sha256(base.encode("utf-8")).hexdigest()
+
+def actualizar_resumen():
+    """Recalcula el resumen de conteos (estado x año x cliente) que usa la ruta SQL."""
+    try:
+        resumen = construir_resumen(leer_metadatas(supabase, TABLE_NAME))
+        guardar_resumen(resumen, supabase)
+        print(f"   📈 Resumen actualizado ({resumen['total']} filas).")
+    except Exception as e:
+        print(f"   ⚠️ No se pudo actualizar el resumen: {e}")
+
 # --- PROCESAMIENTO ---
-def procesar_excel_universal(archivo_path):
-    print(f"🚀 Iniciando carga a '{TABLE_NAME}' con LIMPIEZA TOTAL...")
-    
+def leer_archivo(archivo_path):
+    """Lee Excel (o CSV de respaldo) y limpia los nombres de columnas."""
     try:
         try:
             df = pd.read_excel(archivo_path)
@@ -69,7 +129,7 @@ def procesar_excel_universal(archivo_path):
             df = pd.read_csv(archivo_path, encoding="utf-8")
     except Exception as e:
         print(f"❌ Error leyendo archivo: {e}")
-        return
+        return None
 
     df = df.fillna("")
     
@@ -87,10 +147,11 @@ def procesar_excel_universal(archivo_path):
     
     # Asignamos los nombres limpios al DataFrame para trabajar fácil
     df.columns = columnas_limpias
-    total = len(df)
-    
-    batch = []
-    
+    return df
+
+def construir_filas(df):
+    """Genera (index, contenido_final, meta) por cada fila con contenido útil."""
+    columnas_limpias = df.columns.tolist()
     for index, row in df.iterrows():
         meta = {}
         contenido_partes = []
@@ -108,52 +169,263 @@ def procesar_excel_universal(archivo_path):
         contenido_final = ". ".join(contenido_partes)
 
         if len(contenido_final) < 5: continue
+        yield index, contenido_final, meta
+
+def procesar_excel_universal(archivo_path):
+    print(f"🚀 Iniciando carga a '{TABLE_NAME}' con LIMPIEZA TOTAL...")
 
+    df = leer_archivo(archivo_path)
+    if df is None: return
+    total = len(df)
+    
+    batch = []
+    
+    for index, contenido_final, meta in construir_filas(df):
         vector = get_embedding(contenido_final)
         
+        registro = {"content": contenido_final, "metadata": meta, "content_hash": hash_fila(contenido_final, meta)}
         if vector:
-            batch.append({
-                "content": contenido_final,
-                "metadata": meta,
-                "embedding": vector
-            })
+            batch.append({**registro, "embedding": vector})
             
             if (index + 1) % 50 == 0: 
                 print(f"   Procesando fila {index+1}/{total}...")
+        else:
+            registrar_fallido([registro], "embedding", "sin vector", lote=index)
 
         if len(batch) >= 50:
-            try:
-                supabase.table(TABLE_NAME).insert(batch).execute()
-                print(f"   💾 Lote guardado (Fila {index+1})")
-                batch = []
-            except Exception as e:
-                print(f"   ❌ Error en lote: {e}")
-                batch = []
-
-    if batch:
-        supabase.table(TABLE_NAME).insert(batch).execute()
+            # Con reintentos; si igual falla el lote va al dead-letter en vez de perderse
+            if guardar_lote(batch, etiqueta=f"fila {index+1}"): print(f"   💾 Lote guardado (Fila {index+1})")
+            batch = []
+
+    if batch and guardar_lote(batch, etiqueta="final"):
         print("   💾 Último lote guardado.")
+    marcar_datos_cambiados()
+    actualizar_resumen()
         
     print("🎉 ¡Ingesta Finalizada! Ahora sí está todo limpio.")
 
+def insertar_con_reintentos(batch, reintentos=INSERT_REINTENTOS, etiqueta=""):
+    """Inserta un lote reintentando con backoff exponencial; si se agotan los intentos relanza el error."""
+    filas = [{c: r[c] for c in COLUMNAS_TABLA if c in r} for r in batch]
+    for f in filas:
+        # Texto '[...]' con las cifras que guarda la columna (vector o halfvec): payload 2-3x menor
+        if f.get("embedding") is not None: f["embedding"] = serializar_vector(f["embedding"])
+    for intento in range(reintentos):
+        try:
+            return supabase.table(TABLE_NAME).insert(filas).execute()
+        except Exception as e:
+            print(f"   ❌ Error en lote {etiqueta} (Intento {intento+1}/{reintentos}): {e}")
+            if intento == reintentos - 1: raise
+            time.sleep(INSERT_BACKOFF_S * 2 ** intento)
+
+def guardar_lote(batch, etiqueta=""):
+    """`insertar_con_reintentos` que no relanza: el lote fallido queda en el dead-letter. Devuelve si se guardó."""
+    try:
+        insertar_con_reintentos(batch, etiqueta=etiqueta)
+        return True
+    except Exception as e:
+        registrar_fallido(batch, "insert", e, lote=etiqueta)
+        return False
+
+def insertar_en_lotes(filas, tam_lote=50):
+    """
+    Inserta filas ya vectorizadas en `TABLE_NAME`, de `tam_lote` en `tam_lote`.
+    Devuelve (insertadas, fallidas); las fallidas quedan en el dead-letter.
+    """
+    insertadas, fallidas = 0, 0
+    for i in range(0, len(filas), tam_lote):
+        batch = filas[i:i + tam_lote]
+        if guardar_lote(batch, etiqueta=str(i)):
+            insertadas += len(batch)
+            print(f"   💾 Lote guardado ({i + len(batch)}/{len(filas)})")
+        else: fallidas += len(batch)
+    marcar_datos_cambiados()
+    return insertadas, fallidas
+
+def procesar_excel_concurrente(archivo_path, embedder=None, tam_lote=100, max_en_vuelo=4, rps=EMBED_RPS):
+    """
+    Igual que `procesar_excel_universal`, pero manda muchos textos por llamada de embedding
+    y mantiene varias llamadas en vuelo (limitadas por un token bucket de `rps`).
+    `embedder` es cualquier callable lista_de_textos -> lista_de_vectores (por defecto Gemini).
+    """
+    print(f"🚀 Carga CONCURRENTE a '{TABLE_NAME}' (lotes de {tam_lote}, {max_en_vuelo} en vuelo)...")
+
+    df = leer_archivo(archivo_path)
+    if df is None: return None
+
+    filas = list(construir_filas(df))
+    if embedder is None:
+        embedder = crear_embedder()
+
+    textos = [contenido for _, contenido, _ in filas]
+    vectores, stats = embeber_concurrente(
+        textos, embedder, tam_lote=tam_lote, max_en_vuelo=max_en_vuelo, limitador=LimitadorIngesta(rps)
+    )
+    print(f"   ⚡ Embeddings: {stats} | Caché: {obtener_cache().stats()}")
+
+    registros = [
+        {"content": contenido, "metadata": meta, "embedding": vec.tolist(), "content_hash": hash_fila(contenido, meta)}
+        for (_, contenido, meta), vec in zip(filas, vectores) if vec is not None
+    ]
+    insertadas, fallidas = insertar_en_lotes(registros)
+    actualizar_resumen()
+    if fallidas: print(f"   ⚠️ {fallidas} filas no se insertaron (ver dead-letter).")
+    print(f"🎉 ¡Ingesta Finalizada! {insertadas} filas a {stats.filas_por_seg:.1f} filas/s.")
+    return stats
+
+def insertar_lote(batch):
+    insertar_con_reintentos(batch, etiqueta=f"pos {batch[0].get('pos', '?')}")
+    print(f"   💾 Lote guardado ({len(batch)} filas)")
+
+def procesar_archivos_streaming(rutas, embedder=None, tam_lote=100, max_en_vuelo=4, rps=EMBED_RPS, hojas=None,
+                                reanudar=False):
+    """
+    Ingesta de uno o varios archivos (todas sus hojas, o solo `hojas`) sin cargarlos en memoria:
+    lectura por bloques -> embedding concurrente -> insert, con colas acotadas entre etapas.
+    Todo queda en una bitácora local (vectores embebidos y filas insertadas); con `reanudar=True`
+    sigue una corrida cortada sin repetir inserts ni llamadas de embedding ya hechas.
+    """
+    if isinstance(rutas, str): rutas = [rutas]
+    modo = "REANUDANDO carga" if reanudar else "Carga STREAMING"
+    print(f"🚀 {modo} a '{TABLE_NAME}' de {len(rutas)} archivo(s) (lotes de {tam_lote}, {max_en_vuelo} en vuelo)...")
+    if embedder is None:
+        embedder = crear_embedder()
+
+    bitacora = Bitacora(id_corrida(rutas, hojas), reanudar=reanudar)
+    if reanudar: print(f"   📒 Bitácora {bitacora.corrida}: {bitacora.hechas()} filas ya insertadas")
+    registros = (
+        {"pos": pos, "content": contenido, "metadata": meta, "content_hash": hash_fila(contenido, meta)}
+        for pos, (_, contenido, meta) in enumerate(iterar_filas(rutas, hojas=hojas))
+    )
+    stats = pipeline_streaming(registros, embedder, insertar_lote, tam_lote=tam_lote,
+                               max_en_vuelo=max_en_vuelo, limitador=LimitadorIngesta(rps), bitacora=bitacora)
+    print(f"   ⚡ Embeddings: {stats} | Caché: {obtener_cache().stats()}")
+    print(f"   📒 Bitácora: {bitacora.stats()}")
+    if stats.fallidas: print("   ⚠️ Hubo lotes fallidos (ver dead-letter); se completan con --resume.")
+    marcar_datos_cambiados()
+    actualizar_resumen()
+    print(f"🎉 ¡Ingesta Finalizada! {stats.insertadas} filas en {stats.segundos:.1f}s.")
+    return stats
+
+# --- SINCRONIZACIÓN INCREMENTAL ---
+def obtener_hashes_existentes(tam_pagina=1000):
+    """Devuelve {content_hash: [ids]} de toda la tabla (paginado). Filas sin hash van bajo None."""
+    existentes = {}
+    desde = 0
+    while True:
+        resp = supabase.table(TABLE_NAME).select("id, content_hash").order("id").range(desde, desde + tam_pagina - 1).execute()
+        for d in resp.data or []:
+            existentes.setdefault(d.get("content_hash"), []).append(d["id"])
+        if not resp.data or len(resp.data) < tam_pagina: break
+        desde += tam_pagina
+    return existentes
+
+def borrar_ids(ids, tam_lote=200):
+    for i in range(0, len(ids), tam_lote):
+        supabase.table(TABLE_NAME).delete().in_("id", ids[i:i + tam_lote]).execute()
+    marcar_datos_cambiados()
+
+def sincronizar_excel(archivo_path, embedder=None, tam_lote=100, max_en_vuelo=4, rps=EMBED_RPS):
+    """
+    Refresco incremental e idempotente: solo embebe e inserta filas nuevas o cambiadas
+    (por `content_hash`) y luego borra las que ya no están en el archivo.
+    Se inserta ANTES de borrar, así la tabla nunca queda vacía durante el refresco.
+    `archivo_path` puede ser una lista: la tabla queda igual a la unión de todos los archivos.
+    Si algún archivo u hoja no se pudo leer (o no existe), no se toca nada: sus filas se
+    tomarían por obsoletas y se borrarían.
+    """
+    print(f"🔄 Sincronizando '{archivo_path}' con '{TABLE_NAME}'...")
+
+    # Mismo lector que la ingesta en streaming, para que los content_hash coincidan
+    nuevos, fallidos = {}, []
+    for _, contenido, meta in iterar_filas(archivo_path, fallidos=fallidos):
+        nuevos.setdefault(hash_fila(contenido, meta), (contenido, meta))
+    if fallidos:
+        print(f"   ⛔ Sincronización cancelada: {len(fallidos)} archivo(s)/hoja(s) sin leer {[r for r, _ in fallidos]}")
+        return None
+    if not nuevos: return None
+
+    existentes = obtener_hashes_existentes()
+    pendientes = [(h, c, m) for h, (c, m) in nuevos.items() if h not in existentes]
+
+    # Sobran: hashes que ya no existen en el archivo (o filas viejas sin hash) y duplicados
+    sobrantes = []
+    for h, ids in existentes.items():
+        sobrantes.extend(ids if h not in nuevos else ids[1:])
+
+    print(f"   📊 Archivo: {len(nuevos)} filas | Sin cambios: {len(nuevos) - len(pendientes)} | "
+          f"Nuevas/cambiadas: {len(pendientes)} | A borrar: {len(sobrantes)}")
+
+    insertadas = 0
+    if pendientes:
+        if embedder is None:
+            embedder = crear_embedder()
+        vectores, stats = embeber_concurrente(
+            [c for _, c, _ in pendientes], embedder,
+            tam_lote=tam_lote, max_en_vuelo=max_en_vuelo, limitador=LimitadorIngesta(rps)
+        )
+        print(f"   ⚡ Embeddings: {stats} | Caché: {obtener_cache().stats()}")
+        registros = [
+            {"content": c, "metadata": m, "embedding": vec.tolist(), "content_hash": h}
+            for (h, c, m), vec in zip(pendientes, vectores) if vec is not None
+        ]
+        insertadas, fallidas = insertar_en_lotes(registros)
+        if stats.fallidas or fallidas:
+            # No borramos nada si faltó insertar algo (las filas viejas son el reemplazo): el próximo refresco lo completa
+            print("   ⚠️ Hubo lotes fallidos; se omite el borrado hasta el próximo refresco.")
+            actualizar_resumen()
+            return {"insertadas": insertadas, "borradas": 0, "sin_cambios": len(nuevos) - len(pendientes)}
+
+    if sobrantes:
+        borrar_ids(sobrantes)
+        print(f"   🗑️  {len(sobrantes)} filas obsoletas eliminadas.")
+
+    if pendientes or sobrantes: actualizar_resumen()
+    print("🎉 ¡Sincronización terminada!")
+    return {"insertadas": insertadas, "borradas": len(sobrantes), "sin_cambios": len(nuevos) - len(pendientes)}
+
 if __name__ == "__main__":
-    archivo = "file_4.xlsx"
+    # Uno o varios archivos: python ingesta.py a.xlsx b.csv ...  (--resume sigue una carga cortada)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("archivos", nargs="*", default=["file_4.xlsx"])
+    parser.add_argument("--resume", action="store_true", help="Reanuda la última carga de estos archivos desde la bitácora")
+    args = parser.parse_args()
+    archivos = [a for a in args.archivos if os.path.exists(a)]
+    for a in args.archivos:
+        if not os.path.exists(a): print(f"⚠️ No existe '{a}': se omite")
+    # "streaming" = lectura por bloques + pipeline con colas acotadas (memoria plana);
+    # "lotes" = embeddings por lotes y concurrentes, archivo entero en memoria; "fila" = el original
+    modo = os.environ.get("INGESTA_MODO", "streaming")
+
+    def procesar(rutas):
+        if not rutas: return
+        if modo == "streaming": return procesar_archivos_streaming(rutas)
+        for ruta in rutas:
+            if modo == "lotes": procesar_excel_concurrente(ruta)
+            else: procesar_excel_universal(ruta)
     
     print("--- INGESTA CON LIMPIEZA DE COLUMNAS ---")
+
+    if args.resume:
+        # Sin vaciar la tabla: lo insertado antes del corte se queda
+        if archivos: procesar_archivos_streaming(archivos, reanudar=True)
+        sys.exit(0)
     
-    # TRUNCATE OBLIGATORIO PARA QUITAR LA BASURA VIEJA
-    confirm = input("¿Vaciar tabla antes de subir (Recomendado)? (s/n): ")
+    # TRUNCATE OBLIGATORIO PARA QUITAR LA BASURA VIEJA (o sincronización incremental con 'i')
+    confirm = input("¿Vaciar tabla antes de subir? (s/n, i = sincronizar solo cambios): ")
     
-    if confirm.lower() == "s":
+    if confirm.lower() == "i":
+        # Con la lista completa: si falta un archivo, sincronizar_excel no borra sus filas
+        if archivos: sincronizar_excel(args.archivos)
+    elif confirm.lower() == "s":
         print("🗑️  Vaciando tabla...")
         try:
             supabase.table(TABLE_NAME).delete().neq("id", 0).execute()
+            marcar_datos_cambiados()
             print("✅ Datos eliminados.")
-            if os.path.exists(archivo):
-                procesar_excel_universal(archivo)
+            procesar(archivos)
         except Exception as e:
             print(f"❌ Error borrando: {e}")
             print("💡 Tip: Si falla, ejecuta 'TRUNCATE TABLE documentos_dj;' en Supabase SQL Editor.")
     else:
-        if os.path.exists(archivo):
-            procesar_excel_universal(archivo)
\ No newline at end of file
+        procesar(archivos)
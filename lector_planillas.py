@@ -0,0 +1,131 @@
+import os
+import pandas as pd
+
+# --- CONFIGURACIÓN ---
+TAM_BLOQUE = int(os.environ.get("LECTURA_TAM_BLOQUE", "2000"))   # Filas por bloque leído (memoria ~ constante)
+NULOS = ["nan", "nat", "none", "null", ""]
+EXT_CSV = (".csv", ".txt")
+EXT_XLSX = (".xlsx", ".xlsm")
+
+# --- 1. LIMPIEZA VECTORIZADA ---
+def limpiar_serie(serie):
+    """Equivalente vectorizado de `ingesta.limpiar_texto_nuclear` para una columna completa."""
+    texto = serie.astype(object).where(serie.notna(), "").astype(str)
+    nulos = texto.str.lower().isin(NULOS)
+    texto = texto.str.normalize("NFKC").str.replace(r"\s+", " ", regex=True).str.strip()
+    return texto.mask(nulos, "")
+
+def limpiar_columnas(nombres):
+    """Títulos limpios en minúscula ("ESTADO DE  CARGA" -> "estado de carga"), como los deja pandas."""
+    limpios = limpiar_serie(pd.Series(list(nombres), dtype=object)).str.lower().tolist()
+    vistos, columnas = {}, []
+    for i, nombre in enumerate(limpios):
+        nombre = nombre or f"unnamed: {i}"
+        if nombre in vistos:
+            vistos[nombre] += 1
+            nombre = f"{nombre}.{vistos[nombre]}"
+        else:
+            vistos[nombre] = 0
+        columnas.append(nombre)
+    return columnas
+
+def limpiar_bloque(df):
+    return pd.DataFrame({col: limpiar_serie(df[col]) for col in df.columns}, index=df.index)
+
+# --- 2. LECTURA POR BLOQUES ---
+def _bloques_xlsx(ruta, tam_bloque, hojas):
+    """XLSX fila a fila (openpyxl read_only): nunca se carga la hoja completa."""
+    from openpyxl import load_workbook
+    libro = load_workbook(ruta, read_only=True, data_only=True)
+    try:
+        for hoja in libro.worksheets:
+            if hojas and hoja.title not in hojas: continue
+            filas = hoja.iter_rows(values_only=True)
+            encabezado = next(filas, None)
+            if not encabezado or all(v is None for v in encabezado): continue
+            columnas = limpiar_columnas(encabezado)
+            print(f"📊 [{os.path.basename(ruta)} / {hoja.title}] Columnas: {columnas}")
+            n, buffer, inicio = len(columnas), [], 0
+            for fila in filas:
+                fila = fila[:n] if len(fila) >= n else fila + (None,) * (n - len(fila))
+                buffer.append(fila)
+                if len(buffer) >= tam_bloque:
+                    yield hoja.title, inicio, limpiar_bloque(pd.DataFrame(buffer, columns=columnas, dtype=object))
+                    inicio += len(buffer)
+                    buffer = []
+            if buffer:
+                yield hoja.title, inicio, limpiar_bloque(pd.DataFrame(buffer, columns=columnas, dtype=object))
+    finally:
+        libro.close()
+
+def _bloques_csv(ruta, tam_bloque):
+    inicio = 0
+    for df in pd.read_csv(ruta, dtype=str, keep_default_na=False, chunksize=tam_bloque, encoding="utf-8"):
+        if inicio == 0: print(f"📊 [{os.path.basename(ruta)}] Columnas: {limpiar_columnas(df.columns)}")
+        df.columns = limpiar_columnas(df.columns)
+        yield None, inicio, limpiar_bloque(df)
+        inicio += len(df)
+
+def _bloques_pandas(ruta, tam_bloque, hojas):
+    """Formatos sin lector por filas (.xls, .ods...): se leen enteros y se entregan igual, por bloques."""
+    for hoja, df in pd.read_excel(ruta, sheet_name=list(hojas) if hojas else None, dtype=object).items():
+        df.columns = limpiar_columnas(df.columns)
+        print(f"📊 [{os.path.basename(ruta)} / {hoja}] Columnas: {df.columns.tolist()}")
+        for i in range(0, len(df), tam_bloque):
+            yield hoja, i, limpiar_bloque(df.iloc[i:i + tam_bloque])
+
+def leer_bloques(ruta, tam_bloque=TAM_BLOQUE, hojas=None):
+    """
+    Genera (hoja, fila_inicial, DataFrame de textos limpios) de a `tam_bloque` filas.
+    XLSX: todas las hojas (o solo `hojas`); CSV: hoja None.
+    """
+    ext = os.path.splitext(ruta)[1].lower()
+    if ext in EXT_CSV: return _bloques_csv(ruta, tam_bloque)
+    if ext in EXT_XLSX: return _bloques_xlsx(ruta, tam_bloque, hojas)
+    return _bloques_pandas(ruta, tam_bloque, hojas)
+
+def hojas_de(ruta):
+    """Nombres de las hojas de un libro (sin leer sus datos). CSV: [None]."""
+    ext = os.path.splitext(ruta)[1].lower()
+    if ext in EXT_CSV: return [None]
+    if ext in EXT_XLSX:
+        from openpyxl import load_workbook
+        libro = load_workbook(ruta, read_only=True)
+        try: return libro.sheetnames
+        finally: libro.close()
+    return list(pd.ExcelFile(ruta).sheet_names)
+
+# --- 3. FILAS PARA INDEXAR ---
+def filas_de_bloque(df, inicio=0, extra=None):
+    """Genera (index, contenido, meta) como `ingesta.construir_filas`, pero sin iterrows (columnas ya limpias)."""
+    claves = ["id_excel" if c == "id" else c for c in df.columns]
+    valores = [df[c].tolist() for c in df.columns]
+    for i, fila in enumerate(zip(*valores)):
+        contenido = ". ".join(f"{k}: {v}" for k, v in zip(claves, fila) if v)
+        if len(contenido) < 5: continue
+        meta = dict(zip(claves, fila))
+        if extra: meta.update(extra)
+        yield inicio + i, contenido, meta
+
+def iterar_filas(rutas, tam_bloque=TAM_BLOQUE, hojas=None, fallidos=None):
+    """
+    Todas las filas útiles de uno o varios archivos, en streaming.
+    Si un libro tiene varias hojas, cada fila lleva la suya en meta["hoja"].
+    Un archivo que no se pudo leer (o una hoja pedida que no está) se salta y, si se pasa
+    la lista `fallidos`, queda anotado ahí como (ruta, error): quien borra filas debe mirarla.
+    """
+    if isinstance(rutas, (str, os.PathLike)): rutas = [rutas]
+    for ruta in rutas:
+        try:
+            disponibles = hojas_de(ruta)
+            if hojas and None not in disponibles:
+                for faltante in [h for h in hojas if h not in disponibles]:
+                    print(f"❌ '{ruta}' no tiene la hoja '{faltante}'")
+                    if fallidos is not None: fallidos.append((ruta, f"no tiene la hoja '{faltante}'"))
+            nombres = [h for h in disponibles if not hojas or h in hojas]
+            varias = len(nombres) > 1
+            for hoja, inicio, df in leer_bloques(ruta, tam_bloque, hojas):
+                yield from filas_de_bloque(df, inicio, {"hoja": hoja} if varias else None)
+        except Exception as e:
+            print(f"❌ Error leyendo '{ruta}': {e}")
+            if fallidos is not None: fallidos.append((ruta, str(e)))
@@ -0,0 +1,192 @@
+import os
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# --- CONFIGURACIÓN ---
+BACKEND = os.environ.get("MEMORIA_BACKEND", "sqlite")              # "sqlite" (persistente, varios procesos) o "local"
+RUTA_MEMORIA = os.environ.get("MEMORIA_PATH", ".cache/conversaciones.sqlite")
+MAX_MENSAJES = int(os.environ.get("MEMORIA_MAX_MENSAJES", "10"))   # Por usuario; los más viejos pasan al resumen
+TTL_S = float(os.environ.get("MEMORIA_TTL_S", str(7 * 24 * 3600))) # Usuario inactivo más que esto = se olvida
+MAX_USUARIOS = int(os.environ.get("MEMORIA_MAX_USUARIOS", "5000")) # Más que esto = se olvidan los menos recientes (LRU)
+MAX_CHARS_RESUMEN = 600                                             # El resumen se queda con lo más reciente que quepa
+MAX_CHARS_LINEA = 120
+PURGA_CADA_S = 60
+
+# --- 1. RESUMEN RODANTE ---
+def resumir_local(resumen, mensajes, max_chars=MAX_CHARS_RESUMEN):
+    """
+    Resumen extractivo sin llamar a la IA: una línea corta por mensaje que sale de la ventana,
+    agregada al resumen anterior; si no cabe, se pierden las líneas más viejas.
+    """
+    lineas = [l for l in (resumen or "").split("\n") if l]
+    for m in mensajes:
+        texto = " ".join(str(m.get("content") or "").split())
+        if not texto: continue
+        if len(texto) > MAX_CHARS_LINEA: texto = texto[:MAX_CHARS_LINEA - 1] + "…"
+        lineas.append(f"{'USER' if m.get('role') == 'user' else 'IA'}: {texto}")
+    while lineas and len("\n".join(lineas)) > max_chars: lineas.pop(0)
+    return "\n".join(lineas)
+
+def plegar(resumen, mensajes, max_mensajes, resumidor=resumir_local):
+    """Deja los últimos `max_mensajes` y pasa los anteriores al resumen. Devuelve (resumen, mensajes)."""
+    if len(mensajes) <= max_mensajes: return resumen, mensajes
+    corte = len(mensajes) - max_mensajes
+    return resumidor(resumen, mensajes[:corte]), mensajes[corte:]
+
+def con_resumen(resumen, mensajes):
+    """Historial como lo espera el cerebro: el resumen (si hay) va primero con role "resumen"."""
+    return ([{"role": "resumen", "content": resumen}] if resumen else []) + mensajes
+
+# --- 2. MEMORIA EN PROCESO ---
+class MemoriaLocal:
+    """Historiales en memoria del proceso, con tope por usuario, LRU de usuarios y TTL de inactividad."""
+
+    def __init__(self, max_mensajes=MAX_MENSAJES, ttl=TTL_S, max_usuarios=MAX_USUARIOS, resumidor=resumir_local):
+        self.max_mensajes = max_mensajes
+        self.ttl = ttl
+        self.max_usuarios = max_usuarios
+        self.resumidor = resumidor
+        self.usuarios = OrderedDict()   # usuario -> {"resumen", "mensajes", "uso"}
+        self.lock = threading.Lock()
+        self.olvidados = 0
+
+    def historial(self, usuario):
+        with self.lock:
+            e = self.usuarios.get(str(usuario))
+            if e is None: return []
+            if time.time() - e["uso"] > self.ttl:
+                del self.usuarios[str(usuario)]
+                self.olvidados += 1
+                return []
+            return con_resumen(e["resumen"], list(e["mensajes"]))
+
+    def agregar(self, usuario, mensajes):
+        with self.lock:
+            e = self.usuarios.pop(str(usuario), None) or {"resumen": "", "mensajes": []}
+            e["resumen"], e["mensajes"] = plegar(e["resumen"], e["mensajes"] + list(mensajes), self.max_mensajes, self.resumidor)
+            e["uso"] = time.time()
+            self.usuarios[str(usuario)] = e
+            while len(self.usuarios) > self.max_usuarios:
+                self.usuarios.popitem(last=False)
+                self.olvidados += 1
+
+    def borrar(self, usuario):
+        with self.lock: self.usuarios.pop(str(usuario), None)
+
+    def stats(self):
+        with self.lock:
+            return {"backend": "local", "usuarios": len(self.usuarios), "olvidados": self.olvidados,
+                    "mensajes": sum(len(e["mensajes"]) for e in self.usuarios.values())}
+
+# --- 3. MEMORIA PERSISTENTE (SQLite) ---
+class MemoriaSQLite:
+    """
+    Historiales en un SQLite local (WAL): sobreviven a reinicios y los comparten varios procesos
+    del bot en la misma máquina. Cada `agregar` es una transacción `begin immediate`, así dos
+    workers que atienden al mismo usuario no se pisan el recorte ni el resumen. Cada
+    PURGA_CADA_S se olvidan los usuarios inactivos (TTL) y los que sobran (LRU por último uso).
+    """
+
+    def __init__(self, ruta=RUTA_MEMORIA, max_mensajes=MAX_MENSAJES, ttl=TTL_S, max_usuarios=MAX_USUARIOS,
+                 resumidor=resumir_local):
+        if ruta != ":memory:" and os.path.dirname(ruta):
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        self.ruta = ruta
+        self.max_mensajes = max_mensajes
+        self.ttl = ttl
+        self.max_usuarios = max_usuarios
+        self.resumidor = resumidor
+        self.lock = threading.Lock()
+        self.olvidados = 0
+        self.proxima_purga = 0.0
+        self.db = sqlite3.connect(ruta, check_same_thread=False, timeout=30, isolation_level=None)
+        self.db.execute("pragma journal_mode=wal")
+        self.db.execute("""
+            create table if not exists usuarios (
+                usuario text primary key,
+                resumen text not null default '',
+                ultimo_uso real not null
+            )""")
+        self.db.execute("""
+            create table if not exists mensajes (
+                id integer primary key autoincrement,
+                usuario text not null,
+                role text not null,
+                content text not null,
+                traza text
+            )""")
+        self.db.execute("create index if not exists mensajes_usuario on mensajes (usuario, id)")
+        self.db.execute("create index if not exists usuarios_uso on usuarios (ultimo_uso)")
+
+    def historial(self, usuario):
+        with self.lock:
+            fila = self.db.execute("select resumen, ultimo_uso from usuarios where usuario = ?", (str(usuario),)).fetchone()
+            if fila is None or time.time() - fila[1] > self.ttl: return []
+            mensajes = [{"role": r, "content": c, "traza": t} for r, c, t in self.db.execute(
+                "select role, content, traza from mensajes where usuario = ? order by id", (str(usuario),))]
+        return con_resumen(fila[0], mensajes)
+
+    def agregar(self, usuario, mensajes):
+        usuario = str(usuario)
+        with self.lock:
+            self.db.execute("begin immediate")
+            try:
+                self.db.executemany("insert into mensajes (usuario, role, content, traza) values (?, ?, ?, ?)",
+                                    [(usuario, m["role"], m["content"], m.get("traza")) for m in mensajes])
+                fila = self.db.execute("select resumen from usuarios where usuario = ?", (usuario,)).fetchone()
+                resumen = fila[0] if fila else ""
+                filas = self.db.execute("select id, role, content from mensajes where usuario = ? order by id",
+                                        (usuario,)).fetchall()
+                if len(filas) > self.max_mensajes:
+                    salientes = filas[:len(filas) - self.max_mensajes]
+                    resumen = self.resumidor(resumen, [{"role": r, "content": c} for _, r, c in salientes])
+                    self.db.execute("delete from mensajes where usuario = ? and id <= ?", (usuario, salientes[-1][0]))
+                self.db.execute("insert into usuarios (usuario, resumen, ultimo_uso) values (?, ?, ?) "
+                                "on conflict (usuario) do update set resumen = excluded.resumen, ultimo_uso = excluded.ultimo_uso",
+                                (usuario, resumen, time.time()))
+                self.db.execute("commit")
+            except:
+                self.db.execute("rollback")
+                raise
+        if time.time() >= self.proxima_purga: self.purgar()
+
+    def borrar(self, usuario):
+        with self.lock:
+            self.db.execute("begin immediate")
+            self.db.execute("delete from mensajes where usuario = ?", (str(usuario),))
+            self.db.execute("delete from usuarios where usuario = ?", (str(usuario),))
+            self.db.execute("commit")
+
+    def purgar(self):
+        """Olvida usuarios inactivos (TTL) y los menos recientes si pasan de `max_usuarios`."""
+        self.proxima_purga = time.time() + PURGA_CADA_S
+        with self.lock:
+            self.db.execute("begin immediate")
+            viejos = [u for (u,) in self.db.execute("select usuario from usuarios where ultimo_uso < ?", (time.time() - self.ttl,))]
+            viejos += [u for (u,) in self.db.execute(
+                "select usuario from usuarios where ultimo_uso >= ? order by ultimo_uso desc limit -1 offset ?",
+                (time.time() - self.ttl, self.max_usuarios))]
+            self.db.executemany("delete from mensajes where usuario = ?", [(u,) for u in viejos])
+            self.db.executemany("delete from usuarios where usuario = ?", [(u,) for u in viejos])
+            self.db.execute("commit")
+            self.olvidados += len(viejos)
+        return len(viejos)
+
+    def stats(self):
+        with self.lock:
+            usuarios = self.db.execute("select count(*) from usuarios").fetchone()[0]
+            mensajes = self.db.execute("select count(*) from mensajes").fetchone()[0]
+        return {"backend": "sqlite", "ruta": self.ruta, "usuarios": usuarios, "mensajes": mensajes, "olvidados": self.olvidados}
+
+# --- 4. INSTANCIA DEL PROCESO ---
+_memoria = None
+_memoria_lock = threading.Lock()
+
+def obtener_memoria():
+    """Memoria única por proceso, según MEMORIA_BACKEND."""
+    global _memoria
+    with _memoria_lock:
+        if _memoria is None: _memoria = MemoriaSQLite() if BACKEND == "sqlite" else MemoriaLocal()
+        return _memoria
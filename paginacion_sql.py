@@ -0,0 +1,151 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+
+# --- CONFIGURACIÓN ---
+FILAS_POR_PAGINA = int(os.environ.get("SQL_FILAS_PAGINA", "40"))    # Tope de filas por consulta (lo que viaja y va al prompt)
+SQL_TIMEOUT_S = float(os.environ.get("SQL_TIMEOUT_S", "5"))          # statement_timeout de query_exec (ver analisis.py)
+RUTA_CURSORES = os.environ.get("SQL_CURSORES_PATH", ".cache/cursores_sql.sqlite")
+TTL_CURSOR_S = float(os.environ.get("SQL_CURSOR_TTL_S", "3600"))    # "muéstrame más" después de esto = pregunta nueva
+MAX_CURSORES = 5000
+PURGA_CADA_S = 60
+
+PEDIDO_DE_MAS = re.compile(
+    r"^\W*(?:y\s+)?(?:mu[eé]str(?:a|ame)|dame|ver|lista(?:me)?|sigue|contin[uú]a|siguiente|siguientes|m[aá]s)"
+    r"(?:\s+(?:me|los|las|el|la|resto|m[aá]s|siguientes?|p[aá]gina|filas|ofertas|resultados|por\s+favor))*\W*$",
+    re.IGNORECASE)
+
+# --- 1. SQL PAGINADO ---
+def tiene_orden(sql):
+    """¿El SELECT trae su propio ORDER BY (fuera de subconsultas y de textos entre comillas)?"""
+    plano = re.sub(r"'(?:[^']|'')*'", "''", sql)
+    while True:
+        sin_parentesis = re.sub(r"\([^()]*\)", " ", plano)
+        if sin_parentesis == plano: break
+        plano = sin_parentesis
+    return bool(re.search(r"\border\s+by\b", plano, re.IGNORECASE))
+
+def literal_sql(texto):
+    return "'" + str(texto).replace("'", "''") + "'"
+
+def sql_pagina(sql, limite=FILAS_POR_PAGINA, cursor=None):
+    """
+    El SELECT del modelo envuelto con tope en el servidor: `limite + 1` filas (la de más solo dice
+    si hay otra página) y, si falta el total, `count(*) over ()` en la misma llamada.
+    - Con ORDER BY propio ("top 10 por monto") se respeta ese orden y se avanza por posición.
+    - Sin ORDER BY se ordena por la fila entera como texto (`_clave`) y las páginas siguientes
+      siguen desde la última clave (keyset); `repetidas` salta las filas idénticas ya mostradas.
+    """
+    cursor = cursor or {}
+    total = ", count(*) over () as _total" if cursor.get("total") is None else ""
+    if tiene_orden(sql):
+        return f"select t.*{total} from ({sql}) as t limit {int(limite) + 1} offset {int(cursor.get('desde', 0))}"
+    if cursor.get("clave") is None:
+        return f"select t.*, t::text as _clave{total} from ({sql}) as t order by _clave limit {int(limite) + 1}"
+    return (f"select t.*, t::text as _clave{total} from ({sql}) as t where t::text >= {literal_sql(cursor['clave'])} "
+            f"order by _clave limit {int(limite) + 1} offset {int(cursor.get('repetidas', 0))}")
+
+def pagina_de(filas, cursor=None, limite=FILAS_POR_PAGINA):
+    """
+    {"filas", "desde", "total", "hay_mas", "clave", "repetidas"} de lo que devolvió `sql_pagina`:
+    las filas sin `_clave`/`_total`, y la clave de la última fila (con cuántas filas idénticas a
+    ella ya se mostraron) para pedir la página siguiente.
+    """
+    cursor = cursor or {}
+    desde, total = cursor.get("desde", 0), cursor.get("total")
+    filas = filas if isinstance(filas, list) else [filas] if filas else []
+    hay_mas = len(filas) > limite
+    filas = filas[:limite]
+    if filas and isinstance(filas[0], dict) and "_total" in filas[0]: total = filas[0]["_total"]
+    claves = [f.get("_clave") if isinstance(f, dict) else None for f in filas]
+    filas = [{k: v for k, v in f.items() if k not in ("_clave", "_total")} if isinstance(f, dict) else f for f in filas]
+    clave, repetidas = cursor.get("clave"), cursor.get("repetidas", 0)
+    if filas and claves[-1] is not None:
+        iguales = len(claves) - next((i + 1 for i in range(len(claves) - 1, -1, -1) if claves[i] != claves[-1]), 0)
+        repetidas = iguales + (repetidas if claves[-1] == clave else 0)
+        clave = claves[-1]
+    return {"filas": filas, "desde": desde, "total": total if hay_mas else desde + len(filas), "hay_mas": hay_mas,
+            "clave": clave, "repetidas": repetidas}
+
+def es_pedido_de_mas(q):
+    """"muéstrame más", "siguientes", "más", "continúa"...: pide la página siguiente de la última lista."""
+    return bool(PEDIDO_DE_MAS.match(q or ""))
+
+def pie_pagina(pagina):
+    """Qué filas se muestran y cómo pedir las siguientes ("" si la lista entró entera en una página)."""
+    desde, hasta, total = pagina["desde"], pagina["desde"] + len(pagina["filas"]), pagina["total"]
+    de_total = f" de {total}" if total is not None else ""
+    if pagina["hay_mas"]:
+        return f"\n_(Mostrando {desde + 1}–{hasta}{de_total}. Escribe «muéstrame más» para ver las siguientes.)_"
+    return f"\n_(Filas {desde + 1}–{hasta}{de_total}: fin de la lista.)_" if desde else ""
+
+# --- 2. CURSORES (SQLite, compartidos entre procesos) ---
+class CursoresSQL:
+    """
+    Dónde sigue cada lista paginada: el SQL, la próxima fila, el total, la clave de la última fila
+    mostrada y la plantilla de la respuesta, guardados con el id de la traza que mostró la página (el historial del bot y
+    de la web guarda ese id en cada mensaje). Vencen a las TTL_CURSOR_S y se guardan a lo sumo
+    MAX_CURSORES (se olvidan los más viejos).
+    """
+
+    def __init__(self, ruta=RUTA_CURSORES, ttl=TTL_CURSOR_S, max_cursores=MAX_CURSORES):
+        if ruta != ":memory:" and os.path.dirname(ruta):
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        self.ruta = ruta
+        self.ttl = ttl
+        self.max_cursores = max_cursores
+        self.lock = threading.Lock()
+        self.proxima_purga = 0.0
+        self.db = sqlite3.connect(ruta, check_same_thread=False, timeout=30, isolation_level=None)
+        self.db.execute("pragma journal_mode=wal")
+        self.db.execute("""
+            create table if not exists cursores (
+                traza text primary key,
+                datos text not null,
+                creado real not null
+            )""")
+        self.db.execute("create index if not exists cursores_creado on cursores (creado)")
+
+    def guardar(self, traza, sql, desde, total=None, respuesta=None, pregunta="", clave=None, repetidas=0):
+        if not traza: return
+        datos = json.dumps({"sql": sql, "desde": desde, "total": total, "respuesta": respuesta, "pregunta": pregunta,
+                            "clave": clave, "repetidas": repetidas}, ensure_ascii=False)
+        with self.lock:
+            self.db.execute("insert or replace into cursores (traza, datos, creado) values (?, ?, ?)",
+                            (str(traza), datos, time.time()))
+        if time.time() >= self.proxima_purga: self.purgar()
+
+    def buscar(self, traza):
+        if not traza: return None
+        with self.lock:
+            fila = self.db.execute("select datos, creado from cursores where traza = ?", (str(traza),)).fetchone()
+        if fila is None or time.time() - fila[1] > self.ttl: return None
+        return json.loads(fila[0])
+
+    def del_historial(self, history):
+        """Cursor de la última respuesta del historial (None si esa respuesta no era una lista con más páginas)."""
+        ultimas = [m for m in history or [] if m.get("role") == "model"]
+        return self.buscar(ultimas[-1].get("traza")) if ultimas else None
+
+    def purgar(self):
+        self.proxima_purga = time.time() + PURGA_CADA_S
+        with self.lock:
+            self.db.execute("begin immediate")
+            n = self.db.execute("delete from cursores where creado < ?", (time.time() - self.ttl,)).rowcount
+            n += self.db.execute("delete from cursores where traza in (select traza from cursores "
+                                 "order by creado desc limit -1 offset ?)", (self.max_cursores,)).rowcount
+            self.db.execute("commit")
+        return n
+
+_cursores = None
+_cursores_lock = threading.Lock()
+
+def obtener_cursores():
+    """Almacén único por proceso (se abre al primer uso)."""
+    global _cursores
+    with _cursores_lock:
+        if _cursores is None: _cursores = CursoresSQL()
+        return _cursores
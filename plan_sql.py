@@ -0,0 +1,139 @@
+import os
+import re
+import json
+import threading
+from cache_respuestas import normalizar_pregunta
+
+RUTA_PLANES = os.environ.get("PLANES_SQL_PATH", ".cache/planes_sql.json")
+
+# Palabras de estado (en orden: "no adjudicad" antes que "adjudicad") -> estado canónico
+PALABRAS_ESTADO = [
+    (r"no adjudicad[oa]s?|perdid[oa]s?", "NO ADJUDICADO"),
+    (r"adjudicad[oa]s?|ganad[oa]s?", "ADJUDICADO"),
+    (r"pendientes?|disponibles?", "PENDIENTE"),
+]
+
+# Cláusulas SQL que pide `prompt_sql` para cada estado (se reconocen con espacios flexibles)
+CLAUSULAS_ESTADO = {
+    "ADJUDICADO": "metadata->>'estado de oferta' ILIKE '%ADJUDICAD%' AND metadata->>'estado de oferta' NOT ILIKE '%NO%'",
+    "NO ADJUDICADO": "metadata->>'estado de oferta' ILIKE '%NO ADJUDICAD%'",
+    "PENDIENTE": "metadata->>'estado de oferta' ILIKE '%PENDIENT%'",
+}
+
+def clausula_anio(anio):
+    """
+    Año en el código de oferta: 'OF-24' en cualquier parte o '_24' al final, la misma regla que
+    resumen_stats.anio_de_codigo. El '_' va escapado: en ILIKE es comodín y '%_24%' contaría
+    cualquier código con un "24".
+    """
+    return f"(metadata->>'codigo de oferta' ILIKE '%OF-{anio}%' OR metadata->>'codigo de oferta' ILIKE '%\\_{anio}')"
+
+def _regex_clausula(clausula):
+    return re.compile(r"\s+".join(re.escape(p) for p in clausula.split()), re.IGNORECASE)
+
+REGEX_CLAUSULAS = {estado: _regex_clausula(c) for estado, c in CLAUSULAS_ESTADO.items()}
+
+def extraer_parametros(q):
+    """Año (2 dígitos, como va en el código de oferta) y estado canónico de la pregunta."""
+    q_norm = normalizar_pregunta(q)
+    params = {}
+    anio = re.search(r"\b20(\d{2})\b", q_norm) or re.search(r"\b(?:del|ano|año)\s+(\d{2})\b", q_norm)
+    if anio: params["anio"] = anio.group(1)
+    for patron, estado in PALABRAS_ESTADO:
+        if re.search(rf"\b(?:{patron})\b", q_norm):
+            params["estado"] = estado
+            break
+    return params
+
+def forma_pregunta(q, params, con_estado=True):
+    """'cuantas adjudicadas del 2024' -> 'cuantas {ESTADO} del {ANIO}'."""
+    forma = normalizar_pregunta(q)
+    if "anio" in params:
+        forma = re.sub(rf"\b(?:20)?{params['anio']}\b", "{ANIO}", forma)
+    if con_estado and "estado" in params:
+        for patron, _ in PALABRAS_ESTADO:
+            forma = re.sub(rf"\b(?:{patron})\b", "{ESTADO}", forma)
+    return forma
+
+def parametrizar_sql(sql, params):
+    """
+    Convierte el SQL concreto en plantilla ({ANIO}, {ESTADO_SQL}).
+    Devuelve (plantilla, con_estado) o (None, False) si el año no se puede aislar con seguridad.
+    """
+    plantilla = sql.replace("{", "{{").replace("}", "}}")
+    if "anio" in params:
+        a = params["anio"]
+        plantilla = re.sub(rf"(OF-|_)({a})\b", r"\1{ANIO}", plantilla, flags=re.IGNORECASE)
+        plantilla = re.sub(rf"\b20{a}\b", "20{ANIO}", plantilla)
+        if re.search(rf"(?<![\w{{]){a}(?!\w)", plantilla.replace("{ANIO}", "")): return None, False
+    con_estado = False
+    if "estado" in params and len(REGEX_CLAUSULAS[params["estado"]].findall(plantilla)) == 1:
+        plantilla = REGEX_CLAUSULAS[params["estado"]].sub("{ESTADO_SQL}", plantilla)
+        con_estado = True
+    return plantilla, con_estado
+
+class CacheSQL:
+    """
+    Planes SQL ya validados (ejecutaron sin error) por forma de pregunta. Preguntas que solo
+    cambian el año o el estado reutilizan el SQL con los nuevos parámetros, sin llamar al LLM.
+    """
+
+    def __init__(self, ruta=RUTA_PLANES):
+        self.ruta = ruta
+        self.planes = {}
+        self.aciertos = 0           # Planes reutilizados que ejecutaron bien (= llamadas al LLM ahorradas)
+        self.fallos = 0             # Preguntas sin plan
+        self.planes_fallidos = 0    # Planes encontrados que fallaron al ejecutar (se volvió al LLM)
+        self.lock = threading.Lock()
+        if ruta and os.path.exists(ruta):
+            try:
+                with open(ruta, encoding="utf-8") as f: self.planes = json.load(f)
+            except Exception as e: print(f"   ⚠️ No se pudo leer {ruta}: {e}")
+
+    def _claves(self, q, params):
+        # Primero la forma con estado parametrizado; si no, la que deja el estado literal
+        return [forma_pregunta(q, params, True), forma_pregunta(q, params, False)]
+
+    def buscar(self, q):
+        """SQL listo para ejecutar, o None si no hay plan para esta forma de pregunta."""
+        return self.buscar_con_respuesta(q)[0]
+
+    def buscar_con_respuesta(self, q):
+        """
+        (SQL, plantilla de respuesta guardada o None), o (None, None) si no hay plan. Quien lo
+        ejecuta avisa el resultado con `registrar_uso` (el acierto cuenta solo si el plan sirvió).
+        """
+        params = extraer_parametros(q)
+        with self.lock:
+            for i, clave in enumerate(self._claves(q, params)):
+                plan = self.planes.get(clave)
+                if plan and plan["con_estado"] == (i == 0 and "estado" in params):
+                    return plan["sql"].format(
+                        ANIO=params.get("anio", ""),
+                        ESTADO_SQL=f"({CLAUSULAS_ESTADO[params['estado']]})" if "estado" in params else ""
+                    ), plan.get("respuesta")
+            self.fallos += 1
+            return None, None
+
+    def registrar_uso(self, exito):
+        with self.lock:
+            if exito: self.aciertos += 1
+            else: self.planes_fallidos += 1
+
+    def guardar(self, q, sql, respuesta=None):
+        """`respuesta`: plantilla de respuesta sin año ni estado literales (plantilla_sql.plantilla_reutilizable)."""
+        params = extraer_parametros(q)
+        plantilla, con_estado = parametrizar_sql(sql, params)
+        if plantilla is None: return
+        clave = self._claves(q, params)[0 if con_estado else 1]
+        with self.lock:
+            self.planes[clave] = {"sql": plantilla, "con_estado": con_estado}
+            if respuesta: self.planes[clave]["respuesta"] = respuesta
+            if self.ruta:
+                if os.path.dirname(self.ruta): os.makedirs(os.path.dirname(self.ruta), exist_ok=True)
+                with open(self.ruta, "w", encoding="utf-8") as f:
+                    json.dump(self.planes, f, ensure_ascii=False, indent=1)
+
+    def stats(self):
+        return {"planes": len(self.planes), "aciertos": self.aciertos, "fallos": self.fallos,
+                "planes_fallidos": self.planes_fallidos, "llamadas_llm_ahorradas": self.aciertos}
@@ -0,0 +1,207 @@
+import os
+import json
+import time
+import heapq
+import random
+import asyncio
+import itertools
+import threading
+from embeddings import TokenBucket
+
+# --- CONFIGURACIÓN ---
+RPM_DEFECTO = float(os.environ.get("GEMINI_RPM", "60"))            # Peticiones/min de los modelos sin cuota propia
+CUOTAS_RPM = json.loads(os.environ.get("GEMINI_CUOTAS", "{}"))     # {"models/...": rpm} por modelo
+# Cuotas propias por defecto: los embeddings no deben frenar por debajo de EMBED_RPS (ver ingesta.py)
+RPM_POR_MODELO = {"models/text-embedding-004": float(os.environ.get("EMBED_RPS", "10")) * 60}
+MAX_ESPERA_S = float(os.environ.get("GEMINI_MAX_ESPERA", "60"))    # Más que esto en cola = se descarta
+MAX_COLA = int(os.environ.get("GEMINI_MAX_COLA", "200"))
+BACKOFF_BASE_S = 2.0
+BACKOFF_MAX_S = 60.0
+
+# Prioridades: menor número = sale antes
+INTERACTIVO = 0
+INGESTA = 1
+
+class SistemaSaturado(Exception):
+    """La petición se descartó (cola llena o espera mayor al máximo): el llamador debe avisar y no reintentar."""
+
+class _EstadoModelo:
+    def __init__(self, rpm):
+        self.bucket = TokenBucket(rpm / 60.0, capacidad=max(1.0, rpm / 10.0))
+        self.cola = []                 # heap de (prioridad, turno)
+        self.penalizado_hasta = 0.0    # Tras un 429 nadie sale hasta esta hora
+        self.nivel_backoff = 0
+        self.atendidas = 0
+        self.descartadas = 0
+        self.errores_429 = 0
+        self.espera_total = 0.0
+        self.espera_max = 0.0
+
+class Planificador:
+    """
+    Planificador único del proceso para TODAS las llamadas a Gemini (router, SQL, narración,
+    web, embeddings). Cada modelo tiene su token bucket; las peticiones esperan en una cola
+    por prioridad (interactivas antes que ingesta). Un 429 penaliza al modelo entero con
+    backoff exponencial adaptativo + jitter, y si la espera sería excesiva se descarta.
+    Solo la cabeza de cada cola espera a su ficha; al resto se lo despierta cuando le toca.
+    El estado vive en memoria: coordina los hilos y tareas de UN proceso (bot, app). La
+    ingesta corre aparte con su propio planificador, así que las cuotas se reparten por
+    configuración (EMBED_RPS / GEMINI_CUOTAS), no en tiempo real.
+    """
+
+    def __init__(self, cuotas=None, rpm_defecto=RPM_DEFECTO, max_espera_s=MAX_ESPERA_S, max_cola=MAX_COLA):
+        self.cuotas = {**RPM_POR_MODELO, **(CUOTAS_RPM if cuotas is None else cuotas)}
+        self.rpm_defecto = rpm_defecto
+        self.max_espera_s = max_espera_s
+        self.max_cola = max_cola
+        self.modelos = {}
+        self.turnos = itertools.count()
+        self.avisos = {}               # ticket -> función que despierta a su dueño
+        self.lock = threading.Lock()
+
+    def _estado(self, model):
+        if model not in self.modelos:
+            self.modelos[model] = _EstadoModelo(self.cuotas.get(model, self.rpm_defecto))
+        return self.modelos[model]
+
+    # --- COLA ---
+    def _entrar(self, model, prioridad, despertar):
+        with self.lock:
+            estado = self._estado(model)
+            if len(estado.cola) >= self.max_cola:
+                estado.descartadas += 1
+                raise SistemaSaturado(f"Cola de {model} llena ({len(estado.cola)} en espera)")
+            ticket = (prioridad, next(self.turnos))
+            heapq.heappush(estado.cola, ticket)
+            self.avisos[ticket] = despertar
+            return ticket
+
+    def _sacar(self, estado, ticket):
+        """Quita el ticket de la cola y despierta a la nueva cabeza (la única que tiene algo que hacer)."""
+        estado.cola.remove(ticket)
+        heapq.heapify(estado.cola)
+        self.avisos.pop(ticket, None)
+        if estado.cola: self.avisos[estado.cola[0]]()
+
+    def _intentar(self, model, ticket):
+        """0 si el ticket puede salir ya (y consume la ficha); None si no es la cabeza; si no, segundos de espera."""
+        with self.lock:
+            estado = self._estado(model)
+            ahora = time.monotonic()
+            if estado.penalizado_hasta > ahora: return estado.penalizado_hasta - ahora
+            if estado.cola[0] != ticket: return None
+            espera = estado.bucket.intentar()
+            if espera > 0: return espera
+            self._sacar(estado, ticket)
+            return 0.0
+
+    def _turno(self, model, ticket, inicio):
+        """None si el ticket ya salió; si no, segundos a esperar. Descarta (SistemaSaturado) si no llega a tiempo."""
+        espera = self._intentar(model, ticket)
+        esperado = time.monotonic() - inicio
+        if espera == 0: return self._salir(model, ticket, esperado)
+        margen = self.max_espera_s - esperado
+        if margen <= 0 or (espera is not None and espera > margen):
+            self._salir(model, ticket, esperado, descartada=True)
+            raise SistemaSaturado(f"{model}: la espera superaría {self.max_espera_s:g}s")
+        return margen if espera is None else espera
+
+    def _salir(self, model, ticket, esperado, descartada=False):
+        with self.lock:
+            estado = self._estado(model)
+            if descartada:
+                self._sacar(estado, ticket)
+                estado.descartadas += 1
+            else:
+                estado.atendidas += 1
+                estado.espera_total += esperado
+                estado.espera_max = max(estado.espera_max, esperado)
+
+    def _abandonar(self, model, ticket):
+        """Saca el ticket si sigue en la cola (tarea cancelada, Ctrl+C): si no, tapa a los de atrás."""
+        with self.lock:
+            estado = self._estado(model)
+            if ticket in estado.cola: self._sacar(estado, ticket)
+
+    def adquirir(self, model, prioridad=INTERACTIVO):
+        """Bloquea hasta que `model` tenga cupo para esta petición. Lanza SistemaSaturado si no llega."""
+        evento = threading.Event()
+        ticket = self._entrar(model, prioridad, evento.set)
+        inicio = time.monotonic()
+        try:
+            while True:
+                evento.clear()     # Antes de mirar: un aviso que llegue después no se pierde
+                espera = self._turno(model, ticket, inicio)
+                if espera is None: return
+                evento.wait(timeout=espera)
+        finally:
+            self._abandonar(model, ticket)
+
+    async def aadquirir(self, model, prioridad=INTERACTIVO):
+        """Igual que `adquirir`, pero esperando un asyncio.Event (no bloquea el event loop)."""
+        loop, evento = asyncio.get_running_loop(), asyncio.Event()
+        ticket = self._entrar(model, prioridad, lambda: loop.call_soon_threadsafe(evento.set))
+        inicio = time.monotonic()
+        try:
+            while True:
+                evento.clear()
+                espera = self._turno(model, ticket, inicio)
+                if espera is None: return
+                try: await asyncio.wait_for(evento.wait(), timeout=espera)
+                except asyncio.TimeoutError: pass
+        finally:
+            self._abandonar(model, ticket)
+
+    # --- RETROALIMENTACIÓN ---
+    def reportar_429(self, model):
+        """Penaliza al modelo (backoff exponencial con jitter). Devuelve cuánto esperar antes de reintentar."""
+        with self.lock:
+            estado = self._estado(model)
+            estado.errores_429 += 1
+            estado.nivel_backoff += 1
+            espera = min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** (estado.nivel_backoff - 1))
+            espera *= random.uniform(0.5, 1.5)
+            estado.penalizado_hasta = max(estado.penalizado_hasta, time.monotonic() + espera)
+            return estado.penalizado_hasta - time.monotonic()
+
+    def reportar_exito(self, model):
+        with self.lock:
+            estado = self._estado(model)
+            estado.nivel_backoff = max(0, estado.nivel_backoff - 1)
+
+    def limitador(self, model, prioridad=INGESTA):
+        """Adaptador con `.adquirir()` para pipelines que esperan un limitador (p. ej. embeber_concurrente)."""
+        planificador = self
+
+        class _Limitador:
+            def adquirir(self): planificador.adquirir(model, prioridad)
+            def penalizar(self, error):
+                if "429" in str(error) or "RESOURCE_EXHAUSTED" in str(error): return planificador.reportar_429(model)
+                return None
+        return _Limitador()
+
+    def metricas(self):
+        """Por modelo: profundidad de cola, atendidas, descartadas, 429 y espera media/máxima (s)."""
+        with self.lock:
+            return {
+                model: {
+                    "en_cola": len(e.cola),
+                    "atendidas": e.atendidas,
+                    "descartadas": e.descartadas,
+                    "errores_429": e.errores_429,
+                    "espera_media_s": round(e.espera_total / e.atendidas, 3) if e.atendidas else 0.0,
+                    "espera_max_s": round(e.espera_max, 3),
+                    "penalizado_s": round(max(0.0, e.penalizado_hasta - time.monotonic()), 1),
+                }
+                for model, e in self.modelos.items()
+            }
+
+_planificador = None
+_planificador_lock = threading.Lock()
+
+def obtener_planificador():
+    """Planificador único por proceso."""
+    global _planificador
+    with _planificador_lock:
+        if _planificador is None: _planificador = Planificador()
+        return _planificador
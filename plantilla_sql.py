@@ -0,0 +1,91 @@
+import os
+import re
+import json
+from evidencia import valor_texto
+from plan_sql import extraer_parametros
+
+# --- CONFIGURACIÓN ---
+SQL_MODO = os.environ.get("SQL_MODO", "plantilla")     # "plantilla" (1 llamada + respuesta local) o "clasico"
+MAX_FILAS_LOCAL = int(os.environ.get("SQL_FILAS_LOCAL", "40"))   # Más filas = resumen local + narración LLM
+
+# Salida estructurada de Gemini: el SQL y cómo contar el resultado, en la misma llamada
+ESQUEMA_RESPUESTA = {
+    "type": "OBJECT",
+    "properties": {
+        "sql": {"type": "STRING"},
+        "encabezado": {"type": "STRING"},
+        "fila": {"type": "STRING"},
+        "vacio": {"type": "STRING"},
+    },
+    "required": ["sql", "encabezado", "fila", "vacio"],
+}
+
+INSTRUCCIONES = """
+    RESPONDE SOLO UN JSON con estas claves (la respuesta al usuario se arma con ellas, sin otra llamada):
+    - "sql": el SELECT (o "" si la pregunta no se responde con la tabla). Pon alias simples a las columnas.
+    - "encabezado": frase de respuesta en español. Usa {total} para la cantidad de filas y {alias} para
+      valores de la primera fila. Ej: "Hay **{count}** ofertas." / "Encontré {total} ofertas:".
+    - "fila": cómo mostrar CADA fila si el resultado es una lista, con {alias}. Ej: "* {codigo}: {cliente} ({estado})".
+      "" si el resultado es una sola cifra.
+    - "vacio": qué decir si no hay filas: que no hay coincidencias y un valor real parecido del catálogo.
+    No escribas año, estado ni cliente literales en "encabezado" ni "fila" si puedes usar un {alias}.
+    """
+
+# --- 1. LECTURA DE LA SALIDA DEL MODELO ---
+def leer_respuesta(texto):
+    """{"sql", "encabezado", "fila", "vacio"} de la salida JSON; si el modelo no respetó el formato, solo "sql"."""
+    limpio = re.sub(r"```(?:json)?", "", texto or "").strip()
+    try:
+        datos = json.loads(limpio)
+    except ValueError:
+        m = re.search(r"\{.*\}", limpio, re.DOTALL)
+        try: datos = json.loads(m.group(0)) if m else None
+        except ValueError: datos = None
+    if not isinstance(datos, dict) or not isinstance(datos.get("sql"), str):
+        return {"sql": texto or ""}
+    return {k: str(datos.get(k) or "") for k in ("sql", "encabezado", "fila", "vacio")}
+
+def plantilla_reutilizable(respuesta):
+    """La plantilla se guarda con el plan SQL solo si no lleva año ni estado literales (el plan los cambia)."""
+    if not respuesta or not respuesta.get("encabezado"): return None
+    texto = " ".join(respuesta.get(k, "") for k in ("encabezado", "fila", "vacio"))
+    return None if extraer_parametros(texto) else {k: respuesta.get(k, "") for k in ("encabezado", "fila", "vacio")}
+
+# --- 2. RESPUESTA LOCAL ---
+def celda(v):
+    if isinstance(v, bool) or v is None: return valor_texto(v) or "-"
+    if isinstance(v, float): return f"{int(v):,}" if v.is_integer() else f"{v:,.2f}"
+    if isinstance(v, int): return str(v)
+    return valor_texto(v) or "-"
+
+def rellenar(plantilla, valores):
+    """Reemplaza solo `{nombre}` por su valor (sin str.format: la plantilla viene del modelo). None si falta alguno."""
+    faltan = []
+
+    def valor(m):
+        nombre = m.group(1).strip()
+        if nombre not in valores: faltan.append(nombre)
+        return valores.get(nombre, "")
+    texto = re.sub(r"\{([^{}]+)\}", valor, plantilla)
+    return None if faltan else texto
+
+def renderizar(respuesta, res, max_filas=MAX_FILAS_LOCAL, total=None):
+    """
+    Respuesta final con la plantilla del modelo y las filas, sin LLM. None si hace falta narrar:
+    sin plantilla, más de `max_filas` filas, o un {alias} que no está en el resultado.
+    `total` es el de toda la consulta cuando `res` es solo una página.
+    """
+    if not respuesta or not respuesta.get("encabezado"): return None
+    filas = res if isinstance(res, list) else [res] if isinstance(res, dict) else None
+    if filas is None or not all(isinstance(f, dict) for f in filas): return None
+    if not filas or (len(filas) == 1 and filas[0].get("count") == 0): return respuesta.get("vacio") or None
+    if len(filas) > max_filas: return None
+
+    base = {"total": str(total if total is not None else len(filas))}
+    encabezado = rellenar(respuesta["encabezado"], {**base, **{k: celda(v) for k, v in filas[0].items()}})
+    if encabezado is None: return None
+    if not respuesta.get("fila"):
+        return encabezado if len(filas) == 1 else None    # Varias filas sin formato de fila: mejor narrar
+    lineas = [rellenar(respuesta["fila"], {**base, **{k: celda(v) for k, v in f.items()}}) for f in filas]
+    if any(l is None for l in lineas): return None
+    return "\n".join([encabezado, *lineas])
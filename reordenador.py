@@ -0,0 +1,60 @@
+import os
+from cache_respuestas import normalizar_pregunta
+
+# --- CONFIGURACIÓN ---
+# Reordenado local de la evidencia RAG (RRF + BM25). Opcional: BM25 necesita la tabla entera en
+# memoria (la del índice exacto, refrescada cada INDICE_REFRESCO_S) aunque EXACT_BACKEND sea "db"
+RERANK = os.environ.get("RERANK", "0") == "1"
+CANDIDATOS = int(os.environ.get("RERANK_CANDIDATOS", "20"))       # Vectoriales y BM25 que entran al reordenado
+TOP_K = int(os.environ.get("RERANK_TOP_K", "6"))                  # Documentos que llegan al LLM
+RRF_K = 60                                                        # Constante de RRF: suaviza el peso de los primeros puestos
+PESOS = {"exacto": 1.0, "vector": 1.0, "bm25": 1.0}
+
+# --- 1. FUSIÓN ---
+def fusion_rrf(rankings, k=RRF_K, pesos=PESOS):
+    """Reciprocal Rank Fusion: cada lista suma `peso / (k + puesto)` a sus ids. Devuelve {id: puntaje}."""
+    puntajes = {}
+    for nombre, ids in rankings.items():
+        peso = pesos.get(nombre, 1.0)
+        for puesto, i in enumerate(ids, 1):
+            puntajes[i] = puntajes.get(i, 0.0) + peso / (k + puesto)
+    return puntajes
+
+def huella(doc):
+    """Mismo `content` (sin mayúsculas, tildes ni espacios de más) = mismo documento, aunque cambie el id."""
+    return normalizar_pregunta(str(doc.get("content") or "")) or doc["id"]
+
+# --- 2. REORDENADO ---
+def reordenar(consulta, exactos, vectoriales, indice=None, docs=None, top_k=TOP_K, candidatos=CANDIDATOS):
+    """
+    Un solo top-k puntuado y sin duplicados a partir de tres listas: los exactos (en su orden),
+    los vectoriales (por similitud) y BM25 sobre `content` (los `candidatos` mejores del índice,
+    que se suman al grupo desde `docs`, más el puntaje BM25 de los que trajeron las otras dos).
+    Cada doc elegido lleva "puntaje" (RRF). Devuelve (docs, stats).
+    """
+    grupo = {}
+    for d in exactos: grupo.setdefault(d["id"], d)
+    for d in vectoriales: grupo.setdefault(d["id"], {**d, "source_type": "VECTOR"})
+    rankings = {
+        "exacto": list(dict.fromkeys(d["id"] for d in exactos)),
+        "vector": [d["id"] for d in sorted(vectoriales, key=lambda d: d.get("similarity") or 0.0, reverse=True)],
+    }
+    if indice is not None and len(indice):
+        bm25 = indice.puntajes(consulta, grupo)
+        for i, puntaje in indice.buscar(consulta, candidatos):
+            if i not in grupo and docs and i in docs: grupo[i] = {**docs[i], "source_type": "BM25"}
+            if i in grupo: bm25[i] = puntaje
+        rankings["bm25"] = sorted(bm25, key=bm25.get, reverse=True)
+
+    puntajes = fusion_rrf(rankings)
+    elegidos, vistas, duplicados = [], set(), 0
+    for i in sorted(grupo, key=lambda i: puntajes.get(i, 0.0), reverse=True):
+        h = huella(grupo[i])
+        if h in vistas:
+            duplicados += 1
+            continue
+        vistas.add(h)
+        elegidos.append({**grupo[i], "puntaje": round(puntajes.get(i, 0.0), 5)})
+        if len(elegidos) == top_k: break
+    return elegidos, {"candidatos": len(grupo), "bm25": len(rankings.get("bm25", ())), "duplicados": duplicados,
+                      "elegidos": len(elegidos)}
@@ -0,0 +1,296 @@
+import os
+import re
+import json
+import time
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+from cache_respuestas import normalizar_pregunta, version_datos
+from plan_sql import extraer_parametros, PALABRAS_ESTADO
+
+# --- CONFIGURACIÓN ---
+RUTA_RESUMEN = os.environ.get("RESUMEN_PATH", ".cache/resumen_documentos.json")
+TABLA_RESUMEN = "resumen_dj"
+COL_ESTADO = "estado de oferta"
+COL_CODIGO = "codigo de oferta"
+COL_CLIENTE = "cliente"
+MAX_LISTA = 40
+MAX_CATEGORIAS = 100        # Columnas con más valores distintos no son categóricas (códigos, montos, textos)
+MAX_VALORES_PROMPT = 30     # Valores por columna que se muestran al LLM
+COLUMNAS_ROUTER = (COL_ESTADO, COL_CLIENTE)   # Nombrar uno de estos valores = pregunta sobre los datos
+ETIQUETAS_ESTADO = {"PENDIENTE": "pendientes", "ADJUDICADO": "adjudicadas", "NO ADJUDICADO": "no adjudicadas"}
+
+# Lo único que puede quedar en la pregunta además del estado, el año y el cliente: si sobra
+# cualquier otra palabra ("clientes", "Arequipa", "vigentes", "superan 1 millón"...) la
+# pregunta trae un filtro que el resumen no conoce y sigue al SQL
+PALABRAS_RESUMEN = {
+    "cuantas", "cuantos", "total", "cantidad", "numero", "lista", "listame", "cuales", "muestra", "muestrame",
+    "dame", "ensename", "hay", "tenemos", "tiene", "tienen", "son", "estan", "ofertas", "oferta", "licitaciones",
+    "de", "del", "la", "las", "el", "los", "en", "con", "que", "a", "al", "me", "para", "ano", "cliente", "todas",
+    "todos",
+}
+# Desgloses ("por cliente", "cada año", "por estado"): piden una tabla, no un total
+DESGLOSE = re.compile(r"\b(?:cada|por(?!\s+favor\b))\b")
+
+# --- DERIVADOS DE LA METADATA ---
+def anio_de_codigo(codigo):
+    """'OF-24-0012' -> '24', 'SZ1234_17' -> '17' (la misma regla que plan_sql.clausula_anio)."""
+    codigo = str(codigo or "").strip()
+    m = re.search(r"OF-(\d{2})", codigo, re.IGNORECASE) or re.search(r"_(\d{2})$", codigo)
+    return m.group(1) if m else ""
+
+def prefijo_de_codigo(codigo):
+    """'OF-24-0012' -> 'OF', 'SZ1234_17' -> 'SZ'."""
+    m = re.match(r"[A-Za-z]+", str(codigo or "").strip())
+    return m.group(0).upper() if m else ""
+
+def estado_canonico(valor):
+    v = str(valor or "").upper()
+    if "NO ADJUDICAD" in v: return "NO ADJUDICADO"
+    if "ADJUDICAD" in v: return "ADJUDICADO"
+    if "PENDIENT" in v: return "PENDIENTE"
+    return v
+
+def marca_de_tiempo(valor):
+    """timestamptz de la tabla ('2024-05-01T10:00:00+00:00') -> segundos epoch (0 si no se entiende)."""
+    try: return datetime.fromisoformat(str(valor).replace("Z", "+00:00")).timestamp()
+    except ValueError: return 0.0
+
+# --- CATÁLOGO DE VALORES ---
+def contar_categorias(valores, meta):
+    """Cuenta los valores de cada columna; la que pasa de MAX_CATEGORIAS distintos deja de contarse (None)."""
+    for col, v in meta.items():
+        if col == "id_excel" or valores.get(col, Counter()) is None: continue
+        texto = " ".join(str(v).split()) if v is not None else ""
+        if not texto or texto.lower() in ("nan", "none", "nat"): continue
+        cuenta = valores.setdefault(col, Counter())
+        cuenta[texto] += 1
+        if len(cuenta) > MAX_CATEGORIAS: valores[col] = None
+
+def armar_catalogo(valores, codigos):
+    """{"columnas": {col: {valor: n}}, "prefijos": {..}, "anios": {..}}, cada uno de mayor a menor."""
+    prefijos, anios = Counter(), Counter()
+    for codigo, n in codigos.items():
+        if prefijo_de_codigo(codigo): prefijos[prefijo_de_codigo(codigo)] += n
+        if anio_de_codigo(codigo): anios[anio_de_codigo(codigo)] += n
+    return {
+        "columnas": {col: dict(c.most_common()) for col, c in valores.items() if c},
+        "prefijos": dict(prefijos.most_common()),
+        "anios": dict(sorted(anios.items())),
+    }
+
+def sql_catalogo(tabla):
+    """
+    Una sola consulta agrupada (vía query_exec) para cuando no hay resumen: valores de estado y
+    cliente, y el código reducido a inicio + final (bastan para sacar prefijo y año).
+    """
+    codigo = f"metadata->>'{COL_CODIGO}'"
+    partes = [f"select '{col}' as columna, metadata->>'{col}' as valor, count(*) as n from {tabla} group by 2"
+              for col in (COL_ESTADO, COL_CLIENTE)]
+    partes.append(f"select 'codigo' as columna, substr({codigo}, 1, 6) || ' ' || substr({codigo}, length({codigo}) - 2) "
+                  f"as valor, count(*) as n from {tabla} group by 2")
+    return " union all ".join(partes)
+
+def catalogo_desde_filas(filas):
+    valores, codigos = {}, Counter()
+    for f in filas:
+        if not f.get("valor"): continue
+        if f["columna"] == "codigo": codigos[f["valor"]] += f["n"]
+        else: valores.setdefault(f["columna"], Counter())[" ".join(str(f["valor"]).split())] += f["n"]
+    return armar_catalogo(valores, codigos)
+
+# --- CONSTRUCCIÓN (en la ingesta) ---
+def construir_resumen(metadatas):
+    """Conteos por estado x año x cliente, por estado la lista compacta de ofertas, y el catálogo de valores."""
+    conteos = Counter()
+    por_estado = {}
+    valores, codigos = {}, Counter()
+    for meta in metadatas:
+        contar_categorias(valores, meta)
+        estado = estado_canonico(meta.get(COL_ESTADO))
+        codigo = str(meta.get(COL_CODIGO, ""))
+        cliente = str(meta.get(COL_CLIENTE, ""))
+        anio = anio_de_codigo(codigo)
+        conteos[(estado, anio, cliente)] += 1
+        if codigo: codigos[codigo] += 1
+        por_estado.setdefault(estado, []).append(
+            {"id_excel": meta.get("id_excel", ""), "codigo": codigo, "cliente": cliente, "anio": anio}
+        )
+    return {
+        "actualizado": time.time(),
+        "total": sum(conteos.values()),
+        "conteos": [{"estado": e, "anio": a, "cliente": c, "n": n} for (e, a, c), n in conteos.items()],
+        "ofertas_por_estado": por_estado,
+        "catalogo": armar_catalogo(valores, codigos),
+    }
+
+def leer_metadatas(supabase, tabla, tam_pagina=1000):
+    desde = 0
+    while True:
+        resp = supabase.table(tabla).select("metadata").order("id").range(desde, desde + tam_pagina - 1).execute()
+        for d in resp.data or []: yield d.get("metadata") or {}
+        if not resp.data or len(resp.data) < tam_pagina: break
+        desde += tam_pagina
+
+def guardar_resumen(resumen, supabase=None):
+    """Lo deja en disco y, si se puede, en la tabla lateral `resumen_dj` (para otros servidores)."""
+    if os.path.dirname(RUTA_RESUMEN): os.makedirs(os.path.dirname(RUTA_RESUMEN), exist_ok=True)
+    with open(RUTA_RESUMEN, "w", encoding="utf-8") as f:
+        json.dump(resumen, f, ensure_ascii=False)
+    if supabase is not None:
+        actualizado = datetime.fromtimestamp(resumen["actualizado"], timezone.utc).isoformat()
+        try: supabase.table(TABLA_RESUMEN).upsert({"id": 1, "datos": resumen, "actualizado": actualizado}).execute()
+        except Exception as e: print(f"   ⚠️ No se pudo guardar '{TABLA_RESUMEN}': {e}")
+
+# --- LECTURA (en consultas) ---
+class ResumenStats:
+    """
+    Resumen cargado en memoria: el archivo local cuando cambia y, cada `ttl`, la tabla si su
+    `actualizado` es más nuevo (otro servidor ingirió después de este).
+    Sin resumen, el catálogo sale de una consulta agrupada sobre `tabla`, renovada cada `ttl`
+    o cuando la ingesta marca datos nuevos.
+    """
+
+    def __init__(self, supabase=None, ttl=300, tabla=None):
+        self.supabase = supabase
+        self.ttl = ttl
+        self.tabla = tabla
+        self.datos = None
+        self.marca = None           # mtime del archivo local ya leído
+        self.revisado = 0.0         # Última vez que se miró `actualizado` en la tabla
+        self.lock = threading.Lock()
+        self.catalogo_db = None
+        self.catalogo_marca = None
+        self._menciones = (None, None)
+
+    def obtener(self):
+        with self.lock:
+            if os.path.exists(RUTA_RESUMEN):
+                mtime = os.stat(RUTA_RESUMEN).st_mtime_ns
+                if mtime != self.marca:
+                    with open(RUTA_RESUMEN, encoding="utf-8") as f: local = json.load(f)
+                    if local.get("actualizado", 0) >= self._actualizado(): self.datos = local
+                    self.marca = mtime
+            if self.supabase is not None and time.time() - self.revisado > self.ttl:
+                self.revisado = time.time()
+                try:
+                    resp = self.supabase.table(TABLA_RESUMEN).select("actualizado").eq("id", 1).execute()
+                    if resp.data and marca_de_tiempo(resp.data[0].get("actualizado")) > self._actualizado() + 1e-3:
+                        resp = self.supabase.table(TABLA_RESUMEN).select("datos").eq("id", 1).execute()
+                        if resp.data: self.datos = resp.data[0]["datos"]
+                except Exception: pass
+            return self.datos
+
+    def _actualizado(self):
+        return (self.datos or {}).get("actualizado", 0)
+
+    def responder(self, q):
+        """Respuesta directa para conteos/listas por estado, año y cliente; None si no aplica."""
+        datos = self.obtener()
+        if not datos: return None
+        q_norm = normalizar_pregunta(q)
+        if re.search(r"\b(?:of|sz\d*)-", q_norm): return None   # códigos concretos: búsqueda exacta
+
+        es_conteo = re.search(r"\b(?:cuant[oa]s|total|cantidad|numero)\b", q_norm)
+        es_lista = re.search(r"\b(?:lista|listame|cuales|muestra|muestrame|dame|ensename)\b", q_norm)
+        if not (es_conteo or es_lista): return None
+
+        params = extraer_parametros(q)
+        clientes = {c["cliente"] for c in datos["conteos"] if c["cliente"]}
+        cliente = next((c for c in sorted(clientes, key=len, reverse=True)
+                        if len(c) > 2 and normalizar_pregunta(c) in q_norm), None)
+
+        # Un solo total: desgloses, varios años, estados o clientes van al SQL
+        nombrados = {normalizar_pregunta(c) for c in clientes if len(c) > 2 and normalizar_pregunta(c) in q_norm}
+        if len([c for c in nombrados if not any(c != o and c in o for o in nombrados)]) > 1: return None
+        resto = q_norm.replace(normalizar_pregunta(cliente), " ") if cliente else q_norm
+        if DESGLOSE.search(resto): return None
+        anios = re.findall(r"\b20(\d{2})\b|\b(?:del|ano)\s+(\d{2})\b", resto)
+        if len({a or b for a, b in anios}) > 1: return None
+        resto = re.sub(r"\b20\d{2}\b|\b(?:del|ano)\s+\d{2}\b", " ", resto)
+        estados = 0
+        for patron, _ in PALABRAS_ESTADO:
+            resto, n = re.subn(rf"\b(?:{patron})\b", " ", resto)
+            estados += bool(n)
+        if estados > 1: return None
+        resto = resto.replace("por favor", " ")
+        if any(p not in PALABRAS_RESUMEN for p in resto.split()): return None
+
+        def cumple(fila):
+            return ((not params.get("estado") or fila["estado"] == params["estado"]) and
+                    (not params.get("anio") or fila["anio"] == params["anio"]) and
+                    (not cliente or fila["cliente"] == cliente))
+
+        filtro = " ".join(filter(None, [
+            ETIQUETAS_ESTADO.get(params.get("estado"), ""),
+            f"del 20{params['anio']}" if params.get("anio") else "",
+            f"de {cliente}" if cliente else "",
+        ]))
+        if es_conteo and not es_lista:
+            n = sum(c["n"] for c in datos["conteos"] if cumple(c))
+            return f"Hay **{n}** ofertas {filtro}".rstrip() + "."
+
+        if not params.get("estado"): return None    # Listas solo por estado (las guardadas)
+        ofertas = [
+            {**o, "estado": params["estado"]} for o in datos["ofertas_por_estado"].get(params["estado"], [])
+            if cumple({**o, "estado": params["estado"]})
+        ]
+        if not ofertas: return f"No hay ofertas {filtro}."
+        lineas = [f"* {o['codigo'] or o['id_excel']}: {o['cliente']} ({o['estado']})" for o in ofertas[:MAX_LISTA]]
+        if len(ofertas) > MAX_LISTA: lineas.append(f"... y {len(ofertas) - MAX_LISTA} más.")
+        return f"Ofertas {filtro} ({len(ofertas)}):\n" + "\n".join(lineas)
+
+    # --- CATÁLOGO (prompt SQL, sugerencias y router) ---
+    def catalogo(self):
+        """Valores distintos (con conteo) de las columnas categóricas, sin ir a la DB si hay resumen."""
+        datos = self.obtener()
+        if datos and datos.get("catalogo"): return datos["catalogo"]
+        if self.supabase is None or not self.tabla: return None
+        with self.lock:
+            marca = (version_datos(), int(time.time() // self.ttl))
+            if marca != self.catalogo_marca:
+                self.catalogo_marca = marca
+                try:
+                    resp = self.supabase.rpc("query_exec", {"query": sql_catalogo(self.tabla)}).execute()
+                    self.catalogo_db = catalogo_desde_filas(resp.data or [])
+                except Exception as e: print(f"   ⚠️ No se pudo leer el catálogo: {e}")
+            return self.catalogo_db
+
+    def estados(self):
+        """Estados reales, del más al menos frecuente."""
+        catalogo = self.catalogo() or {}
+        return list(catalogo.get("columnas", {}).get(COL_ESTADO, {})) or list(ETIQUETAS_ESTADO)
+
+    def texto_catalogo(self, max_valores=MAX_VALORES_PROMPT):
+        """Valores reales en pocas líneas para el prompt (las columnas largas, solo las más frecuentes)."""
+        catalogo = self.catalogo()
+        if not catalogo: return f"- {COL_ESTADO}: " + ", ".join(ETIQUETAS_ESTADO)
+        lineas = []
+        for col, valores in catalogo["columnas"].items():
+            if len(valores) > max_valores and col != COL_CLIENTE: continue
+            mostrados = ", ".join(f"{v} ({n})" for v, n in list(valores.items())[:max_valores])
+            resto = f" (+{len(valores) - max_valores} más)" if len(valores) > max_valores else ""
+            lineas.append(f"- {col}: {mostrados}{resto}")
+        if catalogo["prefijos"]: lineas.append("- prefijos de código: " + ", ".join(f"{p} ({n})" for p, n in catalogo["prefijos"].items()))
+        if catalogo["anios"]: lineas.append("- años en el código: " + ", ".join(catalogo["anios"]))
+        return "\n".join(lineas)
+
+    def valor_mencionado(self, q):
+        """(columna, valor) si la pregunta nombra un estado o cliente real; None si no."""
+        menciones = self.valores_mencionados(q)
+        return menciones[0] if menciones else None
+
+    def valores_mencionados(self, q):
+        """Todos los (columna, valor) de estados o clientes reales que nombra la pregunta, en orden."""
+        catalogo = self.catalogo()
+        if not catalogo: return []
+        if self._menciones[0] is not catalogo:
+            nombres = {}
+            for col in COLUMNAS_ROUTER:
+                for v in catalogo["columnas"].get(col, {}):
+                    v_norm = normalizar_pregunta(v)
+                    if len(v_norm) > 3 and not v_norm.isdigit(): nombres.setdefault(v_norm, (col, v))
+            patron = "|".join(re.escape(v) for v in sorted(nombres, key=len, reverse=True))
+            self._menciones = (catalogo, (re.compile(rf"\b(?:{patron})\b") if patron else None, nombres))
+        regex, nombres = self._menciones[1]
+        return [nombres[m.group(0)] for m in regex.finditer(normalizar_pregunta(q))] if regex else []
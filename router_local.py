@@ -0,0 +1,219 @@
+import os
+import re
+import json
+import zlib
+import time
+import threading
+import numpy as np
+from cache_respuestas import normalizar_pregunta
+
+# --- CONFIGURACIÓN ---
+RUTAS = ["SQL", "WEB", "GENERAL"]
+UMBRAL_CONFIANZA = float(os.environ.get("ROUTER_UMBRAL", "0.7"))   # Por debajo decide el LLM
+RUTA_LOG = os.environ.get("ROUTER_LOG_PATH", ".cache/rutas_router.jsonl")
+REENTRENAR_S = float(os.environ.get("ROUTER_REENTRENAR_S", "3600"))   # Con decisiones nuevas del LLM en RUTA_LOG
+DIM_HASH = 2 ** 13
+
+# --- 1. PALABRAS CLAVE (con límites de palabra: "id" ya no coincide con "presidente", ni "hora" con "ahora") ---
+PATRONES_SQL = [
+    r"pendientes?", r"adjudicad\w*", r"ganad[oa]s?", r"perdid[oa]s?", r"ofertas?", r"licitacion\w*",
+    r"clientes?", r"20[0-2]\d", r"estados?(?! unidos)", r"codigos?", r"id", r"(?:of|sz)-\w+",
+    r"disponibles?", r"vigentes?", r"procesos?", r"base de datos",
+]
+PATRONES_WEB = [
+    r"hora", r"clima", r"tiempo", r"noticias?", r"dolar", r"precios?", r"busca en google",
+    r"quien es", r"cuando es", r"resultados del", r"actualidad", r"hoy",
+]
+REGEX_SQL = re.compile(rf"\b(?:{'|'.join(PATRONES_SQL)})\b")
+REGEX_WEB = re.compile(rf"\b(?:{'|'.join(PATRONES_WEB)})\b")
+
+def ruta_por_palabras(q):
+    """Fast-path del router: 'SQL'/'WEB' por palabras clave, o None si no hay ninguna."""
+    q_norm = normalizar_pregunta(q)
+    if REGEX_SQL.search(q_norm): return "SQL"    # Palabras del negocio fuerzan SQL
+    if REGEX_WEB.search(q_norm): return "WEB"
+    return None
+
+# --- 2. EJEMPLOS DE ENTRENAMIENTO (se suman las decisiones del LLM registradas en RUTA_LOG) ---
+EJEMPLOS_BASE = [
+    ("cuantas licitaciones tenemos", "SQL"), ("dame las ofertas de minera", "SQL"),
+    ("que le cotizamos a southern", "SQL"), ("lista de proyectos ganados", "SQL"),
+    ("que propuestas enviamos este año", "SQL"), ("cuanto facturamos con antamina", "SQL"),
+    ("muestrame las cotizaciones del mes", "SQL"), ("que proyectos tiene la empresa", "SQL"),
+    ("cuales son nuestras propuestas abiertas", "SQL"), ("cotizaciones enviadas a cerro verde", "SQL"),
+    ("total de propuestas por cliente", "SQL"), ("en que van nuestras cotizaciones", "SQL"),
+    ("que empresas nos han comprado", "SQL"), ("monto total cotizado", "SQL"),
+    ("cuantos proyectos perdimos", "SQL"), ("busca la cotizacion de la planta concentradora", "SQL"),
+    ("cual fue la ultima propuesta", "SQL"), ("que servicios le ofrecimos a volcan", "SQL"),
+    ("informacion de la empresa", "SQL"), ("registros de la tabla", "SQL"),
+    ("que paso con la propuesta de mantenimiento", "SQL"), ("a quien le vendimos mas", "SQL"),
+    ("cuales se aprobaron", "SQL"), ("ranking de compradores", "SQL"),
+
+    ("quien gano el partido de ayer", "WEB"), ("que dijo el presidente", "WEB"),
+    ("cual es la capital de australia", "WEB"), ("a cuanto esta el euro", "WEB"),
+    ("como esta el trafico en lima", "WEB"), ("cuando juega peru", "WEB"),
+    ("ultimas novedades de inteligencia artificial", "WEB"), ("que temperatura hace en arequipa", "WEB"),
+    ("cotizacion del cobre en la bolsa", "WEB"), ("que paso en las elecciones", "WEB"),
+    ("cual es la poblacion de peru", "WEB"), ("quien invento el telefono", "WEB"),
+    ("que pelicula se estreno esta semana", "WEB"), ("va a llover mañana", "WEB"),
+    ("tipo de cambio sunat", "WEB"), ("cuanto cuesta un iphone", "WEB"),
+    ("que es la inflacion actual", "WEB"), ("donde queda machu picchu", "WEB"),
+    ("busca informacion sobre tesla", "WEB"), ("que esta pasando en el mundo", "WEB"),
+    ("cuantos habitantes tiene lima", "WEB"), ("feriados de este año en peru", "WEB"),
+
+    ("hola", "GENERAL"), ("buenos dias", "GENERAL"), ("gracias", "GENERAL"),
+    ("cuentame un chiste", "GENERAL"), ("como estas", "GENERAL"), ("quien eres", "GENERAL"),
+    ("que puedes hacer", "GENERAL"), ("dame un consejo para dormir mejor", "GENERAL"),
+    ("escribe un poema", "GENERAL"), ("cual es el sentido de la vida", "GENERAL"),
+    ("ayudame a redactar un correo", "GENERAL"), ("como me llamo", "GENERAL"),
+    ("explicame que es un algoritmo", "GENERAL"), ("traduce esto al ingles", "GENERAL"),
+    ("estoy cansado", "GENERAL"), ("adios", "GENERAL"), ("ok perfecto", "GENERAL"),
+    ("que opinas del amor", "GENERAL"), ("dime una frase motivadora", "GENERAL"),
+    ("como hago una tabla en excel", "GENERAL"), ("resume este texto", "GENERAL"),
+    ("buenas noches", "GENERAL"), ("eres un robot", "GENERAL"), ("me ayudas", "GENERAL"),
+]
+
+# --- 3. CLASIFICADOR LINEAL (hashing de palabras, bigramas y trigramas de letras + softmax) ---
+def rasgos(texto):
+    """Índices hasheados de los rasgos de `texto` (sin repetir)."""
+    palabras = normalizar_pregunta(texto).split()
+    claves = [f"w:{p}" for p in palabras]
+    claves += [f"b:{a} {b}" for a, b in zip(palabras, palabras[1:])]
+    for p in palabras:
+        p = f" {p} "
+        claves += [f"c:{p[i:i + 3]}" for i in range(len(p) - 2)]
+    return sorted({zlib.crc32(c.encode()) % DIM_HASH for c in claves})
+
+def _softmax(x):
+    x = x - x.max(axis=-1, keepdims=True)
+    e = np.exp(x)
+    return e / e.sum(axis=-1, keepdims=True)
+
+class RouterLocal:
+    """
+    Clasificador SQL/WEB/GENERAL en CPU (decenas de µs), entrenado con EJEMPLOS_BASE + las
+    decisiones del LLM registradas; si la confianza no llega al `umbral`, devuelve None y la
+    ruta la decide el LLM como antes. `iniciar()` lo entrena en un hilo al arrancar y lo
+    re-entrena cada REENTRENAR_S si el log creció; sin él, se entrena al primer uso.
+    Un solo entrenamiento a la vez (`self.entrenando`); el modelo se publica en una asignación.
+    """
+
+    def __init__(self, umbral=UMBRAL_CONFIANZA, ruta_log=RUTA_LOG):
+        self.umbral = umbral
+        self.ruta_log = ruta_log
+        self.modelo = None    # (pesos (DIM_HASH, len(RUTAS)), sesgo (len(RUTAS),))
+        self.firma_log = None  # (tamaño, mtime) del log con que se entrenó
+        self.locales = 0
+        self.al_llm = 0
+        self.lock = threading.Lock()
+        self.entrenando = threading.Lock()
+        self.hilo = None
+
+    def _firma_log(self):
+        try:
+            st = os.stat(self.ruta_log)
+            return st.st_size, st.st_mtime_ns
+        except (OSError, TypeError): return None
+
+    def ejemplos(self):
+        ejemplos = list(EJEMPLOS_BASE)
+        if self.ruta_log and os.path.exists(self.ruta_log):
+            with open(self.ruta_log, encoding="utf-8") as f:
+                for linea in f:
+                    try: d = json.loads(linea)
+                    except ValueError: continue
+                    if d.get("ruta") in RUTAS: ejemplos.append((d["q"], d["ruta"]))
+        return ejemplos
+
+    def entrenar(self, ejemplos=None, epocas=300, lr=2.0, l2=1e-4):
+        """Entrena ya (con EJEMPLOS_BASE + el log, o con `ejemplos`). Devuelve cuántos ejemplos usó."""
+        with self.entrenando: return self._entrenar(ejemplos, epocas, lr, l2)
+
+    def _entrenar(self, ejemplos=None, epocas=300, lr=2.0, l2=1e-4):
+        firma = self._firma_log()
+        ejemplos = self.ejemplos() if ejemplos is None else ejemplos
+        self.modelo = self._ajustar(ejemplos, epocas, lr, l2)
+        self.firma_log = firma
+        return len(ejemplos)
+
+    @staticmethod
+    def _ajustar(ejemplos, epocas, lr, l2):
+        """Regresión logística multiclase por descenso de gradiente sobre rasgos dispersos."""
+        filas, cols = [], []
+        for i, (q, _) in enumerate(ejemplos):
+            idx = rasgos(q)
+            filas += [i] * len(idx)
+            cols += idx
+        filas, cols = np.array(filas), np.array(cols)
+        conteo = np.bincount(filas, minlength=len(ejemplos))
+        vals = (1.0 / np.sqrt(np.maximum(conteo, 1)))[filas].astype(np.float32)
+        y = np.zeros((len(ejemplos), len(RUTAS)), dtype=np.float32)
+        y[np.arange(len(ejemplos)), [RUTAS.index(r) for _, r in ejemplos]] = 1.0
+
+        pesos = np.zeros((DIM_HASH, len(RUTAS)), dtype=np.float32)
+        sesgo = np.zeros(len(RUTAS), dtype=np.float32)
+        for _ in range(epocas):
+            puntajes = np.zeros_like(y)
+            np.add.at(puntajes, filas, pesos[cols] * vals[:, None])
+            error = _softmax(puntajes + sesgo) - y
+            grad = np.zeros_like(pesos)
+            np.add.at(grad, cols, error[filas] * vals[:, None])
+            pesos -= lr * (grad / len(ejemplos) + l2 * pesos)
+            sesgo -= lr * error.mean(axis=0)
+        return pesos, sesgo
+
+    def reentrenar(self):
+        """Entrena si el log cambió desde el último entrenamiento (o si nunca se entrenó). Devuelve si entrenó."""
+        if self.modelo is not None and self._firma_log() == self.firma_log: return False
+        with self.entrenando:
+            if self.modelo is not None and self._firma_log() == self.firma_log: return False
+            self._entrenar()
+        return True
+
+    def iniciar(self, intervalo=REENTRENAR_S):
+        """Entrena en segundo plano ya mismo y después cada `intervalo` segundos (una sola vez por proceso)."""
+        with self.lock:
+            if self.hilo is not None: return
+            self.hilo = threading.Thread(target=self._bucle, args=(intervalo,), daemon=True, name="router-local")
+        self.hilo.start()
+
+    def _bucle(self, intervalo):
+        while True:
+            try:
+                t0 = time.perf_counter()
+                if self.reentrenar(): print(f"   🧭 Router local entrenado en {(time.perf_counter() - t0) * 1000:.0f}ms")
+            except Exception as e: print(f"   ⚠️ No se pudo entrenar el router local: {e}")
+            time.sleep(intervalo)
+
+    def probabilidades(self, texto):
+        modelo = self.modelo
+        if modelo is None:
+            self.reentrenar()       # Sin `iniciar()`: el primero entrena, los demás esperan ese mismo entrenamiento
+            modelo = self.modelo
+        pesos, sesgo = modelo
+        idx = rasgos(texto)
+        if not idx: return np.full(len(RUTAS), 1.0 / len(RUTAS))
+        return _softmax(pesos[idx].sum(axis=0) / np.sqrt(len(idx)) + sesgo)
+
+    def clasificar(self, texto):
+        """(ruta, confianza); ruta es None si la confianza no supera el umbral."""
+        probs = self.probabilidades(texto)
+        mejor = int(np.argmax(probs))
+        confianza = float(probs[mejor])
+        if confianza < self.umbral:
+            self.al_llm += 1
+            return None, confianza
+        self.locales += 1
+        return RUTAS[mejor], confianza
+
+    def registrar(self, q, ruta):
+        """Guarda la decisión del LLM como ejemplo para el próximo entrenamiento."""
+        if not self.ruta_log or ruta not in RUTAS: return
+        if os.path.dirname(self.ruta_log): os.makedirs(os.path.dirname(self.ruta_log), exist_ok=True)
+        with self.lock, open(self.ruta_log, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"q": q, "ruta": ruta}, ensure_ascii=False) + "\n")
+
+    def stats(self):
+        total = self.locales + self.al_llm
+        return {"locales": self.locales, "al_llm": self.al_llm,
+                "tasa_local": self.locales / total if total else 0.0}
@@ -0,0 +1,18 @@
+import os
+import sys
+import tempfile
+
+# Los módulos viven en la raíz del repo (sin paquete)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Igual que benchmarks/bench_offline: el estado en disco a un temporal y claves falsas (consultas las exige)
+TMP = tempfile.mkdtemp(prefix="ragia_tests_")
+for var, archivo in [("EMBED_CACHE_PATH", "embeddings.sqlite"), ("VERSION_DATOS_PATH", "version_datos"),
+                     ("PLANES_SQL_PATH", "planes_sql.json"), ("RESUMEN_PATH", "resumen.json"),
+                     ("ROUTER_LOG_PATH", "rutas_router.jsonl"), ("TRAZAS_PATH", "trazas.jsonl"),
+                     ("INGESTA_BITACORA_PATH", "ingesta_bitacora.sqlite"), ("INGESTA_FALLIDOS_PATH", "ingesta_fallidos.jsonl"),
+                     ("INDICE_SNAPSHOT", "indice_documentos"), ("SQL_CURSORES_PATH", "cursores_sql.sqlite")]:
+    os.environ[var] = os.path.join(TMP, archivo)
+os.environ.setdefault("GEMINI_API_KEY", "test")
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:9")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "test.test.test")
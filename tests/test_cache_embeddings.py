@@ -0,0 +1,30 @@
+import numpy as np
+import cache_embeddings
+from cache_embeddings import CacheEmbeddings
+
+def sentencias(cache):
+    vistas = []
+    cache.db.set_trace_callback(vistas.append)
+    return vistas
+
+def test_desaloja_lo_menos_usado_sin_contar_en_cada_put(tmp_path):
+    cache = CacheEmbeddings(str(tmp_path / "e.sqlite"), max_entradas=100)
+    vistas = sentencias(cache)
+    for i in range(100): cache.put("m", None, None, f"t{i}", [float(i)])
+    assert cache.get("m", None, None, "t0") is not None     # t0 pasa a ser reciente
+    cache.put("m", None, None, "t100", [100.0])
+    assert sum("count(*)" in s for s in vistas) == 1
+    assert cache.stats()["entradas"] == 95
+    assert cache.get("m", None, None, "t0") is not None
+    assert cache.get("m", None, None, "t1") is None           # El menos usado se fue
+
+def test_los_aciertos_no_escriben_en_cada_lectura(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_embeddings, "USOS_POR_LOTE", 3)
+    cache = CacheEmbeddings(str(tmp_path / "e.sqlite"))
+    cache.put_many("m", None, None, ["a", "b", "c"], [[1.0], [2.0], [3.0]])
+    vistas = sentencias(cache)
+    np.testing.assert_array_equal(cache.get("m", None, None, "a"), [1.0])
+    cache.get_many("m", None, None, ["a", "b"])
+    assert not any(s.startswith("update") or s == "COMMIT" for s in vistas)
+    cache.get("m", None, None, "c")                          # Tercera clave: se escribe el lote
+    assert sum(s.startswith("update") for s in vistas) == 3 and vistas.count("COMMIT") == 1
@@ -0,0 +1,51 @@
+import pytest
+import consultas
+import resumen_stats
+from consultas import es_cacheable, firma_pregunta
+from resumen_stats import ResumenStats, construir_resumen, guardar_resumen
+
+HISTORIAL = [{"role": "user", "content": "cuantas ofertas pendientes hay"}, {"role": "model", "content": "Hay **12**."}]
+
+@pytest.mark.parametrize("q", [
+    "cuantas ofertas pendientes hay del 2024",
+    "lista las ofertas adjudicadas de Antamina",
+    "¿Cuál es el monto total adjudicado en 2023?",
+])
+def test_preguntas_autonomas_se_cachean_aun_con_historial(q):
+    assert es_cacheable(q, HISTORIAL)
+    assert es_cacheable(q, [])
+
+@pytest.mark.parametrize("q", [
+    "y del 2023?",
+    "¿Y cuántas de ellas son de Antamina?",
+    "cuantas de esas son del 2024",
+    "dame los montos de esos clientes",
+    "muestra sus códigos y clientes por favor",
+    "las mismas pero solo adjudicadas",
+])
+def test_seguimientos_con_historial_no_se_cachean(q):
+    assert not es_cacheable(q, HISTORIAL)
+    assert es_cacheable(q, None)
+
+@pytest.fixture
+def catalogo(tmp_path, monkeypatch):
+    monkeypatch.setattr(resumen_stats, "RUTA_RESUMEN", str(tmp_path / "resumen.json"))
+    guardar_resumen(construir_resumen([{"cliente": "ANTAMINA", "estado de oferta": "NO ADJUDICADO"},
+                                       {"cliente": "SOUTHERN PERU", "estado de oferta": "ADJUDICADO"}]))
+    monkeypatch.setattr(consultas, "RESUMEN", ResumenStats())
+
+def test_firma_igual_para_preguntas_casi_iguales(catalogo):
+    firma = firma_pregunta("cuantas ofertas no adjudicadas tiene Antamina en 2024")
+    assert firma == (("2024",), ("no adjudicad",), ("ANTAMINA",))
+    assert firma_pregunta("¿Cuántas ofertas NO ADJUDICADAS tiene antamina en 2024?") == firma
+
+@pytest.mark.parametrize("q", [
+    "cuantas ofertas adjudicadas tiene Antamina en 2024",      # "no adjudicad" no cuenta también como "adjudicad"
+    "cuantas ofertas no adjudicadas tiene Southern Peru en 2024",
+    "cuantas ofertas no adjudicadas tiene Antamina en 2023",
+])
+def test_firma_distingue_estado_cliente_y_numeros(catalogo, q):
+    assert firma_pregunta(q) != firma_pregunta("cuantas ofertas no adjudicadas tiene Antamina en 2024")
+
+def test_firma_incluye_codigos(catalogo):
+    assert "OF-24-0001" in firma_pregunta("estado de la of-24-0001")[0]
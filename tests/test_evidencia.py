@@ -0,0 +1,58 @@
+from evidencia import empaquetar_docs, empaquetar_filas, estimar_tokens
+
+MODELO = "models/prueba"
+
+def doc(i, similitud, fuente="VECTOR", **extra):
+    meta = {"codigo": f"OF-{i}", "cliente": "ANTAMINA", "estado": "nan", "monto": i * 100}
+    return {"id": i, "similarity": similitud, "source_type": fuente, "metadata": meta,
+            "content": ". ".join(f"{k}: {v}" for k, v in meta.items()), **extra}
+
+def test_docs_por_relevancia_sin_vacios_ni_content_repetido(monkeypatch):
+    monkeypatch.setenv("EVIDENCIA_TOKENS", "2000")
+    texto, stats = empaquetar_docs([doc(1, 0.9), doc(2, 0.5, "EXACTO"), doc(3, 0.7)], MODELO)
+    lineas = texto.splitlines()
+    assert lineas[0] == "En todas: cliente=ANTAMINA"
+    assert lineas[1] == "fuente | similitud | codigo | monto"
+    assert [l.split(" | ")[2] for l in lineas[2:]] == ["OF-2", "OF-1", "OF-3"]   # Exactos primero
+    assert "nan" not in texto and "texto" not in lineas[1]
+    assert stats == {"docs": 3, "incluidos": 3, "tokens": estimar_tokens(texto)}
+
+def test_docs_puntaje_del_reordenador_manda(monkeypatch):
+    monkeypatch.setenv("EVIDENCIA_TOKENS", "2000")
+    texto, _ = empaquetar_docs([doc(1, 0.9, "EXACTO", puntaje=0.1), doc(2, 0.2, puntaje=0.8)], MODELO)
+    assert texto.index("OF-2") < texto.index("OF-1")
+
+def test_docs_content_que_agrega_algo(monkeypatch):
+    monkeypatch.setenv("EVIDENCIA_TOKENS", "2000")
+    d = doc(1, 0.9)
+    d["content"] += ". Observación: cliente pidió prórroga"
+    texto, _ = empaquetar_docs([d], MODELO)
+    assert "Observación: cliente pidió prórroga" in texto
+
+def test_docs_se_cortan_al_presupuesto(monkeypatch):
+    monkeypatch.setenv("EVIDENCIA_TOKENS", "60")
+    texto, stats = empaquetar_docs([doc(i, 1 - i / 100) for i in range(40)], MODELO)
+    assert 0 < stats["incluidos"] < 40 and stats["docs"] == 40
+    assert f"({stats['incluidos']} de 40 documentos, por relevancia)" in texto
+    assert "OF-0 " in texto and "OF-39" not in texto
+
+def test_docs_vacio(monkeypatch):
+    monkeypatch.setenv("EVIDENCIA_TOKENS", "2000")
+    assert empaquetar_docs([], MODELO) == ("(sin filas)", {"docs": 0, "incluidos": 0, "tokens": 3})
+
+def test_filas_que_caben_van_completas(monkeypatch):
+    monkeypatch.setenv("EVIDENCIA_TOKENS", "2000")
+    filas = [{"codigo": "OF-1", "monto": 10}, {"codigo": "OF-2", "monto": 20}]
+    texto, stats = empaquetar_filas(filas, MODELO)
+    assert texto == "codigo | monto\nOF-1 | 10\nOF-2 | 20"
+    assert stats == {"filas": 2, "incluidas": 2, "tokens": estimar_tokens(texto)}
+
+def test_filas_de_mas_se_resumen_con_agregados(monkeypatch):
+    monkeypatch.setenv("EVIDENCIA_TOKENS", "150")
+    filas = [{"codigo": f"OF-{i}", "estado": "ADJUDICADO" if i % 2 else "PENDIENTE", "monto": i} for i in range(200)]
+    texto, stats = empaquetar_filas(filas, MODELO)
+    assert texto.startswith("Total filas: 200\n")
+    assert "estado: PENDIENTE (100), ADJUDICADO (100)" in texto
+    assert "monto: suma 19,900.00, mín 0.00, máx 199.00" in texto
+    assert 0 < stats["incluidas"] < 200 and f"Primeras {stats['incluidas']} de 200 filas:" in texto
+    assert stats["tokens"] <= 150
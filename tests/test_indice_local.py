@@ -0,0 +1,49 @@
+import json
+import os
+import numpy as np
+import pytest
+from indice_local import IndiceVectorial
+
+def filas(desde, hasta, semilla=0):
+    rng = np.random.default_rng(semilla + desde)
+    return [{"id": i, "content": f"doc {i}", "metadata": {"n": i}, "embedding": rng.normal(size=768).tolist()}
+            for i in range(desde, hasta)]
+
+@pytest.mark.parametrize("cuantizar, dim", [(False, None), (True, None), (False, 256), (True, 256)])
+def test_guardar_y_cargar_dan_el_mismo_indice(tmp_path, cuantizar, dim):
+    idx = IndiceVectorial(cuantizar=cuantizar, dim=dim)
+    idx.agregar(filas(1, 80))
+    idx.quitar([3, 40])
+    base = str(tmp_path / "indice")
+    idx.guardar(base)
+    cargado = IndiceVectorial.cargar(base)
+    assert (cargado.cuantizar, cargado.dim, len(cargado)) == (cuantizar, dim, len(idx))
+    assert isinstance(cargado.matriz, np.memmap)
+    q = filas(500, 501)[0]["embedding"]
+    assert cargado.buscar(q, -1.0, 5) == idx.buscar(q, -1.0, 5)
+
+def test_guardar_no_pisa_la_version_que_se_esta_leyendo(tmp_path):
+    base = str(tmp_path / "indice")
+    idx = IndiceVectorial()
+    idx.agregar(filas(1, 20))
+    idx.guardar(base)
+    lector = IndiceVectorial.cargar(base)
+    for desde in (20, 40, 60):
+        idx.agregar(filas(desde, desde + 20))
+        idx.guardar(base)
+        assert len(IndiceVectorial.cargar(base)) == desde + 19
+    # El lector viejo sigue leyendo su versión (los archivos mapeados no se sobrescribieron)
+    assert len(lector.buscar(filas(1, 2)[0]["embedding"], -1.0, 50)) == 19
+    versiones = {n.split(".")[1] for n in os.listdir(tmp_path) if n != "indice.json"}
+    assert len(versiones) <= 2      # Solo la vigente y la anterior
+
+def test_cargar_rechaza_un_snapshot_inconsistente(tmp_path):
+    base = str(tmp_path / "indice")
+    idx = IndiceVectorial()
+    idx.agregar(filas(1, 10))
+    idx.guardar(base)
+    with open(f"{base}.json", encoding="utf-8") as f: manifiesto = json.load(f)
+    docs = tmp_path / manifiesto["archivos"]["docs"]
+    docs.write_text(json.dumps(json.loads(docs.read_text(encoding="utf-8"))[:-1]), encoding="utf-8")
+    with pytest.raises(ValueError, match="inconsistente"):
+        IndiceVectorial.cargar(base)
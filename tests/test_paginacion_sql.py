@@ -0,0 +1,56 @@
+import pytest
+from paginacion_sql import sql_pagina, pagina_de, tiene_orden, es_pedido_de_mas, CursoresSQL
+from benchmarks.falsos import SupabaseFalso
+
+FILAS = [("A", 5), ("B", 3), ("A", 5), ("C", 9), ("A", 5), ("B", 1), ("D", 2)]
+
+@pytest.fixture
+def db():
+    db = SupabaseFalso()
+    db.table("documentos_dj").insert([{"content": "", "metadata": {"cliente": c, "monto": m}} for c, m in FILAS]).execute()
+    return db
+
+def recorrer(db, sql, limite):
+    """Todas las páginas como las pide "muéstrame más": (filas, nº de llamadas, total de la primera)."""
+    filas, cursor, llamadas = [], None, 0
+    while True:
+        res = db.rpc("query_exec", {"query": sql_pagina(sql, limite, cursor)}).execute().data
+        llamadas += 1
+        pagina = pagina_de(res, cursor, limite)
+        if cursor is None: total = pagina["total"]
+        filas += pagina["filas"]
+        if not pagina["hay_mas"]: return filas, llamadas, total
+        cursor = {"desde": pagina["desde"] + len(pagina["filas"]), "total": pagina["total"],
+                  "clave": pagina["clave"], "repetidas": pagina["repetidas"]}
+
+def test_tiene_orden():
+    assert tiene_orden("SELECT a FROM t ORDER BY a DESC LIMIT 10")
+    assert not tiene_orden("SELECT a FROM (SELECT a FROM t ORDER BY a) s")
+    assert not tiene_orden("SELECT a FROM t WHERE b = 'order by'")
+
+@pytest.mark.parametrize("limite", [1, 2, 3, 10])
+def test_keyset_sin_saltar_ni_repetir_duplicados(db, limite):
+    filas, llamadas, total = recorrer(db, "SELECT metadata->>'cliente' AS cliente FROM documentos_dj", limite)
+    assert sorted(f["cliente"] for f in filas) == sorted(c for c, _ in FILAS)
+    assert total == len(FILAS)
+    assert llamadas == max(1, -(-len(FILAS) // limite))   # Una llamada por página, total incluido
+
+def test_respeta_el_order_by_del_modelo(db):
+    sql = ("SELECT metadata->>'cliente' AS c, metadata->>'monto' AS m FROM documentos_dj "
+           "ORDER BY (metadata->>'monto')::int DESC")
+    filas, _, total = recorrer(db, sql, 3)
+    assert [f["m"] for f in filas] == sorted((m for _, m in FILAS), reverse=True)
+    assert total == len(FILAS) and all(set(f) == {"c", "m"} for f in filas)
+
+def test_pagina_de_sin_mas_filas_cuenta_el_total():
+    pagina = pagina_de([{"a": 1, "_clave": "(1)", "_total": 1}], None, 40)
+    assert pagina == {"filas": [{"a": 1}], "desde": 0, "total": 1, "hay_mas": False, "clave": "(1)", "repetidas": 1}
+
+def test_literal_con_comillas_en_la_clave():
+    assert "where t::text >= '(O''Brien)'" in sql_pagina("SELECT x FROM t", 2, {"clave": "(O'Brien)", "total": 5})
+
+def test_cursores_guardan_la_clave():
+    cursores = CursoresSQL(":memory:")
+    cursores.guardar("t1", "SELECT 1", 40, 90, None, "lista", '["A"]', 2)
+    assert cursores.del_historial([{"role": "model", "traza": "t1"}])["clave"] == '["A"]'
+    assert es_pedido_de_mas("muéstrame más") and not es_pedido_de_mas("muéstrame las pendientes")
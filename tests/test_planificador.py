@@ -0,0 +1,52 @@
+import asyncio
+import threading
+import time
+import pytest
+from planificador import Planificador, SistemaSaturado, INGESTA
+
+MODELO = "models/prueba"
+
+def test_sale_por_prioridad_y_orden_de_llegada():
+    plan = Planificador(cuotas={MODELO: 60 * 100})
+    orden = []
+    plan._estado(MODELO).bucket.fichas = 0      # Sin ráfaga inicial: todos hacen cola
+    def pedir(nombre, prioridad):
+        plan.adquirir(MODELO, prioridad)
+        orden.append(nombre)
+    hilos = [threading.Thread(target=pedir, args=(f"ingesta{i}", INGESTA)) for i in range(3)]
+    for h in hilos: h.start()
+    time.sleep(0.005)
+    interactivo = threading.Thread(target=pedir, args=("bot", 0))
+    interactivo.start()
+    for h in hilos + [interactivo]: h.join(5)
+    assert sorted(orden) == ["bot", "ingesta0", "ingesta1", "ingesta2"]
+    assert orden.index("bot") <= 1
+    assert plan.metricas()[MODELO]["en_cola"] == 0
+
+def test_los_de_atras_no_sondean():
+    """Con 20 hilos en cola, cada uno revisa al entrar y cuando le toca (antes: cada 50 ms mientras esperaba)."""
+    plan = Planificador(cuotas={MODELO: 60 * 20})
+    plan._estado(MODELO).bucket.fichas = 0
+    revisiones = []
+    original = plan._intentar
+    plan._intentar = lambda m, t: revisiones.append(t) or original(m, t)
+    hilos = [threading.Thread(target=plan.adquirir, args=(MODELO,)) for _ in range(20)]
+    for h in hilos: h.start()
+    for h in hilos: h.join(10)
+    assert plan.metricas()[MODELO]["atendidas"] == 20
+    assert len(revisiones) < 20 * 4 and not plan.avisos
+
+def test_async_descarta_si_la_espera_supera_el_maximo():
+    plan = Planificador(cuotas={MODELO: 6}, max_espera_s=0.2)
+    async def correr():
+        await plan.aadquirir(MODELO)
+        with pytest.raises(SistemaSaturado): await plan.aadquirir(MODELO)
+    asyncio.run(correr())
+    assert plan.metricas()[MODELO]["descartadas"] == 1 and not plan.avisos
+
+def test_async_en_cola_sale_cuando_sale_el_de_adelante():
+    plan = Planificador(cuotas={MODELO: 60 * 50})
+    async def correr():
+        await asyncio.gather(*(plan.aadquirir(MODELO) for _ in range(30)))
+    asyncio.run(correr())
+    assert plan.metricas()[MODELO]["atendidas"] == 30 and plan.metricas()[MODELO]["en_cola"] == 0
@@ -0,0 +1,42 @@
+from plantilla_sql import leer_respuesta, rellenar, renderizar
+
+LISTA = {"sql": "select ...", "encabezado": "Encontré {total} ofertas:", "fila": "* {codigo}: {cliente}",
+         "vacio": "No hay ofertas de ese cliente."}
+
+def test_rellenar_solo_reemplaza_los_nombres():
+    assert rellenar("Hay **{count}** ofertas de {cliente}.", {"count": "3", "cliente": "ANTAMINA"}) == \
+        "Hay **3** ofertas de ANTAMINA."
+    assert rellenar("{ cliente }", {"cliente": "X"}) == "X"
+    # Sin str.format: atributos e índices no se evalúan, quedan como nombres que faltan
+    assert rellenar("{cliente.__class__}", {"cliente": "X"}) is None
+
+def test_rellenar_devuelve_none_si_falta_un_alias():
+    assert rellenar("Hay {count} de {anio}", {"count": "3"}) is None
+
+def test_renderizar_lista_con_total_de_la_consulta():
+    filas = [{"codigo": "OF-1", "cliente": "ANTAMINA"}, {"codigo": "OF-2", "cliente": None}]
+    assert renderizar(LISTA, filas) == "Encontré 2 ofertas:\n* OF-1: ANTAMINA\n* OF-2: -"
+    assert renderizar(LISTA, filas, total=120).startswith("Encontré 120 ofertas:")
+
+def test_renderizar_una_cifra():
+    respuesta = {"encabezado": "Hay **{count}** ofertas.", "fila": "", "vacio": ""}
+    assert renderizar(respuesta, [{"count": 1234}]) == "Hay **1234** ofertas."
+    assert renderizar(respuesta, [{"count": 1234.5}]) == "Hay **1,234.50** ofertas."
+
+def test_renderizar_vacio():
+    assert renderizar(LISTA, []) == "No hay ofertas de ese cliente."
+    assert renderizar(LISTA, [{"count": 0}]) == "No hay ofertas de ese cliente."
+    assert renderizar({**LISTA, "vacio": ""}, []) is None
+
+def test_renderizar_pide_narrar():
+    filas = [{"codigo": f"OF-{i}", "cliente": "A"} for i in range(5)]
+    assert renderizar(LISTA, filas, max_filas=4) is None                         # Demasiadas filas
+    assert renderizar({**LISTA, "fila": "* {monto}"}, filas) is None              # Alias que no está
+    assert renderizar({**LISTA, "fila": ""}, filas) is None                       # Varias filas sin formato
+    assert renderizar({"sql": "select 1"}, filas) is None                         # Sin plantilla
+    assert renderizar(LISTA, "error de SQL") is None
+
+def test_leer_respuesta_sin_formato_devuelve_solo_sql():
+    assert leer_respuesta('```json\n{"sql": "select 1", "encabezado": "Hay {count}"}\n```') == \
+        {"sql": "select 1", "encabezado": "Hay {count}", "fila": "", "vacio": ""}
+    assert leer_respuesta("select 1") == {"sql": "select 1"}
@@ -0,0 +1,74 @@
+import json
+import time
+import pytest
+import resumen_stats
+from resumen_stats import ResumenStats, anio_de_codigo, construir_resumen, guardar_resumen
+from plan_sql import clausula_anio
+from benchmarks.falsos import SupabaseFalso, postgres_a_sqlite
+
+METADATAS = [
+    {"codigo de oferta": "OF-24-0001", "cliente": "ANTAMINA", "estado de oferta": "ADJUDICADO"},
+    {"codigo de oferta": "OF-24-0002", "cliente": "ANTAMINA", "estado de oferta": "PENDIENTE"},
+    {"codigo de oferta": "OF-23-0003", "cliente": "SOUTHERN", "estado de oferta": "ADJUDICADO"},
+    {"codigo de oferta": "SZ1234_24", "cliente": "SOUTHERN", "estado de oferta": "NO ADJUDICADO"},
+    {"codigo de oferta": "SZ5_24X_17", "cliente": "SOUTHERN", "estado de oferta": "ADJUDICADO"},
+]
+
+@pytest.fixture
+def resumen(tmp_path, monkeypatch):
+    monkeypatch.setattr(resumen_stats, "RUTA_RESUMEN", str(tmp_path / "resumen.json"))
+    guardar_resumen(construir_resumen(METADATAS))
+    return ResumenStats()
+
+@pytest.mark.parametrize("q, esperado", [
+    ("cuantas adjudicadas del 2024", "Hay **1** ofertas adjudicadas del 2024."),
+    ("cuantas ofertas tiene Antamina", "Hay **2** ofertas de ANTAMINA."),
+    ("cuantas ofertas perdidas hay", "Hay **1** ofertas no adjudicadas."),
+    ("cuantas ofertas hay por favor", "Hay **5** ofertas."),
+])
+def test_responde_un_solo_total(resumen, q, esperado):
+    assert resumen.responder(q) == esperado
+
+@pytest.mark.parametrize("q", [
+    "cuantas ofertas hay por cliente",
+    "cuantas ofertas adjudicadas hay por año",
+    "cuantas ofertas hay de cada estado",
+    "cuantas ofertas adjudicadas del 2024 y del 2023",
+    "cuantas adjudicadas y pendientes hay",
+    "cuantas ofertas tienen Antamina y Southern",
+    "¿Cuántos clientes tenemos?",
+    "cuantas ofertas de OF-24-0001",
+])
+def test_desgloses_y_filtros_desconocidos_van_al_sql(resumen, q):
+    assert resumen.responder(q) is None
+
+def test_lista_por_estado(resumen):
+    texto = resumen.responder("dame las ofertas pendientes")
+    assert texto.startswith("Ofertas pendientes (1):") and "OF-24-0002" in texto
+
+def test_anio_igual_que_la_clausula_sql():
+    """El conteo del resumen y el del SQL generado cuentan las mismas ofertas por año."""
+    db = SupabaseFalso()
+    db.table("documentos_dj").insert([{"content": "", "metadata": m} for m in METADATAS]).execute()
+    for anio in ("24", "23", "17"):
+        sql = f"SELECT metadata->>'codigo de oferta' AS c FROM documentos_dj WHERE {clausula_anio(anio)}"
+        por_sql = sorted(f["c"] for f in db.rpc("query_exec", {"query": sql}).execute().data)
+        por_resumen = sorted(m["codigo de oferta"] for m in METADATAS if anio_de_codigo(m["codigo de oferta"]) == anio)
+        assert por_sql == por_resumen, anio
+    assert "ESCAPE" in postgres_a_sqlite(clausula_anio("24"))
+
+def test_tabla_mas_nueva_gana_al_archivo_local(tmp_path, monkeypatch):
+    monkeypatch.setattr(resumen_stats, "RUTA_RESUMEN", str(tmp_path / "resumen.json"))
+    db = SupabaseFalso()
+    viejo = construir_resumen(METADATAS[:1])
+    viejo["actualizado"] = time.time() - 3600
+    guardar_resumen(viejo)
+    guardar_resumen(construir_resumen(METADATAS), db)
+    guardar_resumen(viejo)      # Solo el archivo local vuelve atrás
+    stats = ResumenStats(db, ttl=0)
+    assert stats.obtener()["total"] == len(METADATAS)
+    # Un archivo local más nuevo que la tabla sí reemplaza al de la tabla
+    nuevo = construir_resumen(METADATAS[:2])
+    nuevo["actualizado"] = time.time() + 60
+    with open(resumen_stats.RUTA_RESUMEN, "w", encoding="utf-8") as f: json.dump(nuevo, f)
+    assert stats.obtener()["total"] == 2
@@ -0,0 +1,24 @@
+import threading
+from router_local import RouterLocal, ruta_por_palabras
+
+def test_palabras_con_limite():
+    assert ruta_por_palabras("cuantas ofertas pendientes hay") == "SQL"
+    assert ruta_por_palabras("que opina el presidente ahora") is None
+
+def test_un_solo_entrenamiento_con_pedidos_concurrentes(tmp_path, monkeypatch):
+    router = RouterLocal(ruta_log=str(tmp_path / "rutas.jsonl"))
+    entrenamientos = []
+    original = router._entrenar
+    monkeypatch.setattr(router, "_entrenar", lambda *a, **k: entrenamientos.append(1) or original(*a, **k))
+    hilos = [threading.Thread(target=router.clasificar, args=("hola",)) for _ in range(8)]
+    for h in hilos: h.start()
+    for h in hilos: h.join()
+    assert len(entrenamientos) == 1
+
+def test_reentrena_solo_si_el_log_cambio(tmp_path):
+    router = RouterLocal(ruta_log=str(tmp_path / "rutas.jsonl"))
+    assert router.reentrenar()
+    assert not router.reentrenar()
+    router.registrar("cuanto vendimos a la minera del norte", "SQL")
+    assert router.reentrenar()
+    assert not router.reentrenar()
@@ -0,0 +1,27 @@
+import os
+import trazas
+from trazas import Metricas, Traza, escapar, etiqueta_ruta
+
+def test_rutas_desconocidas_van_como_otra():
+    assert etiqueta_ruta(" sql ") == "SQL"
+    assert etiqueta_ruta('ERROR IA: 429 "quota"\\n') == "OTRA"
+    assert etiqueta_ruta(None) == "OTRA"
+
+def test_prometheus_escapa_las_etiquetas():
+    metricas = Metricas()
+    metricas.observar("etapa", 'raro "a"\\b\nc', 0.5)
+    texto = metricas.prometheus()
+    assert 'etapa="raro \\"a\\"\\\\b\\nc"' in texto
+    assert escapar('x"y') == 'x\\"y'
+    assert all(l.count('"') % 2 == 0 for l in texto.splitlines())
+
+def test_el_jsonl_rota_al_pasar_el_tope(tmp_path, monkeypatch):
+    ruta = str(tmp_path / "trazas.jsonl")
+    monkeypatch.setattr(trazas, "RUTA_TRAZAS", ruta)
+    monkeypatch.setattr(trazas, "TRAZAS_MAX_BYTES", 2000)
+    for _ in range(100):
+        traza = Traza(ruta="SQL", relleno="x" * 100)
+        traza.cerrar()
+    assert os.path.getsize(ruta) < 2000 + 500
+    respaldos = sorted(n for n in os.listdir(tmp_path) if n != "trazas.jsonl")
+    assert respaldos == [f"trazas.jsonl.{i}" for i in range(1, trazas.TRAZAS_RESPALDOS + 1)]
@@ -0,0 +1,251 @@
+import os
+import json
+import asyncio
+import time
+import uuid
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- CONFIGURACIÓN ---
+RUTA_TRAZAS = os.environ.get("TRAZAS_PATH", ".cache/trazas.jsonl")   # "" = no exportar a JSONL
+TRAZAS_MAX_BYTES = int(float(os.environ.get("TRAZAS_MAX_MB", "50")) * 1024 * 1024)   # Al pasarlo se rota
+TRAZAS_RESPALDOS = 3                                                  # trazas.jsonl.1 ... .3 (el más viejo se pierde)
+METRICAS_PUERTO = int(os.environ.get("METRICAS_PUERTO", "0"))         # 0 = sin endpoint /metrics
+MUESTRAS_MAX = 2048                                                   # Por ruta/etapa, para los percentiles
+CUANTILES = (0.5, 0.95, 0.99)
+# La ruta puede venir del LLM ("ERROR IA: ..."): en las métricas, cualquier otra cosa es "OTRA"
+RUTAS_METRICAS = ("SQL", "RAG", "WEB", "GENERAL", "CACHE")
+
+_traza = contextvars.ContextVar("traza", default=None)
+
+def nuevo_id():
+    return uuid.uuid4().hex[:16]
+
+# --- 1. MÉTRICAS AGREGADAS (percentiles por ruta y por etapa) ---
+def cuantil(ordenados, q):
+    if not ordenados: return 0.0
+    return ordenados[min(len(ordenados) - 1, int(q * len(ordenados)))]
+
+def etiqueta_ruta(ruta):
+    ruta = str(ruta or "").strip().upper()
+    return ruta if ruta in RUTAS_METRICAS else "OTRA"
+
+def escapar(valor):
+    """Valor de etiqueta de Prometheus: `\\`, `"` y saltos de línea escapados."""
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class Metricas:
+    """Últimas MUESTRAS_MAX duraciones por ruta (respuestas) y por etapa (spans), con conteo y suma totales."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.series = {}   # (tipo, nombre) -> {"muestras": deque, "n": int, "suma": float, "errores": int}
+
+    def observar(self, tipo, nombre, segundos, error=False):
+        with self.lock:
+            serie = self.series.setdefault((tipo, nombre), {"muestras": deque(maxlen=MUESTRAS_MAX), "n": 0, "suma": 0.0, "errores": 0})
+            serie["muestras"].append(segundos)
+            serie["n"] += 1
+            serie["suma"] += segundos
+            serie["errores"] += int(error)
+
+    def resumen(self, tipo="ruta"):
+        """{nombre: {n, errores, p50, p95, p99}} en segundos."""
+        with self.lock:
+            copia = {n: (sorted(s["muestras"]), s["n"], s["errores"]) for (t, n), s in self.series.items() if t == tipo}
+        return {
+            nombre: {"n": n, "errores": errores, **{f"p{int(q * 100)}": round(cuantil(m, q), 3) for q in CUANTILES}}
+            for nombre, (m, n, errores) in sorted(copia.items())
+        }
+
+    def prometheus(self):
+        """Texto en formato de exposición de Prometheus (summaries + métricas del planificador)."""
+        nombres = {"ruta": ("ragia_respuesta_segundos", "ruta"), "etapa": ("ragia_etapa_segundos", "etapa")}
+        lineas = []
+        with self.lock:
+            series = {k: (sorted(s["muestras"]), s["n"], s["suma"], s["errores"]) for k, s in self.series.items()}
+        for tipo, (metrica, etiqueta) in nombres.items():
+            lineas.append(f"# TYPE {metrica} summary")
+            for (t, nombre), (m, n, suma, _) in sorted(series.items()):
+                if t != tipo: continue
+                nombre = escapar(nombre)
+                for q in CUANTILES:
+                    lineas.append(f'{metrica}{{{etiqueta}="{nombre}",quantile="{q}"}} {cuantil(m, q):.6f}')
+                lineas.append(f'{metrica}_sum{{{etiqueta}="{nombre}"}} {suma:.6f}')
+                lineas.append(f'{metrica}_count{{{etiqueta}="{nombre}"}} {n}')
+        lineas.append("# TYPE ragia_respuestas_error_total counter")
+        for (t, nombre), (_, _, _, errores) in sorted(series.items()):
+            if t == "ruta": lineas.append(f'ragia_respuestas_error_total{{ruta="{escapar(nombre)}"}} {errores}')
+
+        from planificador import obtener_planificador
+        for campo, tipo in [("en_cola", "gauge"), ("descartadas", "counter"), ("errores_429", "counter"), ("espera_max_s", "gauge")]:
+            lineas.append(f"# TYPE ragia_gemini_{campo} {tipo}")
+            for modelo, m in obtener_planificador().metricas().items():
+                lineas.append(f'ragia_gemini_{campo}{{modelo="{escapar(modelo)}"}} {m[campo]}')
+        return "\n".join(lineas) + "\n"
+
+METRICAS = Metricas()
+
+# --- 2. TRAZAS Y SPANS ---
+_export_lock = threading.Lock()
+
+class Traza:
+    """Una pregunta de un usuario: id, atributos (ruta, usuario, canal...) y la lista de spans por etapa."""
+
+    def __init__(self, traza_id=None, **atributos):
+        self.id = traza_id or nuevo_id()
+        self.inicio = time.time()
+        self.t0 = time.perf_counter()
+        self.atributos = dict(atributos)
+        self.spans = []
+        self.cerrada = False
+
+    def cerrar(self, error=None):
+        if self.cerrada: return
+        self.cerrada = True
+        total = time.perf_counter() - self.t0
+        ruta = self.atributos.get("ruta", "?")
+        if error: self.atributos["error"] = str(error)
+        METRICAS.observar("ruta", etiqueta_ruta(ruta), total, error=bool(error))
+        print(f"   🧵 Traza {self.id} [{ruta}] {total:.2f}s | {len(self.spans)} spans")
+        if not RUTA_TRAZAS: return
+        registro = {"traza": self.id, "inicio": self.inicio, "total_ms": round(total * 1000, 1),
+                    **self.atributos, "spans": self.spans}
+        try:
+            with _export_lock:
+                if os.path.dirname(RUTA_TRAZAS): os.makedirs(os.path.dirname(RUTA_TRAZAS), exist_ok=True)
+                rotar()
+                with open(RUTA_TRAZAS, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(registro, ensure_ascii=False, default=str) + "\n")
+        except OSError as e: print(f"   ⚠️ No se pudo exportar la traza: {e}")
+
+def rotar():
+    """Si el JSONL pasó TRAZAS_MAX_BYTES: trazas.jsonl -> .1 -> .2 ... (con `_export_lock` tomado)."""
+    try:
+        if os.path.getsize(RUTA_TRAZAS) < TRAZAS_MAX_BYTES: return
+        for i in range(TRAZAS_RESPALDOS - 1, 0, -1):
+            if os.path.exists(f"{RUTA_TRAZAS}.{i}"): os.replace(f"{RUTA_TRAZAS}.{i}", f"{RUTA_TRAZAS}.{i + 1}")
+        os.replace(RUTA_TRAZAS, f"{RUTA_TRAZAS}.1")
+    except FileNotFoundError: pass    # Todavía no existe, u otro proceso lo acaba de rotar
+
+def traza_actual():
+    return _traza.get()
+
+def anotar(**atributos):
+    """Agrega atributos a la traza activa (p. ej. ruta=..., origen_sql=...). Sin traza no hace nada."""
+    traza = _traza.get()
+    if traza is not None: traza.atributos.update(atributos)
+
+@contextmanager
+def activar(traza):
+    token = _traza.set(traza)
+    try: yield traza
+    finally: _traza.reset(token)
+
+@contextmanager
+def span(nombre, **atributos):
+    """
+    Mide una etapa. Entrega un dict para anotar resultados (filas, intentos, respuesta_chars...).
+    Sin traza activa igual entrega el dict, pero no registra nada.
+    """
+    traza = _traza.get()
+    datos = dict(atributos)
+    if traza is None:
+        yield datos
+        return
+    t0 = time.perf_counter()
+    error = None
+    try:
+        yield datos
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        segundos = time.perf_counter() - t0
+        if error is not None and not isinstance(error, GeneratorExit): datos["error"] = str(error)
+        traza.spans.append({"nombre": nombre, "inicio_ms": round((t0 - traza.t0) * 1000, 1),
+                            "ms": round(segundos * 1000, 1), **datos})
+        METRICAS.observar("etapa", nombre, segundos, error="error" in datos)
+
+def propagar(fn):
+    """Para pasar `fn` a un ThreadPoolExecutor sin perder la traza activa (los hilos no heredan contextvars)."""
+    traza = _traza.get()
+
+    def envuelta(*args, **kwargs):
+        with activar(traza): return fn(*args, **kwargs)
+    return envuelta
+
+def con_traza(trozos, traza):
+    """Itera un generador de streaming con la traza activa y la cierra al terminar."""
+    n_chars, error = 0, None
+    try:
+        while True:
+            with activar(traza):
+                try: trozo = next(trozos)
+                except StopIteration: break
+            n_chars += len(trozo)
+            yield trozo
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        traza.atributos["respuesta_chars"] = n_chars
+        traza.cerrar(error=error)
+
+async def acon_traza(trozos, traza):
+    """Versión async de `con_traza`."""
+    n_chars, error = 0, None
+    try:
+        while True:
+            with activar(traza):
+                try: trozo = await trozos.__anext__()
+                except StopAsyncIteration: break
+            n_chars += len(trozo)
+            yield trozo
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        traza.atributos["respuesta_chars"] = n_chars
+        await asyncio.to_thread(traza.cerrar, error=error)    # Escribe el JSONL: fuera del event loop
+
+# --- 3. ENDPOINT /metrics ---
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/metrics"):
+            cuerpo, tipo = METRICAS.prometheus(), "text/plain; version=0.0.4"
+        elif self.path.startswith("/resumen"):
+            cuerpo = json.dumps({"rutas": METRICAS.resumen("ruta"), "etapas": METRICAS.resumen("etapa")}, indent=1)
+            tipo = "application/json"
+        else:
+            self.send_error(404)
+            return
+        datos = cuerpo.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def log_message(self, *args): pass
+
+_servidor = None
+_servidor_lock = threading.Lock()
+
+def iniciar_servidor_metricas(puerto=METRICAS_PUERTO):
+    """Sirve /metrics (Prometheus) y /resumen (JSON p50/p95/p99) en un hilo. Una vez por proceso."""
+    global _servidor
+    if not puerto: return None
+    with _servidor_lock:
+        if _servidor is None:
+            try:
+                _servidor = ThreadingHTTPServer(("0.0.0.0", puerto), _Handler)
+            except OSError as e:
+                print(f"   ⚠️ No se pudo abrir el puerto de métricas {puerto}: {e}")
+                return None
+            threading.Thread(target=_servidor.serve_forever, daemon=True).start()
+            print(f"   📈 Métricas en http://0.0.0.0:{puerto}/metrics")
+        return _servidor
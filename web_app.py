@@ -1,6 +1,7 @@
 import streamlit as st
 import time
-from consultas import chatear # Importamos tu cerebro maestro
+from consultas import chatear_stream, precalentar # Importamos tu cerebro maestro (versión en streaming)
+from trazas import nuevo_id, iniciar_servidor_metricas
 
 # --- CONFIGURACIÓN DE LA PÁGINA ---
 st.set_page_config(
@@ -9,6 +10,17 @@ st.set_page_config(
     layout="centered"
 )
 
+# /metrics si METRICAS_PUERTO está definido (una sola vez por proceso, aunque Streamlit re-ejecute)
+iniciar_servidor_metricas()
+
+# Clientes de Supabase/Gemini y esquema: una vez por proceso de Streamlit, no en cada rerun ni por sesión
+@st.cache_resource
+def recursos_cerebro():
+    precalentar()
+    return True
+
+recursos_cerebro()
+
 # --- TÍTULO Y ESTILO ---
 st.title("🤖 Analista de Licitaciones IA")
 st.caption("Experto en Base de Datos SQL, Documentos RAG y Búsqueda Web.")
@@ -36,8 +48,9 @@ if prompt := st.chat_input("Escribe tu consulta aquí..."):
     with st.chat_message("user"):
         st.markdown(prompt)
     
-    # Guardar en historial
-    st.session_state.messages.append({"role": "user", "content": prompt})
+    # Guardar en historial (con la traza que seguirá a esta pregunta por todas las etapas)
+    traza_id = nuevo_id()
+    st.session_state.messages.append({"role": "user", "content": prompt, "traza": traza_id})
 
     # 2. Generar respuesta de la IA
     with st.chat_message("assistant"):
@@ -51,22 +64,29 @@ if prompt := st.chat_input("Escribe tu consulta aquí..."):
                 historial_para_cerebro = st.session_state.messages[:-1] # Excluimos el último actual
                 
                 # LLAMAMOS A TU CEREBRO
-                # Pasamos "Usuario Web" para que sepa quién es
-                respuesta = chatear(
+                # Pasamos "Usuario Web" para que sepa quién es; el texto se va pintando mientras llega
+                metricas = {}
+                respuesta = ""
+                for trozo in chatear_stream(
                     q=prompt, 
                     history=historial_para_cerebro, 
                     datos_usuario="Usuario Web", 
-                    callback=notificar_web # Pasamos la función de notificaciones
-                )
+                    callback=notificar_web, # Pasamos la función de notificaciones
+                    metricas=metricas,
+                    traza_id=traza_id
+                ):
+                    respuesta += trozo
+                    contenedor_respuesta.markdown(respuesta + "▌")
                 
                 # Mostrar respuesta final
                 contenedor_respuesta.markdown(respuesta)
+                st.caption(f"⏱️ Primer texto en {metricas.get('ttft_s')}s · total {metricas.get('total_s')}s · traza {traza_id}")
                 
                 # Guardar respuesta en historial
-                st.session_state.messages.append({"role": "model", "content": respuesta})
+                st.session_state.messages.append({"role": "model", "content": respuesta, "traza": traza_id})
                 
             except Exception as e:
-                st.error(f"Ocurrió un error: {e}")
+                st.error(f"Ocurrió un error: {e} (traza {traza_id})")
 
 # --- BARRA LATERAL (OPCIONAL) ---
 with st.sidebar: